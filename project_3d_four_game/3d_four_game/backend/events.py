@@ -0,0 +1,55 @@
+"""
+ゲームごとの観戦イベント配信（SSE 用）。
+
+手が適用されるたびに publish し、購読者ごとのキューへ配る。
+ペイロードは JSON 文字列を1回だけ作って全員で共有する。
+"""
+import asyncio
+from typing import Dict, Optional, Set, Tuple
+
+# (イベント名, JSON 文字列)。None は「配信終了」
+Event = Optional[Tuple[str, str]]
+
+
+class GameEventHub:
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subs: Dict[str, Set["asyncio.Queue[Event]"]] = {}
+
+    def subscribe(self, game_id: str) -> "asyncio.Queue[Event]":
+        q: "asyncio.Queue[Event]" = asyncio.Queue(self.max_queue)
+        self._subs.setdefault(game_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, game_id: str, q: "asyncio.Queue[Event]") -> None:
+        subs = self._subs.get(game_id)
+        if subs is None:
+            return
+        subs.discard(q)
+        if not subs:
+            self._subs.pop(game_id, None)
+
+    def publish(self, game_id: str, name: str, data: str) -> None:
+        for q in list(self._subs.get(game_id, ())):
+            if q.full():
+                # 遅い購読者は古いイベントを捨てる（最新の盤面が届けばよい）
+                try:
+                    q.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            q.put_nowait((name, data))
+
+    def close(self, game_id: str) -> None:
+        """ゲーム削除時：全購読者に終了を通知"""
+        for q in self._subs.pop(game_id, set()):
+            if q.full():
+                try:
+                    q.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            q.put_nowait(None)
+
+    def subscriber_count(self, game_id: Optional[str] = None) -> int:
+        if game_id is not None:
+            return len(self._subs.get(game_id, ()))
+        return sum(len(s) for s in self._subs.values())
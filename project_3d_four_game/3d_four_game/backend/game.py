@@ -0,0 +1,495 @@
+"""
+ゲーム箱（Game）と、AI の結果を盤面に適用する共通ルール。
+
+API（main.py の auto-step / run）とトーナメント実行プロセスの両方から使う。
+FastAPI には依存しない。
+"""
+
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.game_logic import Bitboard
+
+
+# ---- 失敗メッセージ（3分類）を絶対にこの3文だけにする共通フォーマッタ ----
+def fmt_fail(kind: str, fe: str) -> str:
+    """
+    kind: 'timeout' | 'abnormal' | 'invalid'
+    fe  : 強制配置した座標（例: '(0, 0)'）
+    """
+    MAP = {
+        "timeout": "時間内に応答しなかったため、{fe}に強制配置",
+        "abnormal": "異常終了したため、 {fe}に強制配置",
+        "invalid": "無効座標を返したため、 {fe}に強制配置",
+    }
+    return MAP.get(kind, "{fe}").replace("{fe}", fe)
+
+
+# ========== 持ち時間（チェスクロック） ==========
+class Clock:
+    """
+    先手・後手それぞれの持ち時間（秒）。1手ごとに考えた分だけ減り、
+    使い切らずに指せたら increment を足す（フィッシャー方式）。
+    0 になった側（時間切れ）はそれ以降 AI を呼ばずに timeout として強制配置する。
+    """
+
+    __slots__ = ("initial", "increment", "remaining")
+
+    def __init__(self, initial: float, increment: float = 0.0):
+        if initial <= 0 or increment < 0:
+            raise ValueError("clock initial must be > 0 and increment >= 0")
+        self.initial = float(initial)
+        self.increment = float(increment)
+        self.remaining = [0.0, self.initial, self.initial]  # index 0 は未使用
+
+    def flagged(self, player: int) -> bool:
+        return self.remaining[player] <= 0
+
+    def charge(self, player: int, seconds: float) -> float:
+        left = self.remaining[player] - max(0.0, seconds)
+        if left <= 0:
+            self.remaining[player] = 0.0
+        else:
+            self.remaining[player] = left + self.increment
+        return self.remaining[player]
+
+    def to_dict(self) -> dict:
+        return {
+            "initial": self.initial,
+            "increment": self.increment,
+            "remaining": {
+                "1": round(self.remaining[1], 3),
+                "2": round(self.remaining[2], 3),
+            },
+        }
+
+
+def move_budget(
+    game: "Game", cp: int, time_limit: float, overhead: float
+) -> Tuple[Optional[float], Optional[float]]:
+    """
+    この手の (タイムアウト秒, ワーカーに渡す残り時間) を決める。
+    持ち時間なしなら (time_limit, None)。時間切れ済みなら (None, 0.0)。
+    持ち時間ありのとき time_limit は1手あたりの上限として効く。
+    overhead はワーカー起動・ロード・通信の分としてタイムアウトにだけ足す。
+    """
+    clock = game.clock
+    if clock is None:
+        return time_limit, None
+    if clock.flagged(cp):
+        return None, 0.0
+    left = clock.remaining[cp]
+    if time_limit:
+        left = min(left, time_limit)
+    return left + overhead, left
+
+
+# ========== ゲーム箱 ==========
+_NO_PLAYERS = (None, None, None)
+
+
+class Game:
+    """
+    1局分の状態。同時に大量（10 万局規模）に持てるよう __slots__ で固定し、
+    盤面はビットボード、棋譜は1手1バイトの bytearray で持つ。
+    board[z][y][x] のネストリストは API の境界（board / snapshot）で都度生成する。
+    """
+
+    __slots__ = (
+        "bb",
+        "current_player",
+        "game_over",
+        "move_count",
+        "players",
+        "started_at",
+        "recorded",
+        "tenant",
+        "clock",
+        "sessions",
+        "_pinned",
+        "_lock",
+        "_snapshot",
+        "_board_json",
+        "_moves",
+        "_notes",
+    )
+
+    def __init__(
+        self,
+        board_size: int = 4,
+        clock: Optional[Clock] = None,
+        session: bool = False,
+    ):
+        self.bb = Bitboard()  # 3D初期化（ビットボード）
+        self.current_player = 1
+        self.game_over = False
+        self.move_count = 0
+        # 対局記録（結果ストア用）。players は (未使用, 先手, 後手)
+        self.players = _NO_PLAYERS
+        self.started_at = time.time()
+        self.recorded = False
+        # 作成したリクエストのテナント（記録先。他のテナントからは見えない）
+        self.tenant: Optional[str] = None
+        self.clock = clock  # None なら1手ごとの timeLimit だけ
+        # セッションモード：手番 → worker_pool.Session（None ならモード無効）
+        self.sessions: Optional[Dict[int, object]] = {} if session else None
+        # 手番 → (指定された提出, この対局で読む実体)。最初に指したときに固定する
+        self._pinned: Optional[Dict[int, Tuple[str, str]]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        # 読み取り用キャッシュ（石を置いたときだけ捨てる）
+        self._snapshot: Optional[tuple] = None
+        self._board_json: Optional[str] = None
+        # 棋譜：1手 = x | y<<2 | z<<4 | (player-1)<<6
+        self._moves = bytearray()
+        # 手番インデックス → (reason_kind, think_ms, usage)。AI 手番のときだけ作る
+        self._notes: Optional[Dict[int, tuple]] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """同じゲームへの AI 手番を直列化（await 中に二重に進めない）。初回に作る"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def busy(self) -> bool:
+        """AI 手番の処理中か（ロックを作らずに見る）"""
+        return self._lock is not None and self._lock.locked()
+
+    def session_for(self, player: int, algo_path: str, pool):
+        """
+        セッションモードなら手番側の Session を返す（無ければ pool から開く）。
+        途中で提出が差し替わったら開き直す。モード無効なら None。
+        """
+        if self.sessions is None:
+            return None
+        s = self.sessions.get(player)
+        if s is None or s.algo_path != algo_path:
+            if s is not None:
+                s.close()
+            s = self.sessions[player] = pool.session(algo_path)
+        return s
+
+    def close_sessions(self) -> None:
+        """終局・削除・追い出し時に専用ワーカーを破棄する"""
+        if self.sessions:
+            for s in self.sessions.values():
+                s.close()
+            self.sessions.clear()
+
+    def pin_algo(self, player: int, algo_path: str, resolve) -> str:
+        """
+        手番側が読む提出を、この対局で最初に指したときの版に固定して返す。
+        resolve(algo_path) はその時点の実体（検証済みスナップショットなど）。
+        対局中に再クローンで新しい版ができても切り替えない。別の提出に替わったら引き直す。
+        """
+        pinned = self._pinned.get(player) if self._pinned else None
+        if pinned is None or pinned[0] != algo_path:
+            if self._pinned is None:
+                self._pinned = {}
+            pinned = self._pinned[player] = (algo_path, resolve(algo_path))
+        return pinned[1]
+
+    def pinned(self, player: int) -> Optional[str]:
+        """pin_algo で固定済みの実体（まだなら None）"""
+        pinned = self._pinned.get(player) if self._pinned else None
+        return pinned[1] if pinned else None
+
+    def set_player(self, player: int, name: Optional[str]) -> None:
+        p = list(self.players)
+        p[player] = name
+        self.players = tuple(p)
+
+    @property
+    def board(self) -> List[List[List[int]]]:
+        """API/ワーカー向けの board[z][y][x] 形式（毎回生成・可変）"""
+        return self.bb.to_list()
+
+    @property
+    def snapshot(self):
+        """board の不変スナップショット（tuple-of-tuples、石を置くまで同じものを返す）"""
+        if self._snapshot is None:
+            self._snapshot = self.bb.to_tuple()
+        return self._snapshot
+
+    @property
+    def board_json(self) -> str:
+        """board を JSON 化した文字列（レスポンスにそのまま埋め込む）"""
+        if self._board_json is None:
+            self._board_json = json.dumps(self.snapshot, separators=(",", ":"))
+        return self._board_json
+
+    def place(self, x: int, y: int, player: int) -> Optional[int]:
+        """石を置いてキャッシュを捨てる。置いた高さ z、満杯なら None"""
+        z = self.bb.drop(x, y, player)
+        if z is not None:
+            self._snapshot = None
+            self._board_json = None
+            self._moves.append(x | (y << 2) | (z << 4) | ((player - 1) << 6))
+        return z
+
+    def annotate_last(
+        self,
+        reason_kind: Optional[str],
+        think_ms: Optional[int],
+        usage: Optional[dict] = None,
+    ) -> None:
+        """直前の手に失敗理由・思考時間・ワーカーの実測値を付ける（AI 手番用）"""
+        if self._notes is None:
+            self._notes = {}
+        self._notes[len(self._moves) - 1] = (reason_kind, think_ms, usage)
+
+    @property
+    def history(self) -> List[dict]:
+        """棋譜を [{"player","x","y","z", (AI 手番なら "reason_kind","reason","think_ms","usage")}] に展開"""
+        notes = self._notes or {}
+        out = []
+        for i, m in enumerate(self._moves):
+            x, y, z = m & 3, (m >> 2) & 3, (m >> 4) & 3
+            rec = {"player": (m >> 6) + 1, "x": x, "y": y, "z": z}
+            if i in notes:
+                kind, think_ms, usage = notes[i]
+                rec["reason_kind"] = kind
+                rec["reason"] = fmt_fail(kind, f"({x}, {y})") if kind else None
+                rec["think_ms"] = think_ms
+                if usage:
+                    rec["usage"] = usage
+            out.append(rec)
+        return out
+
+    def move_context(self, time_left: Optional[float]) -> dict:
+        """
+        ワーカーに渡す手番情報（提出側では framework.MoveContext になる）。
+        time_left はこの手に使える秒数、clock_left は持ち時間制での残り。
+        持ち時間なしの time_left は、ワーカー側で CPU 上限（WORKER_CPU_TIME）以下に揃える。
+        """
+        cp = self.current_player
+        history = [[m & 3, (m >> 2) & 3, (m >> 4) & 3] for m in self._moves]
+        return {
+            "player": cp,
+            "move_number": self.move_count + 1,
+            "last_move": history[-1] if history else None,
+            "history": history,
+            "time_left": time_left,
+            "clock_left": self.clock.remaining[cp] if self.clock else None,
+        }
+
+    def state_dict(self):
+        """
+        盤面以外の状態。board は API 側で board_json（キャッシュ済み）を差し込むので
+        ここでは作らない。
+        """
+        state = {
+            "current_player": self.current_player,
+            "game_over": self.game_over,
+            "move_count": self.move_count,
+        }
+        if self.clock is not None:
+            state["clock"] = self.clock.to_dict()
+        return state
+
+    def charge_clock(
+        self,
+        cp: int,
+        reason_kind: Optional[str],
+        time_left: Optional[float],
+        usage: Optional[dict],
+        elapsed: float,
+    ) -> None:
+        """
+        持ち時間から今の手の分を引く。タイムアウトなら渡した時間（time_left）を全部、
+        ワーカーが応答していればサーバー側で測った思考時間（think_ms：起動・ロードを
+        含まない）、どちらでもなければ経過時間を引く。
+        """
+        if self.clock is None:
+            return
+        think = (usage or {}).get("think_ms")
+        if reason_kind == "timeout" and time_left is not None:
+            seconds = time_left
+        elif think is not None:
+            seconds = think / 1000
+        else:
+            seconds = elapsed
+        self.clock.charge(cp, seconds)
+
+    def make_move(self, x: int, y: int):
+        if self.game_over:
+            return {"status": "finished", **self.state_dict()}
+
+        z = self.place(x, y, self.current_player) if 0 <= x < 4 and 0 <= y < 4 else None
+        if z is None:
+            return {"status": "invalid", **self.state_dict()}
+
+        self.move_count += 1
+        # 置いたセルを通るラインだけを見る
+        coords = self.bb.winning_line_at(x, y, z, self.current_player)
+
+        if coords is not None:
+            self.game_over = True
+            winplayer: int = self.current_player
+            self.current_player = 3 - self.current_player
+            out = {
+                "status": "win",
+                "winner": winplayer,
+                "player": f"Player {winplayer}",
+                "winning_coords": coords,
+                **self.state_dict(),
+                "last_move": {"x": x, "y": y},
+            }
+            return out
+
+        if self.bb.is_full():
+            state = self.state_dict()
+            state.update(
+                {
+                    "status": "draw",
+                    "last_move": {"x": x, "y": y},
+                }
+            )
+            return state
+
+        # 継続
+        self.current_player = 3 - self.current_player
+        return {"status": "ok", **self.state_dict(), "last_move": {"x": x, "y": y}}
+
+
+def apply_step(
+    game: Game,
+    cp: int,
+    x,
+    y,
+    reason_kind: Optional[str],
+    think_ms: Optional[int] = None,
+    usage: Optional[dict] = None,
+    on_failure: Optional[Callable[[str], None]] = None,
+) -> dict:
+    """
+    AI 手番の結果を盤面に適用し、auto-step のレスポンス用 state dict を返す。
+    reason_kind: None（成功）| 'timeout' | 'abnormal' | 'invalid'
+    失敗時・列が満杯のときは左上(y→x)の空きセルに強制配置する。
+    think_ms は対局記録（game.history）に残す思考時間。
+    usage はワーカーの実測値（wall_ms / cpu_ms / max_rss_kb / load_ms …）で、
+    対局記録とレスポンスの "usage" に載せる。
+    on_failure(kind) は強制配置の理由が決まったときに1回だけ呼ぶ（失敗の集計用。
+    AI 未指定・持ち時間切れ・満杯の列もここで数える）。
+    """
+    # --- 座標のバリデーション（厳格）：範囲外は invalid へ寄せる ---
+    if reason_kind is None:
+        try:
+            if not (0 <= int(x) < 4 and 0 <= int(y) < 4):
+                raise ValueError()
+            x, y = int(x), int(y)
+        except Exception:
+            reason_kind = "invalid"
+
+    # --- フォールバック座標の決定 ---
+    if reason_kind is not None:
+        fe = game.bb.first_empty_xy()
+        if fe is None:
+            # 置ける場所がない → 引き分け。その上で (0,0) を last_move に載せる
+            if on_failure:
+                on_failure(reason_kind)
+            game.game_over = True
+            game.move_count += 1
+            state = game.state_dict()
+            state.update(
+                {
+                    "status": "draw",
+                    "last_move": {"x": 0, "y": 0},
+                    "reason": fmt_fail(reason_kind, "(0, 0)"),
+                }
+            )
+            return state
+        x, y = fe  # 左上(y→x)の空きセル
+    # reason は最後にまとめて作る
+    reason = fmt_fail(reason_kind, f"({x}, {y})") if reason_kind else None
+
+    # --- 実際に配置。指定列が満杯なら invalid として強制配置 ---
+    z = game.place(x, y, cp)
+    if z is None:
+        placed = False
+        for yy in range(4):
+            for xx in range(4):
+                z = game.place(xx, yy, cp)
+                if z is not None:
+                    x, y = xx, yy
+                    placed = True
+                    break
+            if placed:
+                break
+        if not placed:
+            # 本当に置けない → 引き分け（(0,0)で固定メッセージ）
+            if on_failure:
+                on_failure(reason_kind or "invalid")
+            game.game_over = True
+            game.move_count += 1
+            state = game.state_dict()
+            state.update(
+                {
+                    "status": "draw",
+                    "last_move": {"x": 0, "y": 0},
+                    "reason": fmt_fail(reason_kind or "invalid", "(0, 0)"),
+                }
+            )
+            return state
+        # 列が満杯だったので invalid に寄せる（成功済みでもメッセージは invalid）
+        reason_kind = "invalid"
+        reason = fmt_fail("invalid", f"({x}, {y})")
+
+    # 対局記録に理由と思考時間を残す
+    game.annotate_last(reason_kind, think_ms, usage)
+    if reason_kind and on_failure:
+        on_failure(reason_kind)
+
+    # --- 勝敗/継続の判定 ---
+    game.move_count += 1
+    coords = game.bb.winning_line_at(x, y, z, cp)
+
+    if coords is not None:
+        game.current_player = 3 - cp
+        state = game.state_dict()
+        state.update(
+            {
+                "status": "win",
+                "winner": cp,
+                "player": f"Player {cp}",
+                "winning_coords": coords,
+                "last_move": {"x": x, "y": y},
+            }
+        )
+        if reason:
+            state["reason"] = reason
+        if usage:
+            state["usage"] = usage
+        return state
+
+    if game.bb.is_full():
+        state = game.state_dict()
+        state.update(
+            {
+                "status": "draw",
+                "last_move": {"x": x, "y": y},
+            }
+        )
+        if reason:
+            state["reason"] = reason
+        if usage:
+            state["usage"] = usage
+        return state
+
+    # 次手へ
+    game.current_player = 3 - cp
+    state = game.state_dict()
+    state.update(
+        {
+            "status": "ok",
+            "last_move": {"x": x, "y": y},
+        }
+    )
+    if reason:
+        state["reason"] = reason
+    if usage:
+        state["usage"] = usage
+    return state
@@ -56,6 +56,20 @@ def generate_lines() -> List[List[Tuple[int, int, int]]]:
 LINES = generate_lines()
 
 
+def _build_cell_lines() -> Dict[Tuple[int, int, int], List[int]]:
+    """セル (x, y, z) → そのセルを通る LINES のインデックス一覧"""
+    index: Dict[Tuple[int, int, int], List[int]] = {
+        (x, y, z): [] for z in range(4) for y in range(4) for x in range(4)
+    }
+    for i, line in enumerate(LINES):
+        for cell in line:
+            index[cell].append(i)
+    return index
+
+
+CELL_LINES = _build_cell_lines()
+
+
 def check_win_with_positions(board, player):
     """
     LINES方式で勝ち判定。
@@ -64,7 +78,18 @@ def check_win_with_positions(board, player):
     """
     for line in LINES:
         if all(board[z][y][x] == player for (x, y, z) in line):
-            print(f"[DEBUG] Player {player} wins! coords={line}")
+            return line
+    return None
+
+
+def check_win_at(board, x, y, z, player):
+    """
+    (x, y, z) に置いた直後の勝ち判定。そのセルを通るラインだけを調べる。
+    勝っていればその4つの座標リスト、そうでなければ None。
+    """
+    for i in CELL_LINES[(x, y, z)]:
+        line = LINES[i]
+        if all(board[cz][cy][cx] == player for (cx, cy, cz) in line):
             return line
     return None
 
@@ -79,6 +104,135 @@ def is_full(board):
     return all(cell != 0 for layer in board for row in layer for cell in row)
 
 
+# ========== ビットボード ==========
+# セル (x, y, z) をビット番号 z*16 + y*4 + x に対応させる（board[z][y][x] の平坦化順）
+FULL_MASK = (1 << 64) - 1
+
+
+def bit_index(x: int, y: int, z: int) -> int:
+    return (z << 4) | (y << 2) | x
+
+
+def _line_mask(line: List[Tuple[int, int, int]]) -> int:
+    m = 0
+    for x, y, z in line:
+        m |= 1 << bit_index(x, y, z)
+    return m
+
+
+# LINES と同じ順序で 76 本のラインをマスク化
+LINE_MASKS: List[int] = [_line_mask(line) for line in LINES]
+
+
+def _build_cell_line_masks() -> List[List[Tuple[int, int]]]:
+    """ビット番号 → そのセルを通るラインの (マスク, LINES インデックス)"""
+    table: List[List[Tuple[int, int]]] = [[] for _ in range(64)]
+    for (x, y, z), lines in CELL_LINES.items():
+        table[bit_index(x, y, z)] = [(LINE_MASKS[i], i) for i in lines]
+    return table
+
+
+CELL_LINE_MASKS = _build_cell_line_masks()
+
+
+class Bitboard:
+    """
+    4x4x4 盤面のビットボード表現。
+    bits[1] / bits[2] が各プレイヤーの石（64bit 整数）、
+    heights[y*4+x] が各列に積まれている石の数。
+    """
+
+    __slots__ = ("bits", "heights")
+
+    def __init__(self):
+        self.bits = [0, 0, 0]  # index 0 は未使用（player 1/2 でそのまま引く）
+        self.heights = bytearray(16)
+
+    # ---- 変換 ----
+    @classmethod
+    def from_list(cls, board) -> "Bitboard":
+        """board[z][y][x] 形式（0=空, 1=黒, 2=白）から変換"""
+        bb = cls()
+        for z in range(4):
+            for y in range(4):
+                for x in range(4):
+                    v = board[z][y][x]
+                    if v in (1, 2):
+                        bb.bits[v] |= 1 << bit_index(x, y, z)
+                        bb.heights[(y << 2) | x] = z + 1
+        return bb
+
+    def to_list(self) -> List[List[List[int]]]:
+        """board[z][y][x] 形式のネストリストに戻す（API 返却用）"""
+        b1, b2 = self.bits[1], self.bits[2]
+        board = []
+        for z in range(4):
+            layer = []
+            for y in range(4):
+                row = []
+                for x in range(4):
+                    bit = 1 << bit_index(x, y, z)
+                    row.append(1 if b1 & bit else 2 if b2 & bit else 0)
+                layer.append(row)
+            board.append(layer)
+        return board
+
+    def to_tuple(self) -> Tuple[Tuple[Tuple[int, ...], ...], ...]:
+        """to_list と同じ形の不変スナップショット（tuple-of-tuples）"""
+        return tuple(tuple(tuple(row) for row in layer) for layer in self.to_list())
+
+    # ---- 操作 ----
+    def cell(self, x: int, y: int, z: int) -> int:
+        bit = 1 << bit_index(x, y, z)
+        if self.bits[1] & bit:
+            return 1
+        if self.bits[2] & bit:
+            return 2
+        return 0
+
+    def can_drop(self, x: int, y: int) -> bool:
+        return self.heights[(y << 2) | x] < 4
+
+    def drop(self, x: int, y: int, player: int) -> Optional[int]:
+        """(x, y) 列に石を落とす。置いた高さ z を返し、満杯なら None"""
+        col = (y << 2) | x
+        z = self.heights[col]
+        if z >= 4:
+            return None
+        self.bits[player] |= 1 << ((z << 4) | col)
+        self.heights[col] = z + 1
+        return z
+
+    def is_full(self) -> bool:
+        return (self.bits[1] | self.bits[2]) == FULL_MASK
+
+    def first_empty_xy(self) -> Optional[Tuple[int, int]]:
+        """左上（y→x）から最初に置ける (x, y)"""
+        for col, h in enumerate(self.heights):
+            if h < 4:
+                return (col & 3, col >> 2)
+        return None
+
+    # ---- 勝ち判定 ----
+    def winning_line(self, player: int) -> Optional[List[Tuple[int, int, int]]]:
+        """76 本のマスクと照合し、揃っていればその座標リストを返す"""
+        b = self.bits[player]
+        for i, m in enumerate(LINE_MASKS):
+            if b & m == m:
+                return LINES[i]
+        return None
+
+    def winning_line_at(
+        self, x: int, y: int, z: int, player: int
+    ) -> Optional[List[Tuple[int, int, int]]]:
+        """(x, y, z) を通るライン（4〜7本）だけを照合する差分版"""
+        b = self.bits[player]
+        for m, i in CELL_LINE_MASKS[bit_index(x, y, z)]:
+            if b & m == m:
+                return LINES[i]
+        return None
+
+
 # ゲーム状態（例として初期化しておく）
 game_state = {
     "board": create_board(),
@@ -0,0 +1,251 @@
+"""
+対局結果ストア（SQLite / WAL、追記のみ）。
+
+終局した対局を1行ずつ記録し、プレイヤー・時刻で引けるようにする。
+API プロセスのメモリに終局済みの対局を溜めなくてよくなる。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id            TEXT PRIMARY KEY,
+    game_id       TEXT,
+    tournament_id TEXT,
+    source        TEXT NOT NULL,
+    player1       TEXT,
+    player2       TEXT,
+    status        TEXT NOT NULL,
+    winner        INTEGER,
+    move_count    INTEGER NOT NULL,
+    moves         TEXT NOT NULL,
+    reasons       TEXT NOT NULL,
+    usage         TEXT,
+    duration_ms   INTEGER,
+    started_at    TEXT,
+    finished_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_matches_p1 ON matches(player1, finished_at);
+CREATE INDEX IF NOT EXISTS idx_matches_p2 ON matches(player2, finished_at);
+CREATE INDEX IF NOT EXISTS idx_matches_finished ON matches(finished_at);
+CREATE INDEX IF NOT EXISTS idx_matches_tournament ON matches(tournament_id);
+"""
+
+# 一覧で返す列（moves は詳細でのみ返す）
+_SUMMARY_COLS = (
+    "id, game_id, tournament_id, source, player1, player2, status, winner, "
+    "move_count, reasons, usage, duration_ms, started_at, finished_at"
+)
+
+
+def _iso(ts: Optional[float]) -> str:
+    dt = datetime.fromtimestamp(ts, timezone.utc) if ts else datetime.now(timezone.utc)
+    return dt.isoformat()
+
+
+def _reason_counts(moves: List[dict]) -> dict:
+    """{'1': {'timeout': n, ...}, '2': {...}} — 失敗3分類の手番別回数"""
+    out: dict = {}
+    for m in moves:
+        kind = m.get("reason_kind")
+        if kind:
+            per = out.setdefault(str(m.get("player")), {})
+            per[kind] = per.get(kind, 0) + 1
+    return out
+
+
+def _usage_totals(moves: List[dict]) -> dict:
+    """
+    {'1': {'moves', 'wall_ms', 'cpu_ms', 'load_ms', 'max_rss_kb'}, '2': {...}}
+    — ワーカー実測値の手番別合計（peak RSS は最大値）
+    """
+    out: dict = {}
+    for m in moves:
+        u = m.get("usage")
+        if not u:
+            continue
+        per = out.setdefault(
+            str(m.get("player")),
+            {
+                "moves": 0,
+                "wall_ms": 0.0,
+                "cpu_ms": 0.0,
+                "load_ms": 0.0,
+                "max_rss_kb": 0,
+            },
+        )
+        per["moves"] += 1
+        for k in ("wall_ms", "cpu_ms", "load_ms"):
+            per[k] = round(per[k] + (u.get(k) or 0), 3)
+        per["max_rss_kb"] = max(per["max_rss_kb"], u.get("max_rss_kb") or 0)
+    return out
+
+
+class MatchStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    # ---- 接続（スレッドごと） ----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._ready:
+                    conn.executescript(_SCHEMA)
+                    self._migrate(conn)
+                    self._ready = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """後から足した列を既存の DB にも追加する"""
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(matches)")}
+        if "usage" not in cols:
+            conn.execute("ALTER TABLE matches ADD COLUMN usage TEXT")
+            conn.commit()
+
+    # ---- 書き込み ----
+    def record(
+        self,
+        *,
+        source: str,
+        player1: Optional[str],
+        player2: Optional[str],
+        status: str,
+        winner: Optional[int],
+        moves: List[dict],
+        started_at: Optional[float] = None,
+        duration_ms: Optional[int] = None,
+        game_id: Optional[str] = None,
+        tournament_id: Optional[str] = None,
+    ) -> str:
+        mid = uuid.uuid4().hex
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO matches (id, game_id, tournament_id, source, player1, "
+                "player2, status, winner, move_count, moves, reasons, usage, "
+                "duration_ms, started_at, finished_at) "
+                "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                (
+                    mid,
+                    game_id,
+                    tournament_id,
+                    source,
+                    player1,
+                    player2,
+                    status,
+                    winner,
+                    len(moves),
+                    json.dumps(moves, ensure_ascii=False),
+                    json.dumps(_reason_counts(moves), ensure_ascii=False),
+                    json.dumps(_usage_totals(moves)),
+                    duration_ms,
+                    _iso(started_at) if started_at else None,
+                    _iso(None),
+                ),
+            )
+        return mid
+
+    # ---- 読み込み ----
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        d = dict(row)
+        for k in ("moves", "reasons", "usage"):
+            if k in d and d[k] is not None:
+                d[k] = json.loads(d[k])
+        return d
+
+    def _where(
+        self,
+        player: Optional[str],
+        tournament_id: Optional[str],
+        since: Optional[str],
+        until: Optional[str],
+    ) -> Tuple[str, list]:
+        conds, args = [], []
+        if player:
+            conds.append("(player1 = ? OR player2 = ?)")
+            args += [player, player]
+        if tournament_id:
+            conds.append("tournament_id = ?")
+            args.append(tournament_id)
+        if since:
+            conds.append("finished_at >= ?")
+            args.append(since)
+        if until:
+            conds.append("finished_at < ?")
+            args.append(until)
+        return (" WHERE " + " AND ".join(conds)) if conds else "", args
+
+    def query(
+        self,
+        player: Optional[str] = None,
+        tournament_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Tuple[int, List[dict]]:
+        """新しい順。(総件数, 1ページ分) を返す"""
+        where, args = self._where(player, tournament_id, since, until)
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM matches{where}", args).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {_SUMMARY_COLS} FROM matches{where} "
+            "ORDER BY finished_at DESC LIMIT ? OFFSET ?",
+            args + [int(limit), int(offset)],
+        ).fetchall()
+        return total, [self._row(r) for r in rows]
+
+    def get(self, match_id: str) -> Optional[dict]:
+        row = (
+            self._conn()
+            .execute("SELECT * FROM matches WHERE id = ?", (match_id,))
+            .fetchone()
+        )
+        return self._row(row) if row else None
+
+    def standings(
+        self,
+        tournament_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[dict]:
+        """勝ち1・引き分け0.5で集計（対局を再生せずに SQL だけで出す）"""
+        where, args = self._where(None, tournament_id, since, until)
+        sql = f"""
+            SELECT player, SUM(pts) AS points, SUM(w) AS wins, SUM(d) AS draws,
+                   SUM(l) AS losses, COUNT(*) AS played
+            FROM (
+                SELECT player1 AS player,
+                       CASE WHEN status='draw' THEN 0.5 WHEN winner=1 THEN 1.0 ELSE 0 END AS pts,
+                       winner IS 1 AS w, status='draw' AS d, winner IS 2 AS l
+                FROM matches{where}
+                UNION ALL
+                SELECT player2 AS player,
+                       CASE WHEN status='draw' THEN 0.5 WHEN winner=2 THEN 1.0 ELSE 0 END AS pts,
+                       winner IS 2 AS w, status='draw' AS d, winner IS 1 AS l
+                FROM matches{where}
+            )
+            WHERE player IS NOT NULL
+            GROUP BY player
+            ORDER BY points DESC, wins DESC, player
+        """
+        rows = self._conn().execute(sql, args + args).fetchall()
+        return [dict(r) for r in rows]
@@ -0,0 +1,250 @@
+"""
+Prometheus テキスト形式（0.0.4）のメトリクス。
+
+依存を増やさないよう、Counter / Histogram / Gauge の必要最小限だけを自前で持つ。
+/metrics はここの render() をそのまま返す。
+"""
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    値は描画時に callback から取る（レジストリ件数など）。
+    他所で数えている累積値を出すときは kind="counter" にする。
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, k)} {_num(v)}"
+            for k, v in self.callback()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float],
+        labelnames: Sequence[str] = (),
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # ラベル値 → ([各バケットの件数], 合計, 件数)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            ent = self._values.get(key)
+            if ent is None:
+                ent = self._values[key] = ([0] * len(self.buckets), [0.0, 0])
+            counts, tot = ent
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+                    break
+            tot[0] += value
+            tot[1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(
+                (k, (list(c), list(t))) for k, (c, t) in self._values.items()
+            )
+        out = []
+        for key, (counts, (total, n)) in items:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                le = _labels(self.labelnames, key, f'le="{_num(b)}"')
+                out.append(f"{self.name}_bucket{le} {acc}")
+            lbl = _labels(self.labelnames, key)
+            out.append(f"{self.name}_sum{lbl} {_num(total)}")
+            out.append(f"{self.name}_count{lbl} {n}")
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.header()
+            lines += m.samples()
+        return "\n".join(lines) + "\n"
+
+
+# ========== 1手の実行時間 ==========
+_FAST = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_SLOW = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    20.0,
+    30.0,
+    60.0,
+)
+
+
+class MoveMetrics:
+    """
+    WorkerPool から1手ごとに呼ばれる。algo ラベルは提出のライブの入口
+    （スナップショットのパスではないので、版が替わっても系列は増えない）。
+      spawn : ワーカープロセスの起動（zygote からの fork / exec）
+      load  : 起動からモジュール読み込み完了（ready フレーム）まで
+      think : 盤面を送ってから手が返るまで
+      total : get_move 全体（借り出し・起動・ロードを含む）
+    失敗は kind（timeout / abnormal / invalid）ごとに、強制配置を決めたところ
+    （apply_step の on_failure）で fail() を呼んで数える。
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        reg = registry or MetricsRegistry()
+        self.registry = reg
+        labels = ("algo",)
+        self.spawn = reg.register(
+            Histogram(
+                "ai_worker_spawn_seconds", "Worker process spawn time.", _FAST, labels
+            )
+        )
+        self.load = reg.register(
+            Histogram(
+                "ai_module_load_seconds", "Submission module load time.", _SLOW, labels
+            )
+        )
+        self.think = reg.register(
+            Histogram("ai_think_seconds", "get_move compute time.", _SLOW, labels)
+        )
+        self.total = reg.register(
+            Histogram(
+                "ai_move_seconds", "Total wall time of one AI move.", _SLOW, labels
+            )
+        )
+        self.moves = reg.register(
+            Counter("ai_moves_total", "AI moves requested.", labels)
+        )
+        self.failures = reg.register(
+            Counter(
+                "ai_move_failures_total",
+                "AI moves that fell back, by kind.",
+                ("algo", "kind"),
+            )
+        )
+
+    def fail(self, algo: str, kind: str) -> None:
+        self.failures.inc(algo=algo, kind=kind)
+
+    def replay(
+        self, algo: str, usage: Optional[dict], kind: Optional[str] = None
+    ) -> None:
+        """
+        別プロセス（トーナメント）で指した1手を、棋譜に残った usage と失敗の種類から数える。
+        usage が無い手（AI 未指定・持ち時間切れ）はワーカーを呼んでいないので失敗だけ数える。
+        """
+        if kind:
+            self.fail(algo, kind)
+        if not usage:
+            return
+        self.moves.inc(algo=algo)
+        if usage.get("total_ms") is not None:
+            self.total.observe(usage["total_ms"] / 1000, algo=algo)
+        if usage.get("spawn_ms") is not None:
+            self.spawn.observe(usage["spawn_ms"] / 1000, algo=algo)
+            if usage.get("load_ms") is not None:
+                self.load.observe(usage["load_ms"] / 1000, algo=algo)
+        if not kind and usage.get("think_ms") is not None:
+            self.think.observe(usage["think_ms"] / 1000, algo=algo)
@@ -0,0 +1,153 @@
+"""
+ゲームレジストリ（最終アクセス順・アイドル TTL・最大件数 LRU）。
+
+POST /games で作られたゲームは明示的な DELETE がないと残り続けるので、
+一定時間触られていないもの・上限を超えた古いものを追い出す。
+追い出されたゲーム ID は存在しない扱い（各エンドポイントは 404）。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from backend.game import Game
+
+# callable(game_id, game, reason) — reason は "ttl" | "lru"
+EvictHook = Callable[[str, Game, str], None]
+
+
+class GameRegistry:
+    def __init__(
+        self,
+        max_games: int = 10000,
+        idle_ttl: float = 3600.0,
+        on_evict: Optional[EvictHook] = None,
+    ):
+        self.max_games = max(1, int(max_games))
+        self.idle_ttl = float(idle_ttl)  # 0 以下なら TTL なし
+        self.on_evict = on_evict
+        # game_id → (game, 最終アクセス monotonic)。先頭ほど古い
+        self._games: "OrderedDict[str, Tuple[Game, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.deleted = 0
+        self.evictions: Dict[str, int] = {"ttl": 0, "lru": 0}
+
+    # ---- dict 互換 ----
+    def get(self, game_id: str) -> Optional[Game]:
+        """取得と同時に最終アクセスを更新。TTL 切れならその場で追い出して None"""
+        now = time.monotonic()
+        with self._lock:
+            ent = self._games.get(game_id)
+            if ent is None:
+                return None
+            game, last = ent
+            if self._expired(game, last, now):
+                del self._games[game_id]
+                evicted = [(game_id, game, "ttl")]
+                game = None
+            else:
+                self._games[game_id] = (game, now)
+                self._games.move_to_end(game_id)
+                evicted = []
+        self._notify(evicted)
+        return game
+
+    def __setitem__(self, game_id: str, game: Game) -> None:
+        with self._lock:
+            if game_id not in self._games:
+                self.created += 1
+            self._games[game_id] = (game, time.monotonic())
+            self._games.move_to_end(game_id)
+            evicted = self._evict_over_capacity(keep=game_id)
+        self._notify(evicted)
+
+    def __delitem__(self, game_id: str) -> None:
+        with self._lock:
+            del self._games[game_id]
+            self.deleted += 1
+
+    def pop(self, game_id: str) -> Optional[Game]:
+        with self._lock:
+            ent = self._games.pop(game_id, None)
+            if ent is not None:
+                self.deleted += 1
+        return ent[0] if ent else None
+
+    def __contains__(self, game_id: str) -> bool:
+        return self.get(game_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def items(self) -> Iterator[Tuple[str, Game]]:
+        with self._lock:
+            snapshot = [(gid, ent[0]) for gid, ent in self._games.items()]
+        return iter(snapshot)
+
+    def touch(self, game_id: str) -> None:
+        """観戦配信など、get を通らないアクセスも生存扱いにする"""
+        with self._lock:
+            ent = self._games.get(game_id)
+            if ent is not None:
+                self._games[game_id] = (ent[0], time.monotonic())
+                self._games.move_to_end(game_id)
+
+    # ---- 追い出し ----
+    def _expired(self, game: Game, last: float, now: float) -> bool:
+        # 手を進めている最中（auto-step / run がロック保持中）は追い出さない
+        return self.idle_ttl > 0 and now - last > self.idle_ttl and not game.busy
+
+    def _evict_over_capacity(self, keep: Optional[str] = None) -> list:
+        """
+        上限超過分を古い順に。ロック中のゲームと keep（今入れたもの）は飛ばす
+        （残りが全部手の途中なら一時的に上限を超える）。_lock 保持下で呼ぶ。
+        """
+        evicted = []
+        if len(self._games) <= self.max_games:
+            return evicted
+        for gid in list(self._games):
+            if len(self._games) <= self.max_games:
+                break
+            game = self._games[gid][0]
+            if game.busy or gid == keep:
+                continue
+            del self._games[gid]
+            evicted.append((gid, game, "lru"))
+        return evicted
+
+    def sweep(self) -> int:
+        """TTL 切れを一括で追い出す。追い出した件数を返す"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for gid, (game, last) in list(self._games.items()):
+                # 先頭ほど古いので、TTL 内に入ったら以降は見なくてよい
+                if self.idle_ttl <= 0 or now - last <= self.idle_ttl:
+                    break
+                if self._expired(game, last, now):
+                    del self._games[gid]
+                    evicted.append((gid, game, "ttl"))
+        self._notify(evicted)
+        return len(evicted)
+
+    def _notify(self, evicted: list) -> None:
+        for gid, game, reason in evicted:
+            self.evictions[reason] += 1
+            if self.on_evict:
+                try:
+                    self.on_evict(gid, game, reason)
+                except Exception:
+                    pass
+
+    # ---- 統計 ----
+    def stats(self) -> dict:
+        return {
+            "games": len(self._games),
+            "max_games": self.max_games,
+            "idle_ttl": self.idle_ttl,
+            "created": self.created,
+            "deleted": self.deleted,
+            "evictions": dict(self.evictions),
+        }
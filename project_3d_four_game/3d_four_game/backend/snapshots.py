@@ -0,0 +1,110 @@
+"""
+提出の不変スナップショット（内容アドレス）。
+
+クローン先のフォルダは /clone の更新で書き換わるので、対局ではそこを直接読まず、
+検証済みの版を <root>/<キー>/ に凍結したコピーから読む。
+キーは git のコミットハッシュ（作業ツリーが汚れていれば内容の sha256）。
+同じキーのディレクトリは一度作ったら変えないので、ワーカー（パス＋更新時刻がキー）や
+バイトコードのキャッシュがそのまま効き、トーナメントは開始時の版で再現できる。
+"""
+
+import hashlib
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+from typing import Optional, Tuple
+
+# コピーしないもの（履歴・生成物）
+_IGNORE = shutil.ignore_patterns(".git", "__pycache__", "*.pyc")
+
+
+def _git_head(src: str) -> Optional[str]:
+    """作業ツリーがコミットと一致していればそのハッシュ。git でない・汚れていれば None"""
+    if not os.path.isdir(os.path.join(src, ".git")):
+        return None
+    try:
+        head = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=src,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=all"],
+            cwd=src,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return None if dirty else head
+
+
+def content_hash(src: str) -> str:
+    """相対パスと中身から決まる sha256（.git と生成物は除く）"""
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames[:] = sorted(d for d in dirnames if d not in (".git", "__pycache__"))
+        for name in sorted(filenames):
+            if name.endswith(".pyc"):
+                continue
+            p = os.path.join(dirpath, name)
+            h.update(os.path.relpath(p, src).replace(os.sep, "/").encode("utf-8"))
+            h.update(b"\0")
+            with open(p, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    h.update(chunk)
+            h.update(b"\0")
+    return "sha256-" + h.hexdigest()
+
+
+def _make_read_only(root: str) -> None:
+    # ファイルだけ読み取り専用に（ディレクトリまで塞ぐと rename・後片付けができない）
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            os.chmod(
+                os.path.join(dirpath, name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+            )
+
+
+class SnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: Optional[str]) -> bool:
+        return bool(key) and os.path.isdir(self.path(key))
+
+    def key_for(self, src: str) -> str:
+        return _git_head(src) or content_hash(src)
+
+    def freeze(self, src: str) -> Tuple[str, str]:
+        """
+        src（提出フォルダ）を凍結して (キー, スナップショットのディレクトリ) を返す。
+        同じキーが既にあればコピーしない。作成は一時ディレクトリ→rename で原子的に。
+        """
+        key = self.key_for(src)
+        dest = self.path(key)
+        if os.path.isdir(dest):
+            return key, dest
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            body = os.path.join(tmp, "s")
+            shutil.copytree(src, body, ignore=_IGNORE)
+            _make_read_only(body)
+            try:
+                os.rename(body, dest)
+            except OSError:
+                # 同じキーを別スレッドが先に作った（中身は同じ）
+                if not os.path.isdir(dest):
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return key, dest
@@ -0,0 +1,201 @@
+"""
+テナント（本番 / test / verify などのステージ）。
+
+以前はステージごとにリポジトリを丸ごとコピーし、userlist.json・クローン置き場・
+framework.py の場所だけを書き換えたサーバーを3本動かしていた。
+ここではそれらをテナントの設定にまとめ、1プロセス（ワーカープールも1つ）で全ステージを扱う。
+
+テナントの選び方（どちらも無ければ既定のテナント）:
+  - パスの先頭 /t/<テナント>/...（例: /t/test/users。プレフィックスを外してルーティング）
+  - ヘッダー X-Tenant: <テナント>
+データ（ユーザー・クローン・スナップショット・対局結果）はテナントごとに別の場所に置く。
+"""
+
+import json
+import os
+import re
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+TENANT_HEADER = b"x-tenant"
+_PREFIX = re.compile(r"^/t/([A-Za-z0-9_-]+)(?=/|$)")
+
+
+class Tenant:
+    """
+    1ステージ分の置き場所。root 以外は省略すると root からの既定値:
+      clone_dir     : <root>/clone_algo
+      userfile      : <clone_dir>/userlist.json
+      user_db       : ""（空なら userfile を使う）
+      snapshot_dir  : <clone_dir>/.snapshots
+      match_db      : <clone_dir>/matches.sqlite3
+      framework_dir : <root>/3d_four_game（framework.py のあるディレクトリ）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        clone_dir: Optional[str] = None,
+        userfile: Optional[str] = None,
+        user_db: str = "",
+        snapshot_dir: Optional[str] = None,
+        match_db: Optional[str] = None,
+        framework_dir: Optional[str] = None,
+    ):
+        self.name = name
+        self.root = os.path.abspath(root)
+        self.clone_dir = os.path.abspath(
+            clone_dir or os.path.join(self.root, "clone_algo")
+        )
+        self.userfile = userfile or os.path.join(self.clone_dir, "userlist.json")
+        self.user_db = user_db or ""
+        self.snapshot_dir = os.path.abspath(
+            snapshot_dir or os.path.join(self.clone_dir, ".snapshots")
+        )
+        self.match_db = match_db or os.path.join(self.clone_dir, "matches.sqlite3")
+        self.framework_dir = os.path.abspath(
+            framework_dir or os.path.join(self.root, "3d_four_game")
+        )
+        # テナントごとに遅延生成するもの（ユーザーストア・結果ストアなど）
+        self._resources: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def resource(self, key: str, factory: Callable[[], Any]) -> Any:
+        """key のオブジェクトを初回だけ factory() で作り、以降は同じものを返す"""
+        with self._lock:
+            if key not in self._resources:
+                self._resources[key] = factory()
+            return self._resources[key]
+
+    def resources(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._resources)
+
+    def match_len(self, path: str) -> int:
+        """path がこのテナントの置き場所の下なら、一致したディレクトリの長さ（無ければ 0）"""
+        p = os.path.abspath(path)
+        best = 0
+        for d in (self.root, self.clone_dir, self.snapshot_dir):
+            if p == d or p.startswith(d.rstrip(os.sep) + os.sep):
+                best = max(best, len(d))
+        return best
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "root": self.root,
+            "clone_dir": self.clone_dir,
+            "userfile": self.userfile,
+            "user_db": self.user_db or None,
+            "snapshot_dir": self.snapshot_dir,
+            "match_db": self.match_db,
+            "framework_dir": self.framework_dir,
+        }
+
+
+def parse_tenants(spec: str) -> Dict[str, dict]:
+    """
+    TENANTS 環境変数を {名前: Tenant の引数} に。
+      JSON        : {"prod": {"root": "/srv/a"}, "test": {"root": "/srv/b", "user_db": "..."}}
+      名前=root 列 : prod=/srv/a,test=/srv/b
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return {}
+    if spec.startswith("{"):
+        raw = json.loads(spec)
+        return {
+            name: ({"root": cfg} if isinstance(cfg, str) else dict(cfg))
+            for name, cfg in raw.items()
+        }
+    out: Dict[str, dict] = {}
+    for item in spec.split(","):
+        name, sep, root = item.strip().partition("=")
+        if not sep or not name.strip() or not root.strip():
+            raise ValueError(f"TENANTS の書式が不正です: {item!r}")
+        out[name.strip()] = {"root": root.strip()}
+    return out
+
+
+class TenantRegistry:
+    def __init__(self, tenants: Dict[str, Tenant], default: str):
+        if default not in tenants:
+            raise ValueError(f"既定のテナント {default!r} が定義されていません")
+        self._tenants = tenants
+        self.default = default
+        self.current: ContextVar[str] = ContextVar("tenant", default=default)
+
+    def names(self):
+        return list(self._tenants)
+
+    def all(self):
+        return list(self._tenants.values())
+
+    def get(self, name: Optional[str]) -> Optional[Tenant]:
+        return self._tenants.get(name or self.default)
+
+    def now(self) -> Tenant:
+        """処理中のリクエストのテナント（リクエスト外では既定のテナント）"""
+        return self._tenants[self.current.get()]
+
+    def for_path(self, path: str) -> Optional[Tenant]:
+        """ファイルパスを置き場所に含むテナント（入れ子なら一番深いもの）"""
+        best, best_len = None, 0
+        for t in self._tenants.values():
+            n = t.match_len(path)
+            if n > best_len:
+                best, best_len = t, n
+        return best
+
+
+class TenantMiddleware:
+    """
+    ASGI ミドルウェア。/t/<名前> プレフィックスか X-Tenant ヘッダーでテナントを決め、
+    registry.current に入れてから下流を呼ぶ（同期エンドポイントのスレッドにも引き継がれる）。
+    未知のテナントは 404。
+    """
+
+    def __init__(self, app, registry: TenantRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = None
+        m = _PREFIX.match(scope.get("path", ""))
+        if m:
+            name = m.group(1)
+            # ASGI の約束どおり path はそのまま、プレフィックスは root_path に足す
+            # （Starlette のルーティングは path から root_path を除いた部分を見る）
+            scope = dict(scope)
+            scope["root_path"] = scope.get("root_path", "") + m.group(0)
+        else:
+            for k, v in scope.get("headers") or []:
+                if k == TENANT_HEADER:
+                    name = v.decode("latin-1").strip() or None
+                    break
+        if name is not None and self.registry.get(name) is None:
+            return await _not_found(send, f"unknown tenant: {name}")
+        token = self.registry.current.set(name or self.registry.default)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.registry.current.reset(token)
+
+
+async def _not_found(send, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 404,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
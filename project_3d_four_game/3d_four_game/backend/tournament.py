@@ -0,0 +1,404 @@
+"""
+トーナメント（総当たり / スイス式）。
+
+対局は ProcessPoolExecutor 上で並列に実行する。各プロセスは自前の WorkerPool を持ち、
+auto-step と同じルール（タイムアウト・異常終了・無効座標 → 強制配置）で1局を指し切る。
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from backend.game import Clock, Game, apply_step, move_budget
+from backend.worker_pool import (
+    AISubprocessCrashed,
+    AISubprocessTimeout,
+    InvalidMoveError,
+    WorkerPool,
+)
+
+logger = logging.getLogger(__name__)
+
+WORKER_PATH = Path(__file__).resolve().parent.parent / "worker_algo.py"
+
+
+# ========== 1局（子プロセス側） ==========
+_POOL: Optional[WorkerPool] = None
+# framework.py のあるディレクトリ（play_match で受け取ったもの）。
+# 対局プロセスは大会ごとに作るので、1プロセスの中では全提出で同じ
+_FRAMEWORK_DIR: Optional[str] = None
+
+
+def _framework_for(algo_path: str) -> Optional[str]:
+    return _FRAMEWORK_DIR
+
+
+def _pool() -> WorkerPool:
+    """
+    対局プロセスごとに1つ（プロセス終了時にワーカーは stdin の EOF で落ちる）。
+    1プロセスで同時に指すのは1局（2提出）だけなので、サーバーのプールより絞る：
+      - zygote なし（対局プロセスの数だけ fork サーバーが増えないように。
+        起動は各提出で1局に1回なので exec の遅さは効かない）
+      - アイドルは提出ごとに1本・全体で2本、セッションも2本まで
+    concurrency 本の対局プロセスで、ワーカーは最大 2×concurrency 本。
+    """
+    global _POOL
+    if _POOL is None:
+        _POOL = WorkerPool(
+            WORKER_PATH,
+            max_idle_per_key=1,
+            max_idle_total=2,
+            max_sessions=2,
+            use_zygote=False,
+            framework_for=_framework_for,
+        )
+    return _POOL
+
+
+def play_match(
+    algo1: str,
+    algo2: str,
+    time_limit: Optional[float],
+    clock: Optional[Tuple[float, float]] = None,
+    overhead: float = 0.5,
+    session: bool = False,
+    framework_dir: Optional[str] = None,
+) -> dict:
+    """
+    先手 algo1 / 後手 algo2 で終局まで指し、結果と手順を返す。
+    clock=(持ち時間, 加算) なら持ち時間制（time_limit は1手あたりの上限）。
+    session=True なら1局のあいだ各 AI の MyAI を生かしておく。
+    framework_dir は両者が使う framework.py の場所（大会のテナントのもの。None ならワーカーの既定）。
+    """
+    global _FRAMEWORK_DIR
+    _FRAMEWORK_DIR = framework_dir
+    pool = _pool()
+    game = Game(clock=Clock(*clock) if clock else None, session=session)
+    game.players = (None, algo1, algo2)
+    state: dict = {"status": "ok"}
+
+    # 1手ごとに必ず石が置かれるか終局するので 64+1 回で打ち切れる
+    for _ in range(65):
+        cp = game.current_player
+        algo = algo1 if cp == 1 else algo2
+        reason_kind: Optional[str] = None
+        x = y = None
+        usage: dict = {}
+        timeout, time_left = move_budget(game, cp, time_limit, overhead)
+        t = time.monotonic()
+        if not algo:
+            reason_kind = "abnormal"
+        elif timeout is None:
+            reason_kind = "timeout"  # 持ち時間切れ
+        else:
+            try:
+                x, y = pool.get_move(
+                    algo,
+                    game.snapshot,
+                    timeout,
+                    usage=usage,
+                    context=game.move_context(
+                        time_left if time_left is not None else timeout
+                    ),
+                    session=game.session_for(cp, algo, pool),
+                )
+            except AISubprocessTimeout:
+                reason_kind = "timeout"
+            except AISubprocessCrashed:
+                reason_kind = "abnormal"
+            except InvalidMoveError:
+                reason_kind = "invalid"
+        elapsed = time.monotonic() - t
+        think_ms = int(elapsed * 1000)
+        game.charge_clock(cp, reason_kind, time_left, usage, elapsed)
+
+        state = apply_step(
+            game, cp, x, y, reason_kind, think_ms=think_ms, usage=usage or None
+        )
+        if state.get("status") != "ok":
+            break
+
+    game.close_sessions()
+    status = state.get("status")
+    return {
+        "status": status if status in ("win", "draw") else "draw",
+        "winner": state.get("winner"),
+        "winning_coords": state.get("winning_coords"),
+        "move_count": game.move_count,
+        "moves": game.history,
+        "started_at": game.started_at,
+        "duration_ms": int((time.time() - game.started_at) * 1000),
+        "clock": game.clock.to_dict() if game.clock else None,
+    }
+
+
+# ========== 組み合わせ ==========
+def round_robin_pairings(ids: List[str]) -> List[List[Tuple[str, str]]]:
+    """
+    サークル法による総当たり。先後を入れ替えた後半ラウンドも含める（ダブル総当たり）。
+    戻り値はラウンドごとの (先手, 後手) のリスト。
+    """
+    players: List[Optional[str]] = list(ids)
+    if len(players) % 2:
+        players.append(None)  # 不戦（bye）
+    n = len(players)
+    rounds: List[List[Tuple[str, str]]] = []
+    for r in range(n - 1):
+        pairs = []
+        for i in range(n // 2):
+            a, b = players[i], players[n - 1 - i]
+            if a is None or b is None:
+                continue
+            # 同じ人がずっと先手にならないよう交互に
+            pairs.append((a, b) if (r + i) % 2 == 0 else (b, a))
+        rounds.append(pairs)
+        players = [players[0], players[-1]] + players[1:-1]
+    return rounds + [[(b, a) for a, b in pairs] for pairs in rounds]
+
+
+def swiss_pairings(
+    ids: List[str],
+    points: Dict[str, float],
+    played: Dict[str, set],
+    firsts: Dict[str, int],
+    byes: set,
+) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    """
+    スイス式の1ラウンド分。得点順に並べ、未対戦の相手と上から組む。
+    先手は先手回数の少ない方。奇数なら下位の未 bye 者に bye。
+    """
+    order = sorted(ids, key=lambda p: (-points.get(p, 0.0), ids.index(p)))
+    bye = None
+    if len(order) % 2:
+        for p in reversed(order):
+            if p not in byes:
+                bye = p
+                break
+        bye = bye or order[-1]
+        order.remove(bye)
+
+    pairs: List[Tuple[str, str]] = []
+    pool = list(order)
+    while pool:
+        a = pool.pop(0)
+        j = next((k for k, b in enumerate(pool) if b not in played[a]), 0)
+        b = pool.pop(j)
+        if firsts.get(a, 0) <= firsts.get(b, 0):
+            pairs.append((a, b))
+        else:
+            pairs.append((b, a))
+    return pairs, bye
+
+
+# ========== トーナメント本体 ==========
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Tournament:
+    """
+    players: [{"id", "name", "path"}, ...]
+    format : "round_robin" | "swiss"
+    """
+
+    def __init__(
+        self,
+        players: List[dict],
+        format: str = "round_robin",
+        rounds: Optional[int] = None,
+        time_limit: Optional[float] = 30.0,
+        concurrency: Optional[int] = None,
+        clock: Optional[Tuple[float, float]] = None,
+        overhead: float = 0.5,
+        session: bool = False,
+        framework_dir: Optional[str] = None,
+    ):
+        if format not in ("round_robin", "swiss"):
+            raise ValueError(f"unknown format: {format}")
+        if len(players) < 2:
+            raise ValueError("players must be 2 or more")
+        self.id = uuid.uuid4().hex
+        self.players = {p["id"]: p for p in players}
+        self.format = format
+        self.rounds = rounds
+        self.time_limit = float(time_limit) if time_limit else None
+        if clock:
+            Clock(*clock)  # 値の検証だけ（不正なら ValueError）
+        elif self.time_limit is None:
+            raise ValueError("timeLimit or clock is required")
+        self.clock = tuple(clock) if clock else None
+        self.overhead = float(overhead)
+        self.session = bool(session)
+        self.framework_dir = framework_dir
+        self.concurrency = max(1, int(concurrency or os.cpu_count() or 1))
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.createdAt = _now()
+        self.startedAt: Optional[str] = None
+        self.finishedAt: Optional[str] = None
+        self.matches: List[dict] = []
+        self.on_match_done = None  # callable(tournament, match) — 結果の保存など
+        self._lock = threading.Lock()
+
+    # ---- 集計 ----
+    def standings(self) -> List[dict]:
+        table = {
+            pid: {
+                "id": pid,
+                "name": p.get("name"),
+                "points": 0.0,
+                "wins": 0,
+                "draws": 0,
+                "losses": 0,
+                "played": 0,
+            }
+            for pid, p in self.players.items()
+        }
+        with self._lock:
+            done = [
+                m for m in self.matches if m.get("status") in ("win", "draw", "bye")
+            ]
+        for m in done:
+            if m["status"] == "bye":
+                table[m["player1"]]["points"] += 1.0
+                continue
+            p1, p2 = table[m["player1"]], table[m["player2"]]
+            p1["played"] += 1
+            p2["played"] += 1
+            if m["status"] == "draw":
+                for t in (p1, p2):
+                    t["points"] += 0.5
+                    t["draws"] += 1
+            else:
+                w, l = (p1, p2) if m["winner"] == 1 else (p2, p1)
+                w["points"] += 1.0
+                w["wins"] += 1
+                l["losses"] += 1
+        return sorted(table.values(), key=lambda t: (-t["points"], -t["wins"], t["id"]))
+
+    def summary(self) -> dict:
+        with self._lock:
+            matches = [
+                {k: v for k, v in m.items() if k != "moves"} for m in self.matches
+            ]
+        return {
+            "id": self.id,
+            "format": self.format,
+            "status": self.status,
+            "error": self.error,
+            "timeLimit": self.time_limit,
+            "clock": (
+                {"initial": self.clock[0], "increment": self.clock[1]}
+                if self.clock
+                else None
+            ),
+            "concurrency": self.concurrency,
+            "createdAt": self.createdAt,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+            "total": len(matches),
+            "completed": sum(1 for m in matches if m["status"] != "pending"),
+            "standings": self.standings(),
+            "matches": matches,
+        }
+
+    # ---- 実行 ----
+    def _add_match(self, rnd: int, p1: str, p2: Optional[str]) -> dict:
+        m = {
+            "round": rnd,
+            "player1": p1,
+            "player2": p2,
+            "status": "pending" if p2 else "bye",
+            "winner": None,
+        }
+        with self._lock:
+            self.matches.append(m)
+        return m
+
+    def _run_round(self, ex: ProcessPoolExecutor, pending: List[dict]) -> None:
+        futs = {
+            ex.submit(
+                play_match,
+                self.players[m["player1"]]["path"],
+                self.players[m["player2"]]["path"],
+                self.time_limit,
+                self.clock,
+                self.overhead,
+                self.session,
+                self.framework_dir,
+            ): m
+            for m in pending
+        }
+        for fut in as_completed(futs):
+            m = futs[fut]
+            try:
+                res = fut.result()
+            except Exception as e:
+                # 対局プロセス自体が落ちた場合は "error" として続行
+                # （勝敗ではないので順位表・レーティング・結果の保存には含めない）
+                logger.exception("match failed")
+                res = {"status": "error", "winner": None, "moves": [], "error": str(e)}
+            with self._lock:
+                m.update(res)
+            if self.on_match_done:
+                try:
+                    self.on_match_done(self, m)
+                except Exception:
+                    logger.exception("on_match_done failed")
+
+    def run(self) -> None:
+        self.status = "running"
+        self.startedAt = _now()
+        ids = list(self.players)
+        try:
+            ctx = mp.get_context(
+                "spawn"
+            )  # サーバーの状態（ソケット等）を子に持ち込まない
+            with ProcessPoolExecutor(
+                max_workers=self.concurrency, mp_context=ctx
+            ) as ex:
+                if self.format == "round_robin":
+                    # 総当たりは結果に依存しないので全局まとめて投入
+                    pending = [
+                        self._add_match(r + 1, a, b)
+                        for r, pairs in enumerate(round_robin_pairings(ids))
+                        for a, b in pairs
+                    ]
+                    self._run_round(ex, pending)
+                else:
+                    n_rounds = self.rounds or max(1, (len(ids) - 1).bit_length() + 1)
+                    played: Dict[str, set] = {p: set() for p in ids}
+                    firsts: Dict[str, int] = {p: 0 for p in ids}
+                    byes: set = set()
+                    for r in range(n_rounds):
+                        points = {s["id"]: s["points"] for s in self.standings()}
+                        pairs, bye = swiss_pairings(ids, points, played, firsts, byes)
+                        if bye:
+                            byes.add(bye)
+                            self._add_match(r + 1, bye, None)
+                        pending = []
+                        for a, b in pairs:
+                            played[a].add(b)
+                            played[b].add(a)
+                            firsts[a] += 1
+                            pending.append(self._add_match(r + 1, a, b))
+                        self._run_round(ex, pending)
+            self.status = "finished"
+        except Exception as e:
+            logger.exception("tournament failed")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finishedAt = _now()
+
+    def start(self) -> None:
+        threading.Thread(
+            target=self.run, name=f"tournament-{self.id}", daemon=True
+        ).start()
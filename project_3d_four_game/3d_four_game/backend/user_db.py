@@ -0,0 +1,232 @@
+"""
+ユーザー（提出）レジストリの SQLite 版（WAL・スレッドごとの接続）。
+
+UserRegistry（userlist.json）と同じメソッドを持ち、/users の API はそのまま。
+1人分の変更は1行の UPSERT なので、ファイル全体を書き直す JSON 版と違って人数に依存しない。
+WAL なので読み取りは書き込み中も止まらない（複数プロセスからも読める）。
+初回だけ、既存の userlist.json（_read_store が読める形式ならどれでも）から移行する。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+U = Any  # main.User
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id                TEXT PRIMARY KEY,
+    name              TEXT NOT NULL,
+    path              TEXT NOT NULL,
+    canon_path        TEXT NOT NULL,
+    created_at        TEXT NOT NULL,
+    updated_at        TEXT NOT NULL,
+    validation_status TEXT,
+    validation        TEXT,
+    snapshot          TEXT,
+    rating            REAL
+);
+CREATE INDEX IF NOT EXISTS idx_users_path ON users(canon_path);
+CREATE INDEX IF NOT EXISTS idx_users_name ON users(name);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users(validation_status);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_UPSERT = (
+    "INSERT INTO users (id, name, path, canon_path, created_at, updated_at, "
+    "validation_status, validation, snapshot, rating) "
+    "VALUES (:id, :name, :path, :canon_path, :created_at, :updated_at, "
+    ":validation_status, :validation, :snapshot, :rating) "
+    "ON CONFLICT(id) DO UPDATE SET name=excluded.name, path=excluded.path, "
+    "canon_path=excluded.canon_path, updated_at=excluded.updated_at, "
+    "validation_status=excluded.validation_status, validation=excluded.validation, "
+    "snapshot=excluded.snapshot, rating=excluded.rating"
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SqliteUserStore:
+    def __init__(
+        self,
+        path: str,
+        make: Callable[[dict], U],
+        dump: Callable[[U], dict],
+        canon: Callable[[str], str],
+        migrate: Optional[Callable[[], List[U]]] = None,
+    ):
+        self.path = path
+        self._make = make
+        self._dump = dump
+        self._canon = canon
+        self._migrate_from = migrate
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._lock = threading.RLock()
+        self.writes = 0
+
+    # ---- 接続（スレッドごと） ----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._ready:
+                    conn.executescript(_SCHEMA)
+                    self._migrate(conn)
+                    self._ready = True
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """userlist.json からの一回限りの移行（meta に印を残し、二度目はしない）"""
+        done = conn.execute("SELECT value FROM meta WHERE key='migrated_at'").fetchone()
+        if done or self._migrate_from is None:
+            return
+        users = list(self._migrate_from())
+        seen: Dict[str, int] = {}
+        with conn:
+            for u in users:
+                row = self._to_row(u)
+                # JSON 版は id の重複を許していたので、2件目以降は -2, -3… を付ける
+                n = seen.get(row["id"], 0) + 1
+                seen[row["id"]] = n
+                if n > 1:
+                    row["id"] = f"{row['id']}-{n}"
+                conn.execute(_UPSERT, row)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_at', ?)",
+                (_now(),),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_count', ?)",
+                (str(len(users)),),
+            )
+        if users:
+            logger.info("migrated %d users into %s", len(users), self.path)
+
+    # ---- 行 ⇔ ユーザー ----
+    def _to_row(self, u: U) -> dict:
+        d = self._dump(u)
+        v = d.get("validation")
+        return {
+            "id": d["id"],
+            "name": d["name"],
+            "path": d["path"],
+            "canon_path": self._canon(d["path"]),
+            "created_at": d.get("createdAt") or _now(),
+            "updated_at": d.get("updatedAt") or _now(),
+            "validation_status": v.get("status") if isinstance(v, dict) else None,
+            "validation": json.dumps(v, ensure_ascii=False) if v is not None else None,
+            "snapshot": d.get("snapshot"),
+            "rating": d.get("rating"),
+        }
+
+    def _from_row(self, row: sqlite3.Row) -> U:
+        return self._make(
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "path": row["path"],
+                "createdAt": row["created_at"],
+                "updatedAt": row["updated_at"],
+                "validation": (
+                    json.loads(row["validation"]) if row["validation"] else None
+                ),
+                "snapshot": row["snapshot"],
+                "rating": row["rating"],
+            }
+        )
+
+    def _one(self, where: str, arg: str) -> Optional[U]:
+        # 同じキーが複数あれば登録順で先頭（JSON 版の線形探索と同じ）
+        row = (
+            self._conn()
+            .execute(
+                f"SELECT * FROM users WHERE {where} ORDER BY rowid LIMIT 1", (arg,)
+            )
+            .fetchone()
+        )
+        return self._from_row(row) if row else None
+
+    # ---- UserRegistry と同じ API ----
+    @property
+    def lock(self) -> threading.RLock:
+        """探してから書き換える、をまとめて原子的に行うとき用（このプロセス内）"""
+        return self._lock
+
+    def all(self) -> List[U]:
+        rows = self._conn().execute("SELECT * FROM users ORDER BY rowid").fetchall()
+        return [self._from_row(r) for r in rows]
+
+    def get(self, user_id: str) -> Optional[U]:
+        return self._one("id = ?", user_id)
+
+    def by_path(self, path: str) -> Optional[U]:
+        return self._one("canon_path = ?", self._canon(path))
+
+    def by_name(self, name: str) -> Optional[U]:
+        return self._one("name = ?", (name or "").strip())
+
+    def put(self, user: U, replace: Optional[U] = None) -> U:
+        self.put_many([(replace, user)])
+        return user
+
+    def put_many(self, pairs: List[Tuple[Optional[U], U]]) -> None:
+        conn = self._conn()
+        with self._lock, conn:
+            for old, new in pairs:
+                if old is not None and old.id != new.id:
+                    conn.execute("DELETE FROM users WHERE id = ?", (old.id,))
+                conn.execute(_UPSERT, self._to_row(new))
+            self.writes += 1
+
+    def delete(self, user_id: str) -> bool:
+        conn = self._conn()
+        with self._lock, conn:
+            cur = conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            if cur.rowcount:
+                self.writes += 1
+            return cur.rowcount > 0
+
+    def flush(self) -> None:
+        pass  # 書き込みは即時
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---- 統計 ----
+    def stats(self) -> dict:
+        conn = self._conn()
+        n = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        by_status = {
+            r[0] or "unchecked": r[1]
+            for r in conn.execute(
+                "SELECT validation_status, COUNT(*) FROM users GROUP BY validation_status"
+            )
+        }
+        return {
+            "backend": "sqlite",
+            "users": n,
+            "validation": by_status,
+            "writes": self.writes,
+        }
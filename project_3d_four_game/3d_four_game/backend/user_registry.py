@@ -0,0 +1,226 @@
+"""
+ユーザー一覧のメモリ常駐ストア（索引つき・write-behind）。
+
+userlist.json は起動後に1回だけ読み、id / 正規化パス / 名前の索引を持つ。
+変更はメモリに即反映し、ファイルへは書き込みスレッドが少し待ってまとめて書く
+（書き込み自体は save コールバック＝FileLock＋一時ファイル→os.replace）。
+外部からファイルが書き換えられたら（mtime / サイズ / inode の変化）読み直す。
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+U = Any  # id / name / path を持つユーザー（main.User）
+
+_Signature = Optional[Tuple[int, int, int]]
+
+
+def _signature(path: str) -> _Signature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class UserRegistry:
+    def __init__(
+        self,
+        path: str,
+        load: Callable[[], List[U]],
+        save: Callable[[List[U]], None],
+        canon: Callable[[str], str],
+        flush_delay: float = 0.2,
+        check_interval: float = 1.0,
+    ):
+        self.path = path
+        self._load = load
+        self._save = save
+        self._canon = canon
+        self.flush_delay = float(flush_delay)
+        self.check_interval = float(check_interval)  # 外部変更を見に行く最短間隔（秒）
+        self._lock = threading.RLock()
+        self._users: Optional[List[U]] = None  # 初回アクセスで読む
+        self._by_id: Dict[str, U] = {}
+        self._by_path: Dict[str, U] = {}
+        self._by_name: Dict[str, U] = {}
+        self._sig: _Signature = None
+        self._checked = 0.0
+        self._version = 0  # 変更ごとに +1
+        self._saved_version = 0
+        # 書き込みは同時に1本（古い版で新しい版を上書きしない）
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self.loads = 0
+        self.writes = 0
+
+    # ---- 読み込み・外部変更の検知 ----
+    def _reload(self) -> None:
+        """（_lock 保持下）ファイルから読み直して索引を作り直す"""
+        users = list(self._load())
+        self._sig = _signature(self.path)
+        self._users = users
+        self._reindex()
+        self.loads += 1
+
+    def _reindex(self) -> None:
+        # 重複は先頭を優先（従来の線形探索と同じ結果になるように）
+        by_id: Dict[str, U] = {}
+        by_path: Dict[str, U] = {}
+        by_name: Dict[str, U] = {}
+        for u in self._users or []:
+            by_id.setdefault(u.id, u)
+            p = self._canon(u.path)
+            if p:
+                by_path.setdefault(p, u)
+            n = (u.name or "").strip()
+            if n:
+                by_name.setdefault(n, u)
+        self._by_id, self._by_path, self._by_name = by_id, by_path, by_name
+
+    def _fresh(self) -> List[U]:
+        """メモリ上の一覧。ファイルが外から変わっていれば読み直す"""
+        with self._lock:
+            if self._users is None:
+                self._reload()
+                self._checked = time.monotonic()
+                return self._users
+            now = time.monotonic()
+            if now - self._checked >= self.check_interval:
+                self._checked = now
+                if _signature(self.path) != self._sig:
+                    if self._version != self._saved_version:
+                        # 未保存の変更がある間はメモリ側を正とする（次の書き込みで上書き）
+                        logger.warning("userlist changed; pending writes win")
+                    else:
+                        logger.info("userlist changed externally; reloading")
+                        self._reload()
+            return self._users
+
+    @property
+    def lock(self) -> threading.RLock:
+        """探してから書き換える、をまとめて原子的に行うとき用"""
+        return self._lock
+
+    # ---- 参照 ----
+    def all(self) -> List[U]:
+        return list(self._fresh())
+
+    def get(self, user_id: str) -> Optional[U]:
+        with self._lock:
+            self._fresh()
+            return self._by_id.get(user_id)
+
+    def by_path(self, path: str) -> Optional[U]:
+        with self._lock:
+            self._fresh()
+            return self._by_path.get(self._canon(path))
+
+    def by_name(self, name: str) -> Optional[U]:
+        with self._lock:
+            self._fresh()
+            return self._by_name.get((name or "").strip())
+
+    # ---- 変更（メモリに即反映、保存は後で） ----
+    def put(self, user: U, replace: Optional[U] = None) -> U:
+        """replace（無ければ同じ id の先頭）を差し替え、無ければ末尾に追加"""
+        with self._lock:
+            users = self._fresh()
+            old = replace if replace is not None else self._by_id.get(user.id)
+            for i, u in enumerate(users):
+                if u is old:
+                    users[i] = user
+                    break
+            else:
+                users.append(user)
+            self._changed()
+        return user
+
+    def put_many(self, pairs: List[Tuple[U, U]]) -> None:
+        """[(旧, 新), ...] をまとめて差し替え（保存は1回）"""
+        with self._lock:
+            users = self._fresh()
+            pos = {id(u): i for i, u in enumerate(users)}
+            for old, new in pairs:
+                i = pos.get(id(old))
+                if i is not None:
+                    users[i] = new
+            self._changed()
+
+    def delete(self, user_id: str) -> bool:
+        with self._lock:
+            users = self._fresh()
+            kept = [u for u in users if u.id != user_id]
+            if len(kept) == len(users):
+                return False
+            users[:] = kept
+            self._changed()
+        return True
+
+    def _changed(self) -> None:
+        self._version += 1
+        self._reindex()
+        self._ensure_writer()
+        self._wake.set()
+
+    # ---- write-behind ----
+    def _ensure_writer(self) -> None:
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(
+                target=self._writer_loop, name="userlist-writer", daemon=True
+            )
+            self._writer.start()
+
+    def _writer_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait()
+            if self._closed:
+                break
+            # 連続した変更を1回の書き込みにまとめる
+            time.sleep(self.flush_delay)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("userlist write failed; will retry")
+                time.sleep(1.0)
+                self._wake.set()
+
+    def flush(self) -> None:
+        """未保存の変更があれば今すぐ書く"""
+        with self._flush_lock:
+            with self._lock:
+                if self._users is None or self._version == self._saved_version:
+                    return
+                version = self._version
+                users = list(self._users)
+            # ファイル I/O は _lock の外（書いている間も読み取りは止めない）
+            self._save(users)
+            sig = _signature(self.path)
+            with self._lock:
+                self._saved_version = version
+                self._sig = sig  # 自分の書き込みは外部変更として扱わない
+                self.writes += 1
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    # ---- 統計 ----
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "json",
+                "users": len(self._users or []),
+                "pending": self._version != self._saved_version,
+                "loads": self.loads,
+                "writes": self.writes,
+            }
@@ -0,0 +1,122 @@
+"""
+提出の事前検証（クローン直後にバックグラウンドで実行）。
+
+入口（main.py）の解決 → サンドボックスのワーカーを起動（AST ゲートと
+get_move / MyAI の有無はワーカー側のロードで確認される）→ 空の盤面で1手。
+壊れた提出を対局の途中（タイムアウト・異常終了扱い）で初めて知るのではなく、
+登録時に弾けるようにする。検証に使ったワーカーはそのままプールに戻すので、
+最初の対局はウォーム済みのワーカーから始まる。
+"""
+
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from backend.game_logic import create_board
+from backend.worker_pool import (
+    AISubprocessCrashed,
+    AISubprocessTimeout,
+    InvalidMoveError,
+    WorkerPool,
+    failure_kind,
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def resolve_submission(
+    path: str,
+    base_dir: Optional[Path] = None,
+    aliases: Optional[Callable[[str], str]] = None,
+) -> str:
+    """
+    提出の入口（main.py の絶対パス）を決める。main.py の load_algo_module_flexible と
+    対局・検証のキーはすべてこれを通す。
+      - 別名（aliases が返すパス。解決できなければ名前をそのままパスとして扱う）
+      - *.py へのパス → そのファイル（相対ならカレント → base_dir の順）
+      - 絶対パスのディレクトリ → 中の main.py
+      - 相対パス → base_dir/パス/main.py → カレントからの パス/main.py
+    見つからなければ FileNotFoundError（候補を列挙）。
+    """
+    s = str(path or "").strip().replace("\\", "/")
+    if not s:
+        raise FileNotFoundError("path が空です")
+    if aliases is not None:
+        try:
+            s = str(aliases(s)) or s
+        except Exception:
+            pass
+    p = Path(s)
+    if p.suffix.lower() == ".py":
+        cands = [p]
+        if base_dir is not None and not p.is_absolute():
+            cands.append(Path(base_dir) / p)
+    elif p.is_absolute():
+        cands = [p / "main.py"]
+    else:
+        cands = [p / "main.py"]
+        if base_dir is not None:
+            cands.insert(0, Path(base_dir) / p / "main.py")
+    for cand in cands:
+        if cand.is_file():
+            return str(cand.resolve())
+    raise FileNotFoundError(
+        f"'main.py' が見つかりません。候補: {[str(c) for c in cands]}"
+    )
+
+
+def validate_submission(
+    pool: WorkerPool,
+    path: str,
+    timeout: float = 10.0,
+    resolve: Callable[[str], str] = resolve_submission,
+) -> dict:
+    """
+    検証結果（verdict）を返す。例外は投げない。
+    resolve は入口の解決（対局側と同じ base_dir・別名で呼ぶものを渡す）。
+      status  : "ok" | "invalid"
+      kind    : 失敗時の分類（missing / timeout / abnormal / invalid）
+      error   : 失敗理由（ロード時の例外メッセージなど）
+      entry   : 解決した main.py
+      load_ms : ワーカーが申告したモジュール読み込み時間
+      move_ms : 空盤面での1手（盤面送信〜応答）
+    """
+    verdict = {
+        "status": "invalid",
+        "kind": None,
+        "error": None,
+        "entry": None,
+        "load_ms": None,
+        "move_ms": None,
+        "move": None,
+        "checkedAt": _now(),
+    }
+    try:
+        entry = resolve(path)
+    except FileNotFoundError as e:
+        verdict.update(kind="missing", error=str(e))
+        return verdict
+    verdict["entry"] = entry
+
+    # get_move を通さず直接借りる（手の計測メトリクスに混ぜない・load_ms を必ず取る）
+    w = pool.acquire(entry)
+    ok = False
+    move: Optional[tuple] = None
+    try:
+        move = w.request(create_board(), time.monotonic() + timeout)
+        ok = True
+    except (AISubprocessTimeout, AISubprocessCrashed, InvalidMoveError) as e:
+        verdict.update(kind=failure_kind(e), error=str(e))
+    finally:
+        # 返却後は別の手が同じワーカーの値を書き換えうるので先に読む
+        verdict["load_ms"] = w.load_ms
+        if w.think_s is not None:
+            verdict["move_ms"] = round(w.think_s * 1000, 3)
+        pool.release(w, healthy=ok)
+
+    if ok:
+        verdict.update(status="ok", move=list(move))
+    return verdict
@@ -0,0 +1,775 @@
+"""
+AI 実行用の常駐ワーカープール。
+
+提出ごとに `worker_algo.py --serve <path>` を起動しておき、
+get_move の要求を長さ付きフレームでやり取りする（1手ごとの起動コストを無くす）。
+ワーカーは (提出パス, 更新時刻) ごとに分けて持ち、N手ごと・異常時に作り直す。
+新しいワーカーは zygote（`worker_algo.py --zygote`）からの fork で作る。
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+
+
+# ========== 例外（3分類） ==========
+class InvalidMoveError(ValueError):
+    """無効座標指定（形式不正・範囲外など）"""
+
+    pass
+
+
+class AISubprocessTimeout(TimeoutError):
+    """タイムアウト"""
+
+    pass
+
+
+class AISubprocessCrashed(RuntimeError):
+    """処理異常終了（非ゼロ終了コードなど）"""
+
+    pass
+
+
+def failure_kind(e: Exception) -> str:
+    """例外 → 失敗3分類（fmt_fail の kind）"""
+    if isinstance(e, AISubprocessTimeout):
+        return "timeout"
+    if isinstance(e, InvalidMoveError):
+        return "invalid"
+    return "abnormal"
+
+
+def resolve_entry(algo_path: str) -> str:
+    """ディレクトリが来たら中の main.py を指す"""
+    p = Path(str(algo_path).strip())
+    if p.is_dir():
+        p = p / "main.py"
+    return str(p.resolve())
+
+
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+# ========== バイトコードキャッシュ ==========
+class CodeCache:
+    """
+    AST 判定の結果とバイトコード（ワーカーが marshal して送ってくる）をメモリに持つ LRU。
+    ワーカーは提出コードを実行する前にだけ cache_get / cache_put を送ってくる。
+    提出コードからは書き換えられないよう、ディスクには置かない。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: str) -> None:
+        if len(entry) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = entry
+            self._size += len(entry)
+            while self._size > self.max_bytes:
+                _, e = self._entries.popitem(last=False)
+                self._size -= len(e)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# ========== ワーカー1本 ==========
+class Worker:
+    """常駐ワーカー1プロセス（同時に使うのは1要求だけ）"""
+
+    def __init__(
+        self,
+        key: Tuple[str, int],
+        pid: int,
+        wfd: int,
+        rfd: int,
+        proc: Optional[subprocess.Popen] = None,
+        code_cache: Optional[CodeCache] = None,
+    ):
+        self.key = key
+        self.pid = pid
+        self.proc = proc  # zygote 由来なら None（親は zygote）
+        self.wfd = wfd
+        self.rfd = rfd
+        self.ready = False
+        self.code_cache = code_cache
+        # 起動時のキャッシュのやり取り："get" 待ち → (外れなら) "put" 待ち → None（以後は拒否）
+        self._cache_expect: Optional[str] = "get"
+        self._cache_key: Optional[str] = None
+        self.moves = 0
+        self.retire = False  # ワーカーが CPU のハード上限に近いと申告したら True
+        self.idle_since = time.monotonic()
+        self.session = False  # True ならワーカー側で MyAI を作り直さずに使い続ける
+        # 計測用（秒）。spawn/load は起動直後の1回だけ
+        self.created_at = time.monotonic()
+        self.spawn_s: Optional[float] = None
+        self.load_s: Optional[float] = None
+        self.think_s: Optional[float] = None
+        # ワーカー自身の申告（load_ms は ready フレーム、usage は直近の応答）
+        self.load_ms: Optional[float] = None
+        self.usage: Optional[dict] = None
+
+    @property
+    def alive(self) -> bool:
+        if self.proc is not None:
+            return self.proc.poll() is None
+        try:
+            os.kill(self.pid, 0)
+            return True
+        except OSError:
+            return False
+
+    def _read_exact(self, n: int, deadline: float) -> bytes:
+        chunks = []
+        while n > 0:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise AISubprocessTimeout("timeout")
+            r, _, _ = select.select([self.rfd], [], [], left)
+            if not r:
+                raise AISubprocessTimeout("timeout")
+            b = os.read(self.rfd, n)
+            if not b:
+                raise AISubprocessCrashed("abnormal")
+            chunks.append(b)
+            n -= len(b)
+        return b"".join(chunks)
+
+    @staticmethod
+    def _decode(body: bytes) -> dict:
+        try:
+            obj = json.loads(body.decode("utf-8"))
+        except Exception as e:
+            raise InvalidMoveError(f"invalid reply: {e}")
+        if not isinstance(obj, dict):
+            raise InvalidMoveError("invalid reply")
+        return obj
+
+    @staticmethod
+    def _encode(obj) -> bytes:
+        data = json.dumps(obj).encode("utf-8")
+        return _HEADER.pack(len(data)) + data
+
+    def read_frame(self, deadline: float) -> dict:
+        head = self._read_exact(_HEADER.size, deadline)
+        return self._decode(self._read_exact(_HEADER.unpack(head)[0], deadline))
+
+    def write_frame(self, obj) -> None:
+        try:
+            os.write(self.wfd, self._encode(obj))
+        except (BrokenPipeError, OSError):
+            raise AISubprocessCrashed("abnormal")
+
+    def _on_cache(self, msg: dict) -> None:
+        """
+        ready より前（提出コードの実行前）の cache_get / cache_put を処理する。
+        get 1回と、外れたときの put 1回だけ受け付ける（提出のトップレベルのコードが
+        フレームを偽造しても、その時点ではもう受け付けない）。
+        """
+        if "cache_get" in msg and self._cache_expect == "get":
+            key = msg["cache_get"]
+            if not isinstance(key, str):
+                raise AISubprocessCrashed("abnormal")
+            entry = self.code_cache.get(key) if self.code_cache else None
+            self._cache_expect = None if entry else "put"
+            self._cache_key = key
+            self.write_frame({"entry": entry})
+        elif "cache_put" in msg and self._cache_expect == "put":
+            self._cache_expect = None
+            entry = msg.get("entry")
+            if self.code_cache and msg["cache_put"] == self._cache_key:
+                if isinstance(entry, str):
+                    self.code_cache.put(self._cache_key, entry)
+        else:
+            raise AISubprocessCrashed("abnormal")
+
+    def _on_ready(self, msg: dict) -> None:
+        if "cache_get" in msg or "cache_put" in msg:
+            self._on_cache(msg)
+            return
+        self._cache_expect = None
+        if not msg.get("ok"):
+            # ロード失敗（AST ゲートの拒否・入口なし等）は理由を添える
+            raise AISubprocessCrashed(msg.get("error") or "abnormal")
+        self.ready = True
+        self.load_s = time.monotonic() - self.created_at
+        self.load_ms = msg.get("load_ms")
+
+    def _on_reply(self, reply: dict) -> Tuple[int, int]:
+        self.moves += 1
+        usage = reply.get("usage")
+        self.usage = usage if isinstance(usage, dict) else None
+        if reply.get("retire"):
+            self.retire = True
+        if "error" in reply:
+            raise AISubprocessCrashed(reply.get("error") or "abnormal")
+        try:
+            x, y = int(reply.get("x")), int(reply.get("y"))
+        except Exception as e:
+            raise InvalidMoveError(f"invalid move: {e}")
+        if not (0 <= x < 4 and 0 <= y < 4):
+            raise InvalidMoveError(f"move out of range: ({x}, {y})")
+        return (x, y)
+
+    def _move_frame(self, board, context: Optional[dict]) -> dict:
+        frame = {"board": board}
+        if context:
+            frame["context"] = context
+        if self.session:
+            frame["session"] = True
+        return frame
+
+    def request(
+        self, board, deadline: float, context: Optional[dict] = None
+    ) -> Tuple[int, int]:
+        # 起動直後の {"ok": true} を待つ（ロード失敗は abnormal）
+        while not self.ready:
+            self._on_ready(self.read_frame(deadline))
+        t = time.monotonic()
+        self.think_s = self.usage = None
+        self.write_frame(self._move_frame(board, context))
+        reply = self.read_frame(deadline)
+        self.think_s = time.monotonic() - t
+        return self._on_reply(reply)
+
+    # ---- asyncio 版（イベントループを塞がない） ----
+    async def _aread_exact(self, n: int, deadline: float) -> bytes:
+        loop = asyncio.get_running_loop()
+        chunks = []
+        while n > 0:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise AISubprocessTimeout("timeout")
+            fut = loop.create_future()
+            loop.add_reader(self.rfd, lambda: fut.done() or fut.set_result(None))
+            try:
+                await asyncio.wait_for(fut, left)
+            except asyncio.TimeoutError:
+                raise AISubprocessTimeout("timeout")
+            finally:
+                loop.remove_reader(self.rfd)
+            b = os.read(self.rfd, n)
+            if not b:
+                raise AISubprocessCrashed("abnormal")
+            chunks.append(b)
+            n -= len(b)
+        return b"".join(chunks)
+
+    async def aread_frame(self, deadline: float) -> dict:
+        head = await self._aread_exact(_HEADER.size, deadline)
+        return self._decode(await self._aread_exact(_HEADER.unpack(head)[0], deadline))
+
+    async def arequest(
+        self, board, deadline: float, context: Optional[dict] = None
+    ) -> Tuple[int, int]:
+        while not self.ready:
+            self._on_ready(await self.aread_frame(deadline))
+        # フレームは小さいのでパイプへの書き込みでは待たない
+        t = time.monotonic()
+        self.think_s = self.usage = None
+        self.write_frame(self._move_frame(board, context))
+        reply = await self.aread_frame(deadline)
+        self.think_s = time.monotonic() - t
+        return self._on_reply(reply)
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        if self.proc is not None:
+            # イベントループからも呼ばれるので待たない。ここで回収できなければ
+            # Worker が捨てられたときの Popen の後始末（subprocess._cleanup）に任せる
+            try:
+                self.proc.poll()
+            except Exception:
+                pass
+        for fd in (self.wfd, self.rfd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+# ========== zygote ==========
+class Zygote:
+    """
+    `worker_algo.py --zygote` の親プロセスを1本保持し、fork を依頼する。
+    子の stdin/stdout 用パイプはこちらで作り、SCM_RIGHTS で渡す。
+    """
+
+    def __init__(self, worker_path: str):
+        self.worker_path = worker_path
+        self._proc: Optional[subprocess.Popen] = None
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self._proc = subprocess.Popen(
+                [sys.executable, self.worker_path, "--zygote", str(child.fileno())],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(child.fileno(),),
+                start_new_session=True,
+            )
+        finally:
+            child.close()
+        self._sock = parent
+
+    def _stop(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._proc is not None:
+            try:
+                self._proc.kill()
+                self._proc.wait(timeout=0.5)
+            except Exception:
+                pass
+            self._proc = None
+
+    def spawn(
+        self, algo_path: str, framework_dir: Optional[str] = None
+    ) -> Tuple[int, int, int]:
+        """fork してもらい (pid, 書き込みfd, 読み込みfd) を返す"""
+        req = {"algo_path": algo_path}
+        if framework_dir:
+            req["framework_dir"] = framework_dir
+        in_r, in_w = os.pipe()
+        out_r, out_w = os.pipe()
+        try:
+            with self._lock:
+                for attempt in range(2):
+                    if self._proc is None or self._proc.poll() is not None:
+                        self._stop()
+                        self._start()
+                    try:
+                        socket.send_fds(
+                            self._sock,
+                            [json.dumps(req).encode("utf-8")],
+                            [in_r, out_w],
+                        )
+                        reply = self._sock.recv(4096)
+                        if not reply:
+                            raise OSError("zygote closed")
+                        break
+                    except OSError:
+                        # zygote が落ちていたら1回だけ作り直す
+                        self._stop()
+                        if attempt:
+                            raise
+            msg = json.loads(reply.decode("utf-8"))
+            if "pid" not in msg:
+                raise OSError(msg.get("error", "zygote error"))
+        except Exception:
+            for fd in (in_w, out_r):
+                os.close(fd)
+            raise
+        finally:
+            os.close(in_r)
+            os.close(out_w)
+        return int(msg["pid"]), in_w, out_r
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop()
+
+
+# ========== セッション ==========
+class Session:
+    """
+    1局のあいだ1つの提出に専用ワーカーを割り当て、MyAI インスタンスを生かしておく
+    （置換表や定跡を手をまたいで使える）。制限とガードは通常どおり1手ごとにかかる。
+    失敗したワーカーは kill し、次の手で新しいワーカー（MyAI も作り直し）を使う。
+    プール全体のセッション数が max_sessions を超えると、手の途中でないものから
+    古い順にワーカーを取り上げる（失敗と同じく次の手で作り直す）。
+    終わったら close() で必ず破棄する（プールには戻さない）。
+    """
+
+    def __init__(self, pool: "WorkerPool", algo_path: str):
+        self.pool = pool
+        self.algo_path = algo_path
+        self.worker: Optional[Worker] = None
+        self.restarts = 0
+        self.closed = False
+        self.busy = False  # 手の途中（ワーカーを使用中）
+
+    def get_move(self, board, timeout: float, **kw) -> Tuple[int, int]:
+        return self.pool.get_move(self.algo_path, board, timeout, session=self, **kw)
+
+    async def get_move_async(self, board, timeout: float, **kw) -> Tuple[int, int]:
+        return await self.pool.get_move_async(
+            self.algo_path, board, timeout, session=self, **kw
+        )
+
+    def close(self) -> None:
+        self.closed = True
+        with self.pool._lock:
+            self.pool._sessions.pop(self, None)
+            w, self.worker = self.worker, None
+        if w is not None:
+            w.kill()
+
+
+# ========== プール ==========
+class WorkerPool:
+    """
+    (提出パス, 更新時刻) ごとのアイドルワーカーを保持する。
+    get_move はワーカーを1本借りて1手処理し、問題なければ返却する。
+    framework_for(提出パス) を渡すと、その戻り値のディレクトリの framework.py を
+    ワーカーに使わせる（テナントごとに framework が違っても1つのプールで済む）。
+    """
+
+    def __init__(
+        self,
+        worker_path: Path,
+        max_moves: int = 200,
+        max_idle_per_key: int = 2,
+        max_idle_total: int = 64,
+        use_zygote: bool = True,
+        metrics=None,
+        framework_for: Optional[Callable[[str], Optional[str]]] = None,
+        code_cache_mb: float = 64,
+        max_sessions: int = 256,
+    ):
+        self.worker_path = str(worker_path)
+        self.framework_for = framework_for
+        # AST 判定・バイトコードのキャッシュ（0 で無効）
+        self.code_cache = (
+            CodeCache(int(code_cache_mb * 1024 * 1024)) if code_cache_mb > 0 else None
+        )
+        self.metrics = metrics  # backend.metrics.MoveMetrics（任意）
+        self.zygote = Zygote(self.worker_path) if use_zygote else None
+        self.max_moves = max_moves
+        self.max_idle_per_key = max_idle_per_key
+        self.max_idle_total = max_idle_total
+        self._idle: "OrderedDict[Tuple[str, int], List[Worker]]" = OrderedDict()
+        # ワーカーを持っているセッション（古く使われた順）
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Session, None]" = OrderedDict()
+        self.session_evictions = 0
+        self._lock = threading.Lock()
+
+    # ---- 生成/返却 ----
+    def _spawn(self, key: Tuple[str, int]) -> Worker:
+        t = time.monotonic()
+        w = self._spawn_worker(key)
+        w.spawn_s = time.monotonic() - t
+        return w
+
+    def _spawn_worker(self, key: Tuple[str, int]) -> Worker:
+        # 提出パスで決まるので、プールのキーに含めなくてよい
+        fw = self.framework_for(key[0]) if self.framework_for else None
+        if self.zygote is not None:
+            try:
+                pid, wfd, rfd = self.zygote.spawn(key[0], fw)
+                return Worker(key, pid, wfd, rfd, code_cache=self.code_cache)
+            except Exception:
+                logger.exception("zygote spawn failed; falling back to exec")
+        proc = subprocess.Popen(
+            [sys.executable, self.worker_path, "--serve", key[0]]
+            + ([fw] if fw else []),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        # fd の寿命は Worker が持つ（Popen 側のファイルオブジェクトからは切り離す）
+        wfd = os.dup(proc.stdin.fileno())
+        rfd = os.dup(proc.stdout.fileno())
+        proc.stdin.close()
+        proc.stdout.close()
+        return Worker(key, proc.pid, wfd, rfd, proc=proc, code_cache=self.code_cache)
+
+    def acquire(self, algo_path: str) -> Worker:
+        path = resolve_entry(algo_path)
+        key = (path, _mtime_ns(path))
+        stale: List[Worker] = []
+        w: Optional[Worker] = None
+        with self._lock:
+            # 同じ提出の古い版（mtime 違い）は捨てる
+            for k in [k for k in self._idle if k[0] == path and k != key]:
+                stale.extend(self._idle.pop(k))
+            bucket = self._idle.get(key)
+            while bucket:
+                cand = bucket.pop()
+                if cand.alive:
+                    w = cand
+                    break
+                stale.append(cand)
+            if bucket is not None and not bucket:
+                self._idle.pop(key, None)
+        for s in stale:
+            s.kill()
+        return w or self._spawn(key)
+
+    def release(self, w: Worker, healthy: bool = True) -> None:
+        if not healthy or w.retire or not w.alive or w.moves >= self.max_moves:
+            w.kill()
+            return
+        evicted: List[Worker] = []
+        with self._lock:
+            bucket = self._idle.setdefault(w.key, [])
+            self._idle.move_to_end(w.key)
+            if len(bucket) >= self.max_idle_per_key:
+                evicted.append(w)
+            else:
+                w.idle_since = time.monotonic()
+                bucket.append(w)
+            # 全体上限を超えたら古いキーから間引く
+            while sum(len(b) for b in self._idle.values()) > self.max_idle_total:
+                k, b = next(iter(self._idle.items()))
+                evicted.append(b.pop(0))
+                if not b:
+                    self._idle.pop(k)
+        for e in evicted:
+            e.kill()
+
+    def session(self, algo_path: str) -> Session:
+        return Session(self, algo_path)
+
+    def _checkout(self, algo_path: str, session: Optional[Session]) -> Worker:
+        if session is None:
+            return self.acquire(algo_path)
+        if session.closed:
+            raise AISubprocessCrashed("session closed")
+        # 取り上げ（_hold_session）と競合しないよう、使用中の印とワーカーはロックの中で
+        with self._lock:
+            session.busy = True
+            w = session.worker
+        try:
+            if w is None or not w.alive:
+                if w is not None:
+                    w.kill()
+                w = self.acquire(algo_path)
+                w.session = True
+                session.worker = w
+        except BaseException:
+            session.busy = False
+            raise
+        self._hold_session(session)
+        return w
+
+    def _checkin_late(self, fut: "asyncio.Future", session: Optional[Session]) -> None:
+        """キャンセルされた get_move_async の借り出しが終わったら返す（要求は送っていない）"""
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        self._checkin(fut.result(), True, session)
+
+    def _hold_session(self, session: Session) -> None:
+        """session を最近使った側へ。上限を超えたら、手の途中でない古いものからワーカーを取り上げる"""
+        evicted: List[Worker] = []
+        with self._lock:
+            self._sessions[session] = None
+            self._sessions.move_to_end(session)
+            excess = len(self._sessions) - self.max_sessions
+            for s in list(self._sessions):
+                if excess <= 0:
+                    break
+                if s is session or s.busy:
+                    continue
+                del self._sessions[s]
+                if s.worker is not None:
+                    evicted.append(s.worker)
+                    s.worker = None
+                excess -= 1
+            self.session_evictions += len(evicted)
+        for w in evicted:
+            w.kill()
+
+    def _checkin(self, w: Worker, ok: bool, session: Optional[Session]) -> None:
+        if session is None:
+            self.release(w, healthy=ok)
+            return
+        if not ok or session.closed:
+            w.kill()
+            with self._lock:
+                if session.worker is w:
+                    session.worker = None
+                    session.restarts += 1
+                    self._sessions.pop(session, None)
+        session.busy = False
+
+    # ---- 実行 ----
+    def get_move(
+        self,
+        algo_path: str,
+        board,
+        timeout: float,
+        usage: Optional[dict] = None,
+        context: Optional[dict] = None,
+        session: Optional[Session] = None,
+        label: Optional[str] = None,
+    ) -> Tuple[int, int]:
+        """
+        1手実行。失敗は AISubprocessTimeout / AISubprocessCrashed / InvalidMoveError。
+        タイムアウトには（新規ワーカーなら）起動・ロード時間も含む。
+        usage に dict を渡すと、失敗時も含めてこの手の実測値を書き込む（_fill_usage）。
+        context（持ち時間 time_left など）はそのままワーカーへ渡す。
+        session を渡すとプールではなくそのセッションの専用ワーカーを使う。
+        label は /metrics の algo ラベル（省略時は入口の絶対パス）。失敗の種類は
+        強制配置を決める側（apply_step）で数えるので、ここでは数えない。
+        """
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+        w = self._checkout(algo_path, session)
+        fresh = not w.ready
+        ok = False
+        try:
+            move = w.request(board, deadline, context)
+            ok = True
+            return move
+        finally:
+            # 返却したワーカーはすぐ別の手に貸し出されうるので、計測値は返却前に読む
+            if usage is not None:
+                self._fill_usage(usage, w, t0, fresh)
+            self._observe(w, t0, ok, label)
+            self._checkin(w, ok, session)
+
+    async def get_move_async(
+        self,
+        algo_path: str,
+        board,
+        timeout: float,
+        usage: Optional[dict] = None,
+        context: Optional[dict] = None,
+        session: Optional[Session] = None,
+        label: Optional[str] = None,
+    ) -> Tuple[int, int]:
+        """
+        get_move の asyncio 版。待ち時間中はイベントループを解放する。
+        タイムアウト・キャンセル時はワーカーを kill する。
+        """
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+        # スレッドでの借り出しはキャンセルしても止まらないので、shield して
+        # キャンセルされたら借りたワーカーを届いた時点で返す
+        checkout = asyncio.ensure_future(
+            asyncio.to_thread(self._checkout, algo_path, session)
+        )
+        try:
+            w = await asyncio.shield(checkout)
+        except asyncio.CancelledError:
+            checkout.add_done_callback(lambda f: self._checkin_late(f, session))
+            raise
+        fresh = not w.ready
+        ok = False
+        try:
+            move = await w.arequest(board, deadline, context)
+            ok = True
+            return move
+        finally:
+            # 返却したワーカーはすぐ別の手に貸し出されうるので、計測値は返却前に読む
+            if usage is not None:
+                self._fill_usage(usage, w, t0, fresh)
+            self._observe(w, t0, ok, label)
+            self._checkin(w, ok, session)
+
+    # ---- 計測 ----
+    @staticmethod
+    def _fill_usage(out: dict, w: Worker, t0: float, fresh: bool) -> None:
+        """
+        ワーカー申告の wall_ms / cpu_ms / max_rss_kb に、この手で起動したなら
+        spawn_ms / load_ms を足す。think_ms はサーバー側で見た盤面送信〜応答、
+        total_ms はサーバー側で見た1手全体。
+        応答が無い（タイムアウト等）ときはサーバー側で測れた値だけ入る。
+        """
+        out.clear()
+        if w.usage:
+            out.update(w.usage)
+        if w.think_s is not None:
+            out["think_ms"] = round(w.think_s * 1000, 3)
+        if fresh:
+            if w.spawn_s is not None:
+                out["spawn_ms"] = round(w.spawn_s * 1000, 3)
+            if w.load_ms is not None:
+                out["load_ms"] = w.load_ms
+        out["total_ms"] = round((time.monotonic() - t0) * 1000, 3)
+
+    def _observe(
+        self, w: Worker, t0: float, ok: bool, label: Optional[str] = None
+    ) -> None:
+        m = self.metrics
+        if m is None:
+            return
+        algo = label or w.key[0]
+        m.moves.inc(algo=algo)
+        m.total.observe(time.monotonic() - t0, algo=algo)
+        if w.spawn_s is not None:
+            # 起動・ロードは新しいワーカーの初回だけ数える
+            m.spawn.observe(w.spawn_s, algo=algo)
+            w.spawn_s = None
+            if w.load_s is not None:
+                m.load.observe(w.load_s, algo=algo)
+        if ok and w.think_s is not None:
+            m.think.observe(w.think_s, algo=algo)
+
+    def close(self) -> None:
+        with self._lock:
+            workers = [w for b in self._idle.values() for w in b]
+            self._idle.clear()
+        for w in workers:
+            w.kill()
+        if self.zygote is not None:
+            self.zygote.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                "idle_workers": sum(len(b) for b in self._idle.values()),
+                "submissions": len(self._idle),
+                "session_workers": len(self._sessions),
+                "session_evictions": self.session_evictions,
+            }
+        if self.code_cache is not None:
+            out["code_cache"] = self.code_cache.stats()
+        return out
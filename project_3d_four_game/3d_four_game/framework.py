@@ -1,11 +1,31 @@
 # === framework.py（サーバー側のみ配置）===
 from abc import ABC, abstractmethod
-from typing import Tuple, List
+from typing import List, NamedTuple, Optional, Tuple
 
 Board = List[List[List[int]]]  # board[z][y][x]（0=空, 1=黒, 2=白）
 
+
+class MoveContext(NamedTuple):
+    """get_move_ex に渡す対局情報"""
+
+    player: int  # 自分の手番（1=黒, 2=白）
+    move_number: int  # これから指す手が何手目か（1 始まり）
+    last_move: Optional[Tuple[int, int, int]]  # 相手の直前の手 (x, y, z)。初手は None
+    history: List[Tuple[int, int, int]]  # これまでの全手 (x, y, z)
+    time_left: Optional[float]  # この手に使える秒数（超えるとタイムアウト）
+    clock_left: Optional[float]  # 持ち時間制なら自分の残り持ち時間（秒）、なければ None
+
+
 class Alg3D(ABC):
     @abstractmethod
     def get_move(self, board: Board) -> Tuple[int, int]:
         """(x, y) を返す。0 <= x < 4, 0 <= y < 4"""
         ...
+
+    def get_move_ex(self, board: Board, context: MoveContext) -> Tuple[int, int]:
+        """
+        拡張版（任意）。オーバーライドするとサーバーはこちらを呼ぶ。
+        context.time_left を見て早めに返せば、持ち時間を節約できる。
+        既定では get_move をそのまま呼ぶ。
+        """
+        return self.get_move(board)
@@ -3,7 +3,9 @@ import * as THREE from '/static/three/build/three.module.js';
 import { OrbitControls } from '/static/three/examples/jsm/controls/OrbitControls.js';
 
 // ================== 定数 ==================
-const BASE_URL = 'http://35.74.10.149:8000';
+// /t/<テナント>/app/ から開いたときは API も同じテナント（ステージ）に向ける
+const TENANT_PREFIX = (location.pathname.match(/^\/t\/[A-Za-z0-9_-]+/) || [''])[0];
+const BASE_URL = 'http://35.74.10.149:8000' + TENANT_PREFIX;
 
 // ================== ヘルパ ==================
 
@@ -916,6 +918,16 @@ function renderTeamList() {
   });
 }
 
+async function waitCloneJob(jobId, resultArea) {
+  while (true) {
+    const job = await fetchJSON(`${BASE_URL}/clone/jobs/${jobId}`);
+    if (job.status === "done" || job.status === "failed") return job;
+    const { stage, percent } = job.progress || {};
+    if (resultArea) resultArea.textContent = `⏳ ${stage || job.status}${percent != null ? ` ${percent}%` : ""}`;
+    await sleep(500);
+  }
+}
+
 document.getElementById("clonebtn")?.addEventListener("click", async (e) => {
   e.preventDefault();
   const repoUrl = document.getElementById("repoUrl")?.value.trim();
@@ -935,7 +947,11 @@ document.getElementById("clonebtn")?.addEventListener("click", async (e) => {
     const data = await res.json();
     if (!res.ok) throw new Error(data.detail || "クローン失敗");
 
-    const newPath = data.path;
+    // クローンはサーバー側のジョブで進むので、終わるまで進捗を見ながら待つ
+    const job = await waitCloneJob(data.job_id, resultArea);
+    if (job.status !== "done") throw new Error(job.error || "クローン失敗");
+
+    const newPath = job.path;
     const created = await registerUser(teamName, newPath);
 
     const idx = clonedTeams.findIndex(t => t.path === created.path);
@@ -950,7 +966,10 @@ document.getElementById("clonebtn")?.addEventListener("click", async (e) => {
     if (ai1Select && !ai1Select.value) ai1Select.value = newPath;
     else if (ai2Select && !ai2Select.value) ai2Select.value = newPath;
 
-    if (resultArea) resultArea.textContent = `✅ クローン成功: ${teamName}`;
+    const v = job.result?.validation;
+    if (resultArea) resultArea.textContent = v && v.status !== "ok"
+      ? `⚠️ クローン成功（検証NG: ${v.error || v.kind}）: ${teamName}`
+      : `✅ クローン成功: ${teamName}`;
   } catch (err) {
     if (resultArea) resultArea.textContent = `❌ エラー: ${err.message}`;
   }
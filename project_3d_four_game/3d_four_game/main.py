@@ -1,15 +1,16 @@
 # uuid main.py (FastAPI) — サーバー/フロント/静的ファイル クリーン版
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from pathlib import Path
 import importlib.util
 import traceback
-import copy
 import sys
 import uuid
 import logging
+import asyncio
+import time
 import secrets, string
 from typing import Dict, List, Optional, Tuple
 from uuid import uuid4
@@ -22,9 +23,12 @@ from typing import List, Dict, Optional
 from datetime import datetime, timezone
 import json, os, tempfile
 from fastapi import Response, status
+from fastapi.responses import StreamingResponse
 
 # ゲームロジック（必要なものだけインポート）
 from backend.game_logic import (
+    LINES,
+    check_win_at,
     create_board,
     is_full,
 )
@@ -58,6 +62,52 @@ ROOT = BASE_DIR.parent  # .../project_3d_four_game
 ALGO_DIR = ROOT
 EXTRA_DIRS = [ALGO_DIR]
 
+# ========== テナント（ステージ） ==========
+# 本番 / test / verify を1プロセス・1つのワーカープールで扱う（backend/tenants.py）。
+# TENANTS（JSON か "名前=root,..."）で上書き、DEFAULT_TENANT で既定を選ぶ
+from backend.tenants import Tenant, TenantMiddleware, TenantRegistry, parse_tenants
+
+_DEFAULT_TENANTS = {
+    "prod": {"root": "/home/ec2-user/project_3d_four_game"},
+    "test": {"root": "/home/ec2-user/project_3d_four_game_test"},
+    "verify": {"root": "/home/ec2-user/project_3d_four_game_verify"},
+}
+
+
+def _load_tenants() -> TenantRegistry:
+    cfg = parse_tenants(os.environ.get("TENANTS", "")) or _DEFAULT_TENANTS
+    default = os.environ.get("DEFAULT_TENANT") or next(iter(cfg))
+    tenants = {}
+    for name, kw in cfg.items():
+        kw = dict(kw)
+        if name == default:
+            # 単一テナント時代の環境変数は既定のテナントに効かせる
+            for key, env in (
+                ("user_db", "USER_DB"),
+                ("match_db", "MATCH_DB"),
+                ("snapshot_dir", "SNAPSHOT_DIR"),
+            ):
+                if key not in kw and os.environ.get(env):
+                    kw[key] = os.environ[env]
+        tenants[name] = Tenant(name, **kw)
+    return TenantRegistry(tenants, default)
+
+
+TENANTS = _load_tenants()
+
+
+def _tenant_framework(t: Optional[Tenant]) -> Optional[str]:
+    """テナントの framework.py の場所（無ければ None = ワーカーの既定）"""
+    if t and os.path.isfile(os.path.join(t.framework_dir, "framework.py")):
+        return t.framework_dir
+    return None
+
+
+def _framework_for(algo_path: str) -> Optional[str]:
+    """提出が属するテナントの framework.py の場所（無ければワーカーの既定）"""
+    return _tenant_framework(TENANTS.for_path(algo_path))
+
+
 # ========== FastAPI ==========
 app = FastAPI()
 
@@ -67,6 +117,9 @@ app.mount(
 )
 app.mount("/static", StaticFiles(directory=BASE_DIR / "frontend/static"), name="static")
 
+# テナントの判定（/t/<名前>/... または X-Tenant）。CORS より内側
+app.add_middleware(TenantMiddleware, registry=TENANTS)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -77,9 +130,12 @@ app.add_middleware(
 )
 
 # 追加ルーター（リポジトリクローン等）
+from main_server.clone_repo import on_cloned as clone_hooks
 from main_server.clone_repo import router as clone_router
+from main_server.clone_repo import set_base_dir as set_clone_base_dir
 
 app.include_router(clone_router)
+set_clone_base_dir(lambda: TENANTS.now().clone_dir)
 
 
 # ========== ユーティリティ ==========
@@ -90,46 +146,17 @@ def load_algo_module_flexible(algo: str):
       - *.py へのパス
       - ディレクトリ（中の main.py）
       - 別名（BASE_DIR/別名/main.py）
-    に対応。さらに実行時だけ当該ディレクトリを sys.path に追加して相対インポートを通す。
+    に対応（解決は検証と共通の _resolve_entry）。
+    さらに実行時だけ当該ディレクトリを sys.path に追加して相対インポートを通す。
     """
     if not algo or not str(algo).strip():
         raise HTTPException(status_code=400, detail="algorithmPath が空です")
 
-    s = str(algo).strip().replace("\\", "/")
-    p = Path(s)
-    tried = []
-
-    if p.suffix.lower() == ".py":
-        tried.append(str(p))
-        target = p if p.exists() else None
-        mod_dir = p.parent if target else None
-    else:
-        target = None
-        mod_dir = None
-        if p.is_absolute():
-            cand = p / "main.py"
-            tried.append(str(cand))
-            if cand.exists():
-                target = cand
-                mod_dir = cand.parent
-        else:
-            cand1 = BASE_DIR / p / "main.py"
-            tried.append(str(cand1))
-            if cand1.exists():
-                target = cand1
-                mod_dir = cand1.parent
-            if target is None and p.suffix.lower() == ".py":
-                cand2 = BASE_DIR / p
-                tried.append(str(cand2))
-                if cand2.exists():
-                    target = cand2
-                    mod_dir = cand2.parent
-
-    if target is None:
-        raise HTTPException(
-            status_code=400,
-            detail=f"[resolve_algo] 'main.py' が見つかりません。候補: {tried}",
-        )
+    try:
+        target = Path(_resolve_entry(algo))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=400, detail=f"[resolve_algo] {e}")
+    mod_dir = target.parent
 
     mod_name = f"algo_{uuid4().hex}"
     spec = importlib.util.spec_from_file_location(mod_name, str(target))
@@ -253,40 +280,7 @@ def generate_game_id(length: int = 32) -> str:
 
 
 # ========== 3D四目判定（統一版） ==========
-def generate_lines() -> List[List[Tuple[int, int, int]]]:
-    directions = [
-        (1, 0, 0),
-        (0, 1, 0),
-        (0, 0, 1),
-        (1, 1, 0),
-        (1, -1, 0),
-        (1, 0, 1),
-        (1, 0, -1),
-        (0, 1, 1),
-        (0, 1, -1),
-        (1, 1, 1),
-        (1, 1, -1),
-        (1, -1, 1),
-        (-1, 1, 1),
-    ]
-    lines: List[List[Tuple[int, int, int]]] = []
-    for x in range(4):
-        for y in range(4):
-            for z in range(4):
-                for dx, dy, dz in directions:
-                    line: List[Tuple[int, int, int]] = []
-                    for i in range(4):
-                        nx, ny, nz = x + dx * i, y + dy * i, z + dz * i
-                        if 0 <= nx < 4 and 0 <= ny < 4 and 0 <= nz < 4:
-                            line.append((nx, ny, nz))
-                        else:
-                            break
-                    if len(line) == 4:
-                        lines.append(line)
-    return lines
-
-
-LINES = generate_lines()
+# LINES（およびセル→ライン索引・check_win_at）は backend.game_logic と共通
 
 
 def check_win_with_positions(board: List[List[List[int]]], player: int):
@@ -323,62 +317,65 @@ def place_disk(board: List[List[List[int]]], x: int, y: int, player: int) -> boo
     return False
 
 
-def _fmt_fail(kind: str, fe: str) -> str:
-    """
-    kind: 'timeout' | 'abnormal' | 'invalid'
-    fe  : 強制配置した座標（例: '(0, 0)'）
-    """
-    MAP = {
-        "timeout": "時間内に応答しなかったため、{fe}に強制配置",
-        "abnormal": "異常終了したため、 {fe}に強制配置",
-        "invalid": "無効座標を返したため、 {fe}に強制配置",
-    }
-    tpl = MAP.get(kind, "{fe}")
-    return tpl.replace("{fe}", fe)
-
-
-# ==== 追加（import群の下あたり）====
-class InvalidMoveError(ValueError):
-    """無効座標指定（形式不正・範囲外など）"""
-
-    pass
-
-
-class AISubprocessTimeout(TimeoutError):
-    """タイムアウト"""
+from backend.events import GameEventHub
+from backend.match_store import MatchStore
+from backend.registry import GameRegistry
 
-    pass
+# ゲーム箱・1手の適用ルール・失敗メッセージ（3分類）はトーナメントと共通
+from backend.game import Clock, Game, apply_step, move_budget, fmt_fail as _fmt_fail
 
+# 持ち時間制で、ワーカー起動・ロード・通信のぶんタイムアウトに足す猶予（秒）
+CLOCK_OVERHEAD = float(os.environ.get("CLOCK_OVERHEAD", "0.5"))
 
-class AISubprocessCrashed(RuntimeError):
-    """処理異常終了（非ゼロ終了コードなど）"""
+# ==== 例外（3分類）はワーカープールと共通 ====
+from backend.worker_pool import (
+    AISubprocessCrashed,
+    AISubprocessTimeout,
+    InvalidMoveError,
+    WorkerPool,
+    failure_kind,
+)
 
-    pass
+# ==== メトリクス（/metrics） ====
+from backend.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from backend.metrics import Gauge, MetricsRegistry, MoveMetrics
+
+METRICS = MetricsRegistry()
+MOVE_METRICS = MoveMetrics(METRICS)
+
+# 提出ごとの常駐ワーカー（1手ごとのプロセス起動をやめる）
+WORKER_POOL = WorkerPool(
+    WORKER_PATH,
+    max_moves=int(os.environ.get("WORKER_POOL_MAX_MOVES", "200")),
+    max_idle_per_key=int(os.environ.get("WORKER_POOL_IDLE", "2")),
+    use_zygote=os.environ.get("WORKER_ZYGOTE", "1") != "0",
+    metrics=MOVE_METRICS,
+    framework_for=_framework_for,
+    code_cache_mb=float(os.environ.get("WORKER_CODE_CACHE_MB", "64")),
+    # セッションモードの専用ワーカーの総数（超えたら古いものから落とす）
+    max_sessions=int(os.environ.get("WORKER_SESSIONS_MAX", "256")),
+)
 
 
-# ---- 失敗メッセージ（3分類）を絶対にこの3文だけにする共通フォーマッタ ----
-def _fmt_fail(kind: str, fe: str) -> str:
-    """
-    kind: 'timeout' | 'abnormal' | 'invalid'
-    fe  : 強制配置した座標（例: '(0, 0)'）
-    """
-    MAP = {
-        "timeout": "時間内に応答しなかったため、{fe}に強制配置",
-        "abnormal": "異常終了したため、 {fe}に強制配置",
-        "invalid": "無効座標を返したため、 {fe}に強制配置",
-    }
-    return MAP.get(kind, "{fe}").replace("{fe}", fe)
+@app.on_event("shutdown")
+def _close_worker_pool():
+    WORKER_POOL.close()
 
 
 # ==== 置き換え（寛容版：失敗でもフォールバックして reason を返す）====
 from typing import Tuple, Optional
 
 
+def _fallback_move(kind: str, board) -> Tuple[int, int, Optional[str]]:
+    x, y = _first_empty_xy(board) or (0, 0)
+    return (x, y, _fmt_fail(kind, f"({x}, {y})"))
+
+
 def run_get_move_subprocess(
     algo_path: str, board: list, timeout: float = 29.0
 ) -> Tuple[int, int, Optional[str]]:
     """
-    子プロセスで get_move を実行し (x, y) を返す。
+    常駐ワーカーで get_move を実行し (x, y) を返す。
     失敗時も対戦を止めず、左上(y→x)の空きセルにフォールバックして
     下記3分類のいずれかの定型文だけを reason に入れて返す。
 
@@ -386,85 +383,98 @@ def run_get_move_subprocess(
       - abnormal : 「異常終了したため、 (x, y)に強制配置」
       - invalid  : 「無効座標を返したため、 (x, y)に強制配置」
     """
-    py = sys.executable
-    p = subprocess.Popen(
-        [py, str(WORKER_PATH), algo_path],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        start_new_session=True,
-    )
     try:
-        out, err = p.communicate(json.dumps(board), timeout=timeout)
-    except subprocess.TimeoutExpired:
-        # ---- タイムアウト → 座標を決めて定型文のみ ----
-        try:
-            p.kill()
-            p.wait(timeout=0.5)
-        except Exception:
-            pass
-        x, y = _first_empty_xy(board) or (0, 0)
-        return (x, y, _fmt_fail("timeout", f"({x}, {y})"))
-
-    # ---- 非ゼロ終了コード = 処理異常終了（詳細は出さない）----
-    if p.returncode != 0:
-        x, y = _first_empty_xy(board) or (0, 0)
-        return (x, y, _fmt_fail("abnormal", f"({x}, {y})"))
-
-    # ---- 正常終了：出力の形式/範囲を検証。失敗は「invalid」に統一 ----
-    try:
-        move = json.loads(out or "{}")
-        x, y = int(move["x"]), int(move["y"])
-        if not (0 <= x < 4 and 0 <= y < 4):
-            raise InvalidMoveError(f"out of range: ({x}, {y})")
+        x, y = run_get_move_subprocess_strict(
+            _submission_path(algo_path), board, timeout=timeout
+        )
         return (x, y, None)
-    except Exception:
-        x, y = _first_empty_xy(board) or (0, 0)
-        return (x, y, _fmt_fail("invalid", f"({x}, {y})"))
+    except AISubprocessTimeout:
+        return _fallback_move("timeout", board)
+    except AISubprocessCrashed:
+        return _fallback_move("abnormal", board)
+    except InvalidMoveError:
+        return _fallback_move("invalid", board)
 
 
 # ==== 置き換え（厳格版：失敗は例外で上位に伝える）====
 def run_get_move_subprocess_strict(
-    algo_path: str, board: list, timeout: float = 29.0
+    algo_path: str,
+    board: list,
+    timeout: float = 29.0,
+    usage: Optional[dict] = None,
+    context: Optional[dict] = None,
+    session=None,
+    label: Optional[str] = None,
 ) -> tuple[int, int]:
-    py = sys.executable
-    p = subprocess.Popen(
-        [py, str(WORKER_PATH), algo_path],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        start_new_session=True,
+    # ① タイムアウト / ② 処理異常終了 / ③ 形式・範囲不正 はプール側で例外に分類済み
+    # algo_path はそのまま読む（スナップショットへの差し替えは呼び出し側で1回だけ）
+    return WORKER_POOL.get_move(
+        algo_path,
+        board,
+        timeout,
+        usage=usage,
+        context=context,
+        session=session,
+        label=label,
     )
-    try:
-        out, err = p.communicate(json.dumps(board), timeout=timeout)
-    except subprocess.TimeoutExpired:
-        try:
-            p.kill()
-            p.wait(timeout=0.5)
-        except Exception:
-            pass
-        # ① タイムアウト
-        raise AISubprocessTimeout("timeout")
 
-    # ② 処理異常終了（詳細は上位で使わないため固定文言でOK）
-    if p.returncode != 0:
-        raise AISubprocessCrashed("abnormal")
 
-    # ③ 正常終了でも (x,y) の形式・範囲を厳格に検証 → 不正は invalid 扱い
+# ==== asyncio 版（エンドポイント用：思考中もスレッドを塞がない）====
+async def run_get_move_async(
+    algo_path: str,
+    board: list,
+    timeout: float = 29.0,
+    usage: Optional[dict] = None,
+    context: Optional[dict] = None,
+    label: Optional[str] = None,
+) -> Tuple[int, int, Optional[str]]:
+    """
+    run_get_move_subprocess の asyncio 版（失敗時は同じ定型文でフォールバック）。
+    label を渡すと、その algo ラベルで /metrics に手と失敗を数える。
+    """
     try:
-        move = json.loads(out or "{}")
-        x = int(move.get("x"))
-        y = int(move.get("y"))
-        if not (0 <= x < 4 and 0 <= y < 4):
-            raise InvalidMoveError(f"move out of range: ({x}, {y})")
-        return (x, y)
-    except InvalidMoveError:
-        raise
-    except Exception as e:
-        # キー欠落/型不正/JSON不正などもここに寄せる
-        raise InvalidMoveError(f"invalid move: {e}")
+        x, y = await run_get_move_async_strict(
+            algo_path,
+            board,
+            timeout=timeout,
+            usage=usage,
+            context=context,
+            label=label,
+        )
+        return (x, y, None)
+    except (AISubprocessTimeout, AISubprocessCrashed, InvalidMoveError) as e:
+        kind = failure_kind(e)
+        if label is not None:
+            MOVE_METRICS.fail(label, kind)
+        return _fallback_move(kind, board)
+
+
+async def run_get_move_async_strict(
+    algo_path: str,
+    board: list,
+    timeout: float = 29.0,
+    usage: Optional[dict] = None,
+    context: Optional[dict] = None,
+    session=None,
+    label: Optional[str] = None,
+) -> tuple[int, int]:
+    """
+    run_get_move_subprocess_strict の asyncio 版。キャンセル時はワーカーを kill。
+    usage に dict を渡すと実測値（wall_ms / cpu_ms / max_rss_kb など）が入る。
+    context（持ち時間 time_left など）はワーカーへそのまま渡す。
+    session（Game.session_for）を渡すとその専用ワーカーで実行する。
+    algo_path はそのまま読む（対局中は Game.pin_algo で固定したパスを渡す）。
+    label は /metrics の algo ラベル（_algo_label）。
+    """
+    return await WORKER_POOL.get_move_async(
+        algo_path,
+        board,
+        timeout,
+        usage=usage,
+        context=context,
+        session=session,
+        label=label,
+    )
 
 
 # ========== グローバル（/board, /reset 用の簡易ボード） ==========
@@ -490,6 +500,20 @@ class AutoStepBody(BaseModel):
     timeLimit: Optional[float] = None
 
 
+class RunBody(AutoStepBody):
+    stream: bool = False  # True なら1手ごとに NDJSON で流す
+
+
+class ClockIn(BaseModel):
+    initial: float  # 1人あたりの持ち時間（秒）
+    increment: float = 0.0  # 1手ごとの加算（秒）
+
+
+class NewGameIn(BaseModel):
+    clock: Optional[ClockIn] = None  # 未指定なら従来どおり1手ごとの timeLimit
+    session: bool = False  # True なら1局のあいだ AI ごとに同じワーカー（MyAI）を使う
+
+
 class NewGameOut(BaseModel):
     game_id: str
     state: dict
@@ -500,64 +524,150 @@ class MoveIn(BaseModel):
     y: int
 
 
-# ========== ゲーム箱 ==========
-class Game:
-    def __init__(self, board_size: int = 4):
-        self.board = create_board()  # 3D初期化
-        self.current_player = 1
-        self.game_over = False
-        self.move_count = 0
-
-    def state_dict(self):
-        return {
-            "board": copy.deepcopy(self.board),
-            "current_player": self.current_player,
-            "game_over": self.game_over,
-            "move_count": self.move_count,
-        }
+# ========== ゲームレジストリ ==========
+def _on_game_evicted(game_id: str, game: Game, reason: str) -> None:
+    logger.info("[games] evicted %s (%s)", game_id, reason)
+    game.close_sessions()
+    EVENTS.close(game_id)
 
-    def make_move(self, x: int, y: int):
-        if self.game_over:
-            return {"status": "finished", **self.state_dict()}
-
-        placed = place_disk(self.board, x, y, self.current_player)
-        if not placed:
-            return {"status": "invalid", **self.state_dict()}
-
-        self.move_count += 1
-        coords = check_win_with_positions(self.board, self.current_player)
-
-        if _really_won(self.board, self.current_player, coords):
-            self.game_over = True
-            winplayer: int = self.current_player
-            self.current_player = 3 - self.current_player
-            out = {
-                "status": "win",
-                "winner": winplayer,
-                "player": f"Player {winplayer}",
-                "winning_coords": coords,
-                **self.state_dict(),
-                "last_move": {"x": x, "y": y},
-            }
-            return out
-
-        if is_full(self.board):
-            state = self.state_dict()
-            state.update(
-                {
-                    "status": "draw",
-                    "last_move": {"x": x, "y": y},
-                }
-            )
-            return state
 
-        # 継続
-        self.current_player = 3 - self.current_player
-        return {"status": "ok", **self.state_dict(), "last_move": {"x": x, "y": y}}
+# アイドル TTL と最大件数を超えたゲームは追い出す（以降その ID は 404）
+games = GameRegistry(
+    max_games=int(os.environ.get("GAMES_MAX", "10000")),
+    idle_ttl=float(os.environ.get("GAMES_IDLE_TTL", "3600")),
+    on_evict=_on_game_evicted,
+)
 
 
-# ========== ゲームレジストリ ==========
-games: Dict[str, Game] = {}
+def _game(game_id: str) -> Game:
+    """リクエストのテナントで作られたゲーム（無い・別テナントのものなら 404）"""
+    game = games.get(game_id)
+    if game is None or game.tenant != TENANTS.current.get():
+        raise HTTPException(status_code=404, detail="Invalid game_id")
+    return game
+
+
+METRICS.register(
+    Gauge("games_active", "Games held in the registry.", lambda: [((), len(games))])
+)
+METRICS.register(
+    Gauge(
+        "games_evicted_total",
+        "Games evicted from the registry, by reason.",
+        lambda: [((r,), n) for r, n in games.evictions.items()],
+        ("reason",),
+        kind="counter",
+    )
+)
+METRICS.register(
+    Gauge(
+        "ai_workers_idle",
+        "Idle pooled AI workers.",
+        lambda: [((), WORKER_POOL.stats()["idle_workers"])],
+    )
+)
+
+
+async def _sweep_games_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            games.sweep()
+        except Exception:
+            logger.exception("games sweep failed")
+
+
+@app.on_event("startup")
+async def _start_games_sweeper():
+    interval = min(60.0, games.idle_ttl / 4) if games.idle_ttl > 0 else 60.0
+    app.state.games_sweeper = asyncio.create_task(_sweep_games_loop(interval))
+
+
+@app.on_event("shutdown")
+async def _stop_games_sweeper():
+    task = getattr(app.state, "games_sweeper", None)
+    if task:
+        task.cancel()
+
+
+def _state_response(game: Game, payload: dict) -> Response:
+    """
+    state_dict ベースの dict をそのまま JSON レスポンスにする。
+    board はキャッシュ済みの JSON 文字列を差し込むので deepcopy も pydantic も通らない。
+    """
+    return Response(content=_state_json(game, payload), media_type="application/json")
+
+
+def _state_json(game: Game, payload: dict) -> str:
+    rest = {k: v for k, v in payload.items() if k != "board"}
+    body = json.dumps(rest, ensure_ascii=False)
+    tail = "," + body[1:] if len(body) > 2 else "}"
+    return '{"board":' + game.board_json + tail
+
+
+# ========== 対局結果ストア ==========
+# テナントごとに1つ（既定のテナントは MATCH_DB で場所を変えられる）
+def _matches(tenant: Optional[Tenant] = None) -> MatchStore:
+    t = tenant or TENANTS.now()
+    return t.resource("matches", lambda: MatchStore(t.match_db))
+
+
+def _player_id(algo: Optional[str], tenant: Tenant) -> str:
+    """
+    対局結果に残す対局者。登録ユーザーの提出ならそのユーザー id（大会の記録と同じ）、
+    登録外はパスのまま、AI 未指定（人間）は "human"。/matches/standings はこの値で集計する
+    """
+    if not algo:
+        return "human"
+    users = _users(tenant)
+    u = users.by_path(algo)
+    if u is None:
+        try:
+            u = users.by_path(resolve_algo_path(algo))
+        except Exception:
+            u = None
+    return u.id if u is not None else algo
+
+
+def _record_game(game_id: str, game: Game, state: dict, source: str) -> None:
+    """終局した対局を1回だけ記録する（記録失敗で対局は止めない）"""
+    if game.recorded:
+        return
+    game.recorded = True
+    try:
+        tenant = TENANTS.get(game.tenant)
+        _matches(tenant).record(
+            source=source,
+            game_id=game_id,
+            player1=_player_id(game.players[1], tenant),
+            player2=_player_id(game.players[2], tenant),
+            status=state["status"],
+            winner=state.get("winner"),
+            moves=game.history,
+            started_at=game.started_at,
+            duration_ms=int((time.time() - game.started_at) * 1000),
+        )
+    except Exception:
+        logger.exception("match record failed")
+
+
+# ========== 観戦ストリーム（SSE） ==========
+EVENTS = GameEventHub()
+_MOVE_STATUSES = ("ok", "win", "draw")
+
+
+def _publish_move(
+    game_id: str, game: Game, state: dict, source: str = "manual"
+) -> None:
+    """手が適用されたときだけ購読者へ配信（JSON は1回だけ作る）。終局なら記録も"""
+    status = state.get("status")
+    games.touch(game_id)
+    if status in ("win", "draw"):
+        game.close_sessions()
+        _record_game(game_id, game, state, source)
+    if status in _MOVE_STATUSES and EVENTS.subscriber_count(game_id):
+        name = "move" if status == "ok" else "finish"
+        EVENTS.publish(game_id, name, _state_json(game, state))
 
 
 # ========== エンドポイント（グローバル簡易） ==========
@@ -584,56 +694,143 @@ def reset_board():
 
 
 # ========== エンドポイント（ゲームID制） ==========
+# レジストリと追い出し時の購読者通知はイベントループ上だけで触るので async にしておく
 @app.post("/games")
-def create_game():
+async def create_game(body: Optional[NewGameIn] = None):
+    clock, session = None, bool(body and body.session)
+    if body is not None and body.clock is not None:
+        try:
+            clock = Clock(body.clock.initial, body.clock.increment)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     game_id = str(uuid.uuid4())
-    games[game_id] = Game(4)
+    game = Game(4, clock=clock, session=session)
+    game.tenant = TENANTS.now().name
+    games[game_id] = game
     return {"game_id": game_id}
 
 
+@app.get("/stats")
+async def get_stats():
+    return {
+        "games": games.stats(),
+        "workers": WORKER_POOL.stats(),
+        "tenant": TENANTS.now().name,
+        "users": _users().stats(),
+    }
+
+
+@app.get("/tenants")
+def list_tenants():
+    return {
+        "default": TENANTS.default,
+        "current": TENANTS.now().name,
+        "tenants": [t.to_dict() for t in TENANTS.all()],
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/games/{game_id}")
-def get_state(game_id: str):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail="Invalid game_id")
-    return game.state_dict()
+async def get_state(game_id: str):
+    game = _game(game_id)
+    return _state_response(game, game.state_dict())
 
 
 @app.post("/games/{game_id}/move")
-def move(game_id: str, payload: MoveIn):
-    game = games.get(game_id)
-    if not game:
-        raise HTTPException(status_code=404, detail="Invalid game_id")
-    return game.make_move(payload.x, payload.y)
+async def move(game_id: str, payload: MoveIn):
+    game = _game(game_id)
+    state = game.make_move(payload.x, payload.y)
+    _publish_move(game_id, game, state)
+    return _state_response(game, state)
 
 
 @app.delete("/games/{game_id}")
-def delete_game(game_id: str):
-    if game_id in games:
-        del games[game_id]
-        return {"status": "deleted"}
-    raise HTTPException(status_code=404, detail="Invalid game_id")
+async def delete_game(game_id: str):
+    game = _game(game_id)
+    if games.pop(game_id) is not game:
+        raise HTTPException(status_code=404, detail="Invalid game_id")
+    game.close_sessions()
+    EVENTS.close(game_id)
+    return {"status": "deleted"}
+
+
+@app.get("/games/{game_id}/stream")
+async def stream_game(game_id: str, request: Request):
+    """
+    Server-Sent Events。接続直後に "state"、以降は手が適用されるたびに "move"
+    （終局手は "finish"）を送る。data は auto-step のレスポンスと同じ形。
+    終局またはゲーム削除（"end"）で閉じる。
+    """
+    game = _game(game_id)
+    q = EVENTS.subscribe(game_id)
+    first = _state_json(game, game.state_dict())
+
+    async def gen():
+        try:
+            yield f"event: state\ndata: {first}\n\n"
+            while True:
+                try:
+                    ev = await asyncio.wait_for(q.get(), 15.0)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": ping\n\n"  # 中継のアイドル切断よけ
+                    continue
+                if ev is None:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                name, data = ev
+                yield f"event: {name}\ndata: {data}\n\n"
+                if name == "finish":
+                    return
+        finally:
+            EVENTS.unsubscribe(game_id, q)
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/games/{game_id}/algo-move")
-def algo_move_for_game(game_id: str, req: AlgoMoveRequest):
+async def algo_move_for_game(game_id: str, req: AlgoMoveRequest):
     """
     ステップ実行用：AIが正常に (x, y) を返せたときだけ move を返す。
     タイムアウト/実行失敗時は座標を捏造せず HTTP エラーを返す。
     """
     try:
-        game = games.get(game_id)
-        if not game:
-            raise HTTPException(status_code=404, detail="Invalid game_id")
+        game = _game(game_id)
 
-        # エイリアス/パス解決
-        algo_path = req.algorithmPath or str(resolve_algo(req.player_id))
+        # エイリアス/パス解決（読む版はこの対局で最初に指したときのものに固定）
+        cp = game.current_player
+        raw_path = req.algorithmPath or str(resolve_algo(req.player_id))
+        algo_path = game.pin_algo(cp, raw_path, _submission_path)
 
         # 20秒思考AIに対応できるよう余裕を持ったタイムアウト
         # ※ ここを 25.0 にしておくと 20秒sleep でもOK
         # UIから送られてきた timeLimit を優先、未指定なら30秒
-        timeout = float(req.timeLimit or 30.0)
-        x, y, reason = run_get_move_subprocess(algo_path, req.board, timeout=timeout)
+        # 持ち時間制のゲームなら手番側の残り時間で打ち切り、考えた分を引く
+        time_limit = req.timeLimit or (None if game.clock else 30.0)
+        timeout, time_left = move_budget(game, cp, time_limit, CLOCK_OVERHEAD)
+        if timeout is None:
+            raise HTTPException(status_code=408, detail="AIタイムアウト: 持ち時間切れ")
+        usage: dict = {}
+        t = time.monotonic()
+        x, y, reason = await run_get_move_async(
+            algo_path,
+            req.board,
+            timeout=timeout,
+            usage=usage,
+            context=game.move_context(time_left if time_left is not None else timeout),
+            label=_algo_label(raw_path),
+        )
+        # タイムアウト時は応答が無いので経過時間（= 残り時間＋猶予）で使い切りになる
+        game.charge_clock(cp, None, time_left, usage, time.monotonic() - t)
 
         # 最低限のバリデーション（4x4）
         if not (0 <= x < 4 and 0 <= y < 4):
@@ -657,148 +854,151 @@ def algo_move_for_game(game_id: str, req: AlgoMoveRequest):
 
 # ========== /games/{id}/auto-step（AI vs AI を1手だけ進める） ==========
 @app.post("/games/{game_id}/auto-step")
-def auto_step_game(game_id: str, body: AutoStepBody):
+async def auto_step_game(game_id: str, body: AutoStepBody):
     try:
-        game = games.get(game_id)
-        if not game:
-            raise HTTPException(status_code=404, detail="Invalid game_id")
-        if game.game_over:
-            state = game.state_dict()
-            state.update({"status": "finished"})
-            return state
+        game = _game(game_id)
+        async with game.lock:
+            state = await _auto_step(game, body)
+        _publish_move(game_id, game, state, "auto")
+        return _state_response(game, state)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=400, detail=f"アルゴリズム実行中にエラー: {e}")
 
-        cp = game.current_player
-        raw_algo = body.player1 if cp == 1 else body.player2
 
-        # 失敗カテゴリ（None なら成功）
-        reason_kind: Optional[str] = None  # 'timeout' | 'abnormal' | 'invalid'
-        x = y = None
+async def _auto_step(game: Game, body: AutoStepBody) -> dict:
+    """AI の手番を1手だけ進め、レスポンス用の state dict を返す"""
+    if game.game_over:
+        state = game.state_dict()
+        state.update({"status": "finished"})
+        return state
+
+    cp = game.current_player
+    raw_algo = body.player1 if cp == 1 else body.player2
+    if game.players[cp] is None:
+        game.set_player(cp, raw_algo or None)
+    # 相手の版も最初の手で固定する（後手の初手までに再クローンされても替えない）
+    other = body.player2 if cp == 1 else body.player1
+    if other and game.pinned(3 - cp) is None:
+        game.pin_algo(3 - cp, resolve_algo_path(other), _submission_path)
+
+    # 失敗カテゴリ（None なら成功）
+    reason_kind: Optional[str] = None  # 'timeout' | 'abnormal' | 'invalid'
+    x = y = None
+    usage: dict = {}
+    t = time.monotonic()
+
+    # ★ UIから送られてきた timeLimit を優先。未指定なら30秒（持ち時間制なら上限なし）
+    time_limit = body.timeLimit or (None if game.clock else 30.0)
+    timeout, time_left = move_budget(game, cp, time_limit, CLOCK_OVERHEAD)
+    context = game.move_context(time_left if time_left is not None else timeout)
+
+    algo_id = resolve_algo_path(raw_algo) if raw_algo else None
+    label = _algo_label(algo_id)
+
+    # --- AI 実行 ---
+    if not raw_algo:
+        # AI 未指定は abnormal 扱い
+        reason_kind = "abnormal"
+    elif timeout is None:
+        # 持ち時間切れ：AI は呼ばずに強制配置
+        reason_kind = "timeout"
+    else:
+        # 読む版はこの対局で最初に指したときのものに固定（途中の再クローンで替えない）
+        algo_id_or_path = game.pin_algo(cp, algo_id, _submission_path)
+        try:
+            logger.info(
+                f"[auto-step] body.timeLimit={body.timeLimit}, timeout={timeout}"
+            )
+            x, y = await run_get_move_async_strict(
+                algo_id_or_path,
+                game.snapshot,
+                timeout=timeout,
+                usage=usage,
+                context=context,
+                session=game.session_for(cp, algo_id_or_path, WORKER_POOL),
+                label=label,
+            )
 
-        # --- AI 実行 ---
-        if not raw_algo:
-            # AI 未指定は abnormal 扱い
+        except AISubprocessTimeout:
+            reason_kind = "timeout"
+        except AISubprocessCrashed:
             reason_kind = "abnormal"
-        else:
-            algo_id_or_path = resolve_algo_path(raw_algo)
-            try:
-                # ★ UIで指定したtimeLimitを使う。未指定なら30秒。
-                # ★ UIから送られてきた timeLimit を優先。未指定なら30秒。
-                timeout = float(body.timeLimit or 30.0)
-                logger.info(
-                    f"[auto-step] body.timeLimit={body.timeLimit}, timeout={timeout}"
-                )
-                x, y = run_get_move_subprocess_strict(
-                    algo_id_or_path, game.board, timeout=timeout
-                )
+        except InvalidMoveError:
+            reason_kind = "invalid"
+
+    elapsed = time.monotonic() - t
+    think_ms = int(elapsed * 1000)
+    game.charge_clock(cp, reason_kind, time_left, usage, elapsed)
+    return apply_step(
+        game,
+        cp,
+        x,
+        y,
+        reason_kind,
+        think_ms=think_ms,
+        usage=usage or None,
+        on_failure=lambda kind: MOVE_METRICS.fail(label, kind),
+    )
 
-            except AISubprocessTimeout:
-                reason_kind = "timeout"
-            except AISubprocessCrashed:
-                reason_kind = "abnormal"
-            except InvalidMoveError:
-                reason_kind = "invalid"
 
-        # --- 座標のバリデーション（厳格）：範囲外は invalid へ寄せる ---
-        if reason_kind is None:
-            try:
-                if not (0 <= int(x) < 4 and 0 <= int(y) < 4):
-                    raise InvalidMoveError()
-                x, y = int(x), int(y)
-            except Exception:
-                reason_kind = "invalid"
-
-        # --- フォールバック座標の決定 ---
-        if reason_kind is not None:
-            fe = _first_empty_xy(game.board)
-            if fe is None:
-                # 置ける場所がない → 引き分け。その上で (0,0) を last_move に載せる
-                game.game_over = True
-                game.move_count += 1
-                state = game.state_dict()
-                state.update(
-                    {
-                        "status": "draw",
-                        "last_move": {"x": 0, "y": 0},
-                        "reason": _fmt_fail(reason_kind, "(0, 0)"),
-                    }
-                )
-                return state
-            x, y = fe  # 左上(y→x)の空きセル
-        # reason は最後にまとめて作る
-        reason = _fmt_fail(reason_kind, f"({x}, {y})") if reason_kind else None
-
-        # --- 実際に配置。指定列が満杯なら invalid として強制配置 ---
-        if not place_disk(game.board, x, y, cp):
-            placed = False
-            for yy in range(4):
-                for xx in range(4):
-                    if place_disk(game.board, xx, yy, cp):
-                        x, y = xx, yy
-                        placed = True
-                        break
-                if placed:
-                    break
-            if not placed:
-                # 本当に置けない → 引き分け（(0,0)で固定メッセージ）
-                game.game_over = True
-                game.move_count += 1
-                state = game.state_dict()
-                state.update(
-                    {
-                        "status": "draw",
-                        "last_move": {"x": 0, "y": 0},
-                        "reason": _fmt_fail(reason_kind or "invalid", "(0, 0)"),
-                    }
-                )
-                return state
-            # 列が満杯だったので invalid に寄せる（成功済みでもメッセージは invalid）
-            reason = _fmt_fail("invalid", f"({x}, {y})")
-
-        # --- 勝敗/継続の判定 ---
-        game.move_count += 1
-        coords = check_win_with_positions(game.board, cp)
-
-        if _really_won(game.board, cp, coords):
-            game.current_player = 3 - cp
-            state = game.state_dict()
-            state.update(
-                {
-                    "status": "win",
-                    "winner": cp,
-                    "player": f"Player {cp}",
-                    "winning_coords": coords,
-                    "last_move": {"x": x, "y": y},
-                }
-            )
-            if reason:
-                state["reason"] = reason
-            return state
-
-        if is_full(game.board):
-            state = game.state_dict()
-            state.update(
-                {
-                    "status": "draw",
-                    "last_move": {"x": x, "y": y},
-                }
-            )
-            if reason:
-                state["reason"] = reason
-            return state
+# ========== /games/{id}/run（AI vs AI を終局までサーバー側で進める） ==========
+def _move_event(state: dict, player: int) -> dict:
+    """auto-step の結果から1手分のイベントを取り出す"""
+    ev = {
+        "move_count": state.get("move_count"),
+        "player": player,
+        "status": state.get("status"),
+        "last_move": state.get("last_move"),
+    }
+    for k in ("reason", "usage", "winner", "winning_coords"):
+        if state.get(k) is not None:
+            ev[k] = state[k]
+    return ev
 
-        # 次手へ
-        game.current_player = 3 - cp
-        state = game.state_dict()
-        state.update(
-            {
-                "status": "ok",
-                "last_move": {"x": x, "y": y},
-            }
-        )
-        if reason:
-            state["reason"] = reason
-        return state
 
+async def _run_game(game_id: str, game: Game, body: AutoStepBody):
+    """終局まで _auto_step を繰り返し、(イベント, state) を1手ずつ返す"""
+    # 1手ごとに必ず石が置かれるか終局するので 64+1 回で打ち切れる
+    for _ in range(65):
+        cp = game.current_player
+        state = await _auto_step(game, body)
+        if state.get("status") != "ok":
+            game.game_over = True
+            state["game_over"] = True
+        _publish_move(game_id, game, state, "run")
+        yield _move_event(state, cp), state
+        if state.get("status") != "ok":
+            return
+
+
+@app.post("/games/{game_id}/run")
+async def run_game(game_id: str, body: RunBody):
+    """
+    auto-step と同じルール（タイムアウト・強制配置）で終局まで進める。
+    stream=false なら最終 state と moves を、true なら1手ごとの NDJSON を返す。
+    """
+    game = _game(game_id)
+
+    if body.stream:
+
+        async def gen():
+            async with game.lock:
+                async for ev, _ in _run_game(game_id, game, body):
+                    yield json.dumps(ev, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+    try:
+        moves = []
+        state = game.state_dict()
+        async with game.lock:
+            async for ev, state in _run_game(game_id, game, body):
+                moves.append(ev)
+        state["moves"] = moves
+        return _state_response(game, state)
     except HTTPException:
         raise
     except Exception as e:
@@ -806,10 +1006,6 @@ def auto_step_game(game_id: str, body: AutoStepBody):
         raise HTTPException(status_code=400, detail=f"アルゴリズム実行中にエラー: {e}")
 
 
-USERFILE = "/home/ec2-user/project_3d_four_game/clone_algo/userlist.json"
-USERLOCK = USERFILE + ".lock"
-
-
 def _now():
     return datetime.now(timezone.utc).isoformat()
 
@@ -825,6 +1021,9 @@ class User(BaseModel):
     path: str = Field(min_length=1)  # クローンされたアルゴの dir か main.py
     createdAt: str
     updatedAt: str
+    validation: Optional[dict] = None  # 事前検証の結果（backend.validator）
+    snapshot: Optional[str] = None  # 対局で読む検証済みスナップショットのキー
+    rating: Optional[float] = None  # トーナメント結果によるレーティング（Elo）
 
 
 class UserStore(BaseModel):
@@ -833,13 +1032,14 @@ class UserStore(BaseModel):
     users: List[User] = Field(default_factory=list)
 
 
-def _read_store() -> UserStore:
-    if not os.path.exists(USERFILE):
+def _read_store(userfile: Optional[str] = None) -> UserStore:
+    userfile = userfile or TENANTS.now().userfile
+    if not os.path.exists(userfile):
         s = UserStore(version=1, updatedAt=_now(), users=[])
-        _write_store(s)
+        _write_store(s, userfile)
         return s
 
-    with open(USERFILE, "r", encoding="utf-8") as f:
+    with open(userfile, "r", encoding="utf-8") as f:
         raw = json.load(f)
 
     def pick_first(d: dict, keys):
@@ -872,15 +1072,28 @@ def _read_store() -> UserStore:
             )
             or ""
         )
-        uid = os.path.basename(os.path.normpath(path))
+        # 保存済みの id はそのまま（id の無い旧形式だけパスの末尾から作る）
+        uid = pick_first(u, ["id"]) or os.path.basename(os.path.normpath(path))
         created = u.get("createdAt") or now
         updated = u.get("updatedAt") or now
-        return User(id=uid, name=name, path=path, createdAt=created, updatedAt=updated)
+        validation = u.get("validation")
+        snapshot = u.get("snapshot")
+        rating = u.get("rating")
+        return User(
+            id=uid,
+            name=name,
+            path=path,
+            createdAt=created,
+            updatedAt=updated,
+            validation=validation if isinstance(validation, dict) else None,
+            snapshot=snapshot if isinstance(snapshot, str) and snapshot else None,
+            rating=rating if isinstance(rating, (int, float)) else None,
+        )
 
     if isinstance(raw, list):
         users = [_ensure_user(u) for u in raw if isinstance(u, dict)]
         store = UserStore(version=1, updatedAt=_now(), users=users)
-        _write_store(store)
+        _write_store(store, userfile)
         return store
 
     if isinstance(raw, dict):
@@ -898,23 +1111,23 @@ def _read_store() -> UserStore:
                     for u in raw["users"]
                 )
             ):
-                _write_store(store)
+                _write_store(store, userfile)
             return store
         else:
             user = _ensure_user(raw)
             store = UserStore(version=1, updatedAt=_now(), users=[user])
-            _write_store(store)
+            _write_store(store, userfile)
             return store
 
     # それでも想定外 → 空に修復
     s = UserStore(version=1, updatedAt=_now(), users=[])
-    _write_store(s)
+    _write_store(s, userfile)
     return s
 
 
 @app.get("/users", response_model=List[User])
 def list_users():
-    return _read_store().users
+    return _users().all()
 
 
 class CreateUserIn(BaseModel):
@@ -932,70 +1145,52 @@ def _canon_path(p: str) -> str:
 
 @app.post("/users", response_model=User)
 def create_user(body: CreateUserIn, response: Response):
-    # 読み込み（耐性版 _read_store が入ってる前提）
-    try:
-        store = _read_store()
-    except Exception as e:
-        logger.exception("read_store failed")
-        raise HTTPException(500, f"read_store failed: {e}")
-
     name = (body.name or "").strip()
     path = _canon_path(body.path)
     if not name or not path:  # ← 空は _canon_path で "" のままになる
         raise HTTPException(400, "name and path required")
     now = _now()
+    users = _users()
 
-    # 1) path 一致を最優先でアップサート
-    for i, u in enumerate(store.users):
-        upath = _canon_path(
-            getattr(u, "path", u.get("path") if isinstance(u, dict) else "")
-        )
-        if upath == path:
-            data = _to_dict(u)
+    with users.lock:
+        # 読み込み（初回だけファイルから。耐性版 _read_store）
+        try:
+            by_path = users.by_path(path)
+            by_name = None if by_path else users.by_name(name)
+        except Exception as e:
+            logger.exception("read_store failed")
+            raise HTTPException(500, f"read_store failed: {e}")
+
+        # 1) path 一致を最優先でアップサート
+        if by_path is not None:
+            data = _to_dict(by_path)
             data["name"] = name or data.get("name") or "noname"
             data["path"] = path
             data["updatedAt"] = now
-            store.users[i] = User(**data)
-            try:
-                _write_store(store)
-            except Exception as e:
-                logger.exception("write_store failed")
-                raise HTTPException(500, f"write_store failed: {e}")
             response.status_code = status.HTTP_200_OK
-            return store.users[i]
+            return users.put(User(**data), replace=by_path)
 
-    # 2) name 一致でもアップサート（path を最新に）
-    for i, u in enumerate(store.users):
-        uname = getattr(u, "name", u.get("name") if isinstance(u, dict) else "")
-        if (uname or "").strip() == name:
-            data = _to_dict(u)
+        # 2) name 一致でもアップサート（path を最新に）
+        if by_name is not None:
+            data = _to_dict(by_name)
+            if _canon_path(data.get("path")) != path:
+                data.update(_known_submission(path))
             data["path"] = path
             data["updatedAt"] = now
-            store.users[i] = User(**data)
-            try:
-                _write_store(store)
-            except Exception as e:
-                logger.exception("write_store failed")
-                raise HTTPException(500, f"write_store failed: {e}")
             response.status_code = status.HTTP_200_OK
-            return store.users[i]
-
-    # 3) どちらも無ければ新規作成
-    u = User(
-        id=f"usr_{os.urandom(6).hex()}",
-        name=name,
-        path=path,
-        createdAt=now,
-        updatedAt=now,
-    )
-    store.users.append(u)
-    try:
-        _write_store(store)
-    except Exception as e:
-        logger.exception("write_store failed")
-        raise HTTPException(500, f"write_store failed: {e}")
-    response.status_code = status.HTTP_201_CREATED
-    return u
+            return users.put(User(**data), replace=by_name)
+
+        # 3) どちらも無ければ新規作成
+        u = User(
+            id=f"usr_{os.urandom(6).hex()}",
+            name=name,
+            path=path,
+            createdAt=now,
+            updatedAt=now,
+            **_known_submission(path),
+        )
+        response.status_code = status.HTTP_201_CREATED
+        return users.put(u)
 
 
 class PatchUserIn(BaseModel):
@@ -1006,47 +1201,436 @@ class PatchUserIn(BaseModel):
 
 @app.patch("/users/{user_id}", response_model=User)
 def patch_user(user_id: str, body: PatchUserIn):
-    store = _read_store()
-    for i, u in enumerate(store.users):
-        if u.id == user_id:
-            data = _to_dict(u)
-            if body.name is not None:
-                data["name"] = body.name.strip()
-            if body.path is not None:
-                data["path"] = body.path.strip()
-            data["updatedAt"] = _now()
-            store.users[i] = User(**data)
-            _write_store(store)
-            return store.users[i]
-    from fastapi import HTTPException
-
-    raise HTTPException(404, "not found")
+    users = _users()
+    with users.lock:
+        u = users.get(user_id)
+        if u is None:
+            raise HTTPException(404, "not found")
+        data = _to_dict(u)
+        if body.name is not None:
+            data["name"] = body.name.strip()
+        if body.path is not None:
+            if _canon_path(body.path) != _canon_path(data.get("path")):
+                data.update(_known_submission(body.path))
+            data["path"] = body.path.strip()
+        data["updatedAt"] = _now()
+        return users.put(User(**data), replace=u)
 
 
 @app.delete("/users/{user_id}", status_code=204)
 def delete_user(user_id: str):
-    store = _read_store()
-    new_users = [u for u in store.users if u.id != user_id]
-    if len(new_users) == len(store.users):
-        from fastapi import HTTPException
-
+    if not _users().delete(user_id):
         raise HTTPException(404, "not found")
-    store.users = new_users
-    _write_store(store)
 
 
-def _write_store(store: UserStore):
-    with FileLock(USERLOCK, timeout=5):
+def _write_store(store: UserStore, userfile: Optional[str] = None):
+    userfile = userfile or TENANTS.now().userfile
+    with FileLock(userfile + ".lock", timeout=5):
         store.updatedAt = _now()
         data = json.dumps(_to_dict(store), ensure_ascii=False, indent=2)
-        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(USERFILE))
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(userfile))
         try:
             with os.fdopen(fd, "w", encoding="utf-8") as fp:
                 fp.write(data)
-            os.replace(tmp, USERFILE)
+            os.replace(tmp, userfile)
         finally:
             try:
                 if os.path.exists(tmp):
                     os.remove(tmp)
             except Exception:
                 pass
+
+
+# ==== メモリ常駐のユーザー一覧（/users はファイルを読まない） ====
+from backend.user_db import SqliteUserStore
+from backend.user_registry import UserRegistry
+
+
+def _user_registry(userfile: str, user_db: str = ""):
+    """
+    userlist.json を読み書きするのは _read_store / _write_store（形式の互換はそちら）。
+    user_db があれば SQLite 版（API は同じ）。
+    """
+    if user_db:
+        return SqliteUserStore(
+            user_db,
+            make=lambda d: User(**d),
+            dump=_to_dict,
+            canon=_canon_path,
+            migrate=lambda: (
+                _read_store(userfile).users if os.path.exists(userfile) else []
+            ),
+        )
+    return UserRegistry(
+        userfile,
+        load=lambda: _read_store(userfile).users,
+        save=lambda users: _write_store(
+            UserStore(version=1, updatedAt=_now(), users=users), userfile
+        ),
+        canon=_canon_path,
+        flush_delay=float(os.environ.get("USERS_FLUSH_DELAY", "0.2")),
+    )
+
+
+def _users(tenant: Optional[Tenant] = None):
+    """
+    テナントのユーザーストア（初回アクセスで作る）。
+    Tenant.user_db（既定のテナントは USER_DB）を指定すると SQLite 版
+    （初回に userlist.json から移行し、以後 JSON は使わない）。
+    """
+    t = tenant or TENANTS.now()
+    return t.resource("users", lambda: _user_registry(t.userfile, t.user_db))
+
+
+@app.on_event("shutdown")
+def _flush_users():
+    for t in TENANTS.all():
+        users = t.resources().get("users")
+        if users is not None:
+            users.close()
+
+
+# ========== 提出の事前検証とスナップショット ==========
+from backend.snapshots import SnapshotStore
+from backend.validator import resolve_submission, validate_submission
+
+# 空盤面での1手（起動・ロード込み）の上限秒数
+VALIDATE_TIMEOUT = float(os.environ.get("VALIDATE_TIMEOUT", "10"))
+
+
+def _snapshots(tenant: Optional[Tenant] = None) -> SnapshotStore:
+    """検証済みの版を凍結しておく場所（キー = コミットハッシュ）。対局はここから読む"""
+    t = tenant or TENANTS.now()
+    return t.resource("snapshots", lambda: SnapshotStore(t.snapshot_dir))
+
+
+# 入口（main.py の絶対パス）→ 直近の検証結果。
+# /clone は POST /users より先に走るので、ユーザー登録前の結果もここで持っておく
+VALIDATIONS: Dict[str, dict] = {}
+# 入口 → 対局で読むスナップショット内の入口（検証に通った版だけ）
+CURRENT_SNAPSHOT: Dict[str, str] = {}
+
+
+def _resolve_entry(path: str) -> str:
+    """提出の入口。対局（load_algo_module_flexible）と検証で同じ規則・同じ別名を使う"""
+    return resolve_submission(path, BASE_DIR, resolve_algo)
+
+
+def _entry_key(path: str) -> str:
+    try:
+        return _resolve_entry(path)
+    except FileNotFoundError:
+        return _canon_path(path)
+
+
+def _known_validation(path: str) -> Optional[dict]:
+    return VALIDATIONS.get(_entry_key(path))
+
+
+def _known_submission(path: str) -> dict:
+    """登録・パス変更時にユーザーへ写す検証結果とスナップショット"""
+    v = _known_validation(path)
+    ok = v is not None and v.get("status") == "ok"
+    return {"validation": v, "snapshot": v.get("snapshot") if ok else None}
+
+
+def _snapshot_entry(key: str, entry: str, tenant: Optional[Tenant] = None) -> str:
+    return os.path.join(_snapshots(tenant).path(key), os.path.basename(entry))
+
+
+def _user_algo_path(u: "User", tenant: Optional[Tenant] = None) -> str:
+    """対局で読むパス：検証済みスナップショットがあればその中の入口、無ければ登録パス"""
+    if _snapshots(tenant).exists(u.snapshot):
+        return _snapshot_entry(u.snapshot, _entry_key(u.path), tenant)
+    return u.path
+
+
+def _algo_label(algo_path: Optional[str]) -> str:
+    """/metrics の algo ラベル：ライブの入口（スナップショット＝版ごとに系列を増やさない）"""
+    return _entry_key(algo_path) if algo_path else "-"
+
+
+def _submission_path(algo_path: str) -> str:
+    """
+    ライブのクローン先を指すパスを、現在のスナップショットに差し替える。
+    スナップショットが無い（未検証・登録外・エイリアス）なら検証と同じ規則で解決した入口。
+    対局では Game.pin_algo から手番ごとに1回だけ呼ぶ（以後その対局は同じ版で指す）。
+    """
+    key = _entry_key(algo_path)
+    return CURRENT_SNAPSHOT.get(key, key)
+
+
+@app.on_event("startup")
+def _load_snapshot_index():
+    for t in TENANTS.all():
+        if not (os.path.exists(t.userfile) or os.path.exists(t.user_db)):
+            continue
+        try:
+            for u in _users(t).all():
+                if _snapshots(t).exists(u.snapshot):
+                    CURRENT_SNAPSHOT[_entry_key(u.path)] = _user_algo_path(u, t)
+        except Exception:
+            logger.exception("snapshot index load failed: %s", t.name)
+
+
+def _freeze(path: str, tenant: Tenant) -> Optional[Tuple[str, str]]:
+    """提出フォルダを凍結して (キー, スナップショット内の入口)。入口が無い・失敗なら None"""
+    try:
+        entry = _resolve_entry(path)
+    except FileNotFoundError:
+        return None
+    try:
+        key, _ = _snapshots(tenant).freeze(os.path.dirname(entry))
+    except OSError:
+        logger.exception("snapshot failed: %s", path)
+        return None
+    return key, _snapshot_entry(key, entry, tenant)
+
+
+def _is_current_snapshot(path: str, key: Optional[str], tenant: Tenant) -> bool:
+    """key が提出フォルダの今の版のスナップショットとして既にあるか"""
+    if not _snapshots(tenant).exists(key):
+        return False
+    try:
+        entry = _resolve_entry(path)
+    except FileNotFoundError:
+        return False
+    return _snapshots(tenant).key_for(os.path.dirname(entry)) == key
+
+
+def _run_validation(path: str, tenant: Tenant) -> dict:
+    """
+    凍結 → スナップショットを検証 → 結果を同じ入口を指すユーザー全員のレコードに書く。
+    通った版だけを対局用（User.snapshot）に切り替える。落ちた版では前の版を残す。
+    """
+    frozen = _freeze(path, tenant)
+    verdict = validate_submission(
+        WORKER_POOL, frozen[1] if frozen else path, VALIDATE_TIMEOUT, _resolve_entry
+    )
+    ok = verdict["status"] == "ok"
+    if frozen:
+        verdict["snapshot"] = frozen[0]
+    key = _entry_key(path)
+    VALIDATIONS[key] = verdict
+    if ok and frozen:
+        CURRENT_SNAPSHOT[key] = frozen[1]
+    logger.info(
+        "validated %s: %s %s %s",
+        key,
+        verdict["status"],
+        verdict.get("snapshot") or "",
+        verdict.get("error") or "",
+    )
+    users = _users(tenant)
+    changed = []
+    for u in users.all():
+        if _entry_key(u.path) == key:
+            data = _to_dict(u)
+            data["validation"] = verdict
+            if ok and frozen:
+                data["snapshot"] = frozen[0]
+            changed.append((u, User(**data)))
+    if changed:
+        users.put_many(changed)
+    return verdict
+
+
+def _validate_cloned(dest_path: str) -> Optional[dict]:
+    """クローンジョブの最後に呼ばれる（結果はジョブの result にも載る）"""
+    # ジョブのスレッドにはリクエストのテナントが無いので、クローン先の場所で決める
+    tenant = TENANTS.for_path(dest_path) or TENANTS.get(None)
+    try:
+        # 先頭が変わっていない（同じ版のスナップショットを検証済み）なら凍結も検証もしない
+        known = _known_validation(dest_path)
+        if known and _is_current_snapshot(dest_path, known.get("snapshot"), tenant):
+            return {"validation": known}
+        return {"validation": _run_validation(dest_path, tenant)}
+    except Exception:
+        logger.exception("validation failed: %s", dest_path)
+        return None
+
+
+clone_hooks.append(_validate_cloned)
+
+
+@app.post("/users/{user_id}/validate", response_model=User)
+def validate_user(user_id: str):
+    """手動での再検証（同期。結果を保存したユーザーを返す）"""
+    users = _users()
+    u = users.get(user_id)
+    if u is None:
+        raise HTTPException(404, "not found")
+    _run_validation(u.path, TENANTS.now())
+    return users.get(user_id) or u
+
+
+# ========== トーナメント ==========
+from backend.tournament import Tournament
+
+
+def _tournaments(tenant: Optional[Tenant] = None) -> Dict[str, Tournament]:
+    """テナントごとの大会一覧（メモリ上）"""
+    return (tenant or TENANTS.now()).resource("tournaments", dict)
+
+
+class TournamentIn(BaseModel):
+    userIds: Optional[List[str]] = None  # 未指定なら /users の全員
+    format: str = "round_robin"  # "round_robin" | "swiss"
+    rounds: Optional[int] = None  # スイス式のラウンド数
+    # 持ち時間制なら1手あたりの上限（null で上限なし）
+    timeLimit: Optional[float] = 30.0
+    concurrency: Optional[int] = None  # 同時対局数（未指定は CPU 数）
+    clock: Optional[ClockIn] = None  # 持ち時間制（全局の所要時間を見積もれる）
+    session: bool = False  # 1局のあいだ MyAI を生かしておく
+
+
+# ==== レーティング（Elo。トーナメントの対局ごとに更新） ====
+RATING_INITIAL = float(os.environ.get("RATING_INITIAL", "1500"))
+RATING_K = float(os.environ.get("RATING_K", "32"))
+
+
+def _update_ratings(id1: str, id2: str, score1: float, tenant: Tenant) -> None:
+    """score1 は先手から見た結果（勝ち 1 / 引き分け 0.5 / 負け 0）"""
+    users = _users(tenant)
+    with users.lock:
+        u1, u2 = users.get(id1), users.get(id2)
+        if u1 is None or u2 is None:
+            return
+        r1 = RATING_INITIAL if u1.rating is None else u1.rating
+        r2 = RATING_INITIAL if u2.rating is None else u2.rating
+        delta = RATING_K * (score1 - 1.0 / (1.0 + 10 ** ((r2 - r1) / 400.0)))
+        users.put_many(
+            [
+                (u1, User(**{**_to_dict(u1), "rating": round(r1 + delta, 1)})),
+                (u2, User(**{**_to_dict(u2), "rating": round(r2 - delta, 1)})),
+            ]
+        )
+
+
+def _record_tournament_match(t: Tournament, m: dict, tenant: Tenant) -> None:
+    """大会のスレッドから呼ばれる（リクエストのテナントは無いので引数で受け取る）"""
+    # 対局は別プロセスのプールで指しているので、/metrics には棋譜から数える
+    labels = {1: t.players[m["player1"]]["label"], 2: t.players[m["player2"]]["label"]}
+    for rec in m.get("moves") or []:
+        if "reason_kind" in rec:  # AI の手番
+            MOVE_METRICS.replay(
+                labels[rec["player"]], rec.get("usage"), rec.get("reason_kind")
+            )
+    if m.get("status") not in ("win", "draw"):
+        return
+    score1 = 0.5 if m["status"] == "draw" else (1.0 if m.get("winner") == 1 else 0.0)
+    try:
+        _update_ratings(m["player1"], m["player2"], score1, tenant)
+    except Exception:
+        logger.exception("rating update failed")
+    _matches(tenant).record(
+        source="tournament",
+        tournament_id=t.id,
+        player1=m["player1"],
+        player2=m["player2"],
+        status=m["status"],
+        winner=m.get("winner"),
+        moves=m.get("moves") or [],
+        started_at=m.get("started_at"),
+        duration_ms=m.get("duration_ms"),
+    )
+    # 記録済みの手順はメモリに残さない
+    m.pop("moves", None)
+
+
+@app.post("/tournaments", status_code=202)
+def create_tournament(body: TournamentIn):
+    tenant = TENANTS.now()
+    users = _users(tenant).all()
+    if body.userIds is not None:
+        wanted = set(body.userIds)
+        users = [u for u in users if u.id in wanted]
+    # 事前検証で弾かれた提出は枠に入れない（未検証の旧データはそのまま参加）
+    skipped = [u.id for u in users if (u.validation or {}).get("status") == "invalid"]
+    users = [u for u in users if u.id not in skipped]
+    # 開始時点のスナップショットで固定（大会中に /clone で更新されても変わらない）
+    players = [
+        {
+            "id": u.id,
+            "name": u.name,
+            "path": _user_algo_path(u, tenant),
+            "snapshot": u.snapshot,
+            "label": _algo_label(u.path),
+        }
+        for u in users
+    ]
+    try:
+        t = Tournament(
+            players,
+            format=body.format,
+            rounds=body.rounds,
+            time_limit=body.timeLimit,
+            concurrency=body.concurrency,
+            clock=(body.clock.initial, body.clock.increment) if body.clock else None,
+            overhead=CLOCK_OVERHEAD,
+            session=body.session,
+            framework_dir=_tenant_framework(tenant),
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    t.on_match_done = lambda t, m: _record_tournament_match(t, m, tenant)
+    _tournaments(tenant)[t.id] = t
+    t.start()
+    return {"tournament_id": t.id, "skipped": skipped}
+
+
+@app.get("/tournaments")
+def list_tournaments():
+    return [
+        {k: v for k, v in t.summary().items() if k not in ("matches", "standings")}
+        for t in _tournaments().values()
+    ]
+
+
+@app.get("/tournaments/{tournament_id}")
+def get_tournament(tournament_id: str):
+    t = _tournaments().get(tournament_id)
+    if not t:
+        raise HTTPException(404, "not found")
+    return t.summary()
+
+
+# ========== 対局結果の照会 ==========
+@app.get("/matches")
+def list_matches(
+    player: Optional[str] = None,
+    tournament: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+):
+    """新しい順の一覧（moves は含まない）。since/until は ISO8601"""
+    limit = max(1, min(int(limit), 500))
+    offset = max(0, int(offset))
+    total, items = _matches().query(
+        player=player,
+        tournament_id=tournament,
+        since=since,
+        until=until,
+        limit=limit,
+        offset=offset,
+    )
+    return {"total": total, "limit": limit, "offset": offset, "items": items}
+
+
+@app.get("/matches/standings")
+def match_standings(
+    tournament: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    return _matches().standings(tournament_id=tournament, since=since, until=until)
+
+
+@app.get("/matches/{match_id}")
+def get_match(match_id: str):
+    m = _matches().get(match_id)
+    if not m:
+        raise HTTPException(404, "not found")
+    return m
@@ -1,13 +1,40 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
-import os, shutil, subprocess
+import os, re, shutil, subprocess
+import logging, queue, threading, uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
 from urllib.parse import urlparse
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# クローン・最新化のあとにジョブの中で呼ぶ callable(dest_path)。
+# 事前検証などは main 側から登録する。dict を返せばジョブの result に足す
+on_cloned: List[Callable[[str], Optional[dict]]] = []
+
+# クローン置き場を返す callable()。リクエストの処理中に呼ぶので、
+# テナント（ステージ）ごとに置き場所を分けるときは main 側で set_base_dir する
+_base_dir: Callable[[], str] = lambda: "/home/ec2-user/project_3d_four_game/clone_algo/"
+
+def set_base_dir(resolver: Callable[[], str]):
+    global _base_dir
+    _base_dir = resolver
+
+# 同時に走らせる git の本数・待ち行列の上限・1ジョブの git の制限時間（秒）
+CLONE_WORKERS = int(os.environ.get("CLONE_WORKERS", "4"))
+CLONE_QUEUE_MAX = int(os.environ.get("CLONE_QUEUE_MAX", "200"))
+CLONE_TIMEOUT = float(os.environ.get("CLONE_TIMEOUT", "300"))
+# 終わったジョブを何件まで覚えておくか（古い順に忘れる）
+CLONE_JOBS_KEEP = int(os.environ.get("CLONE_JOBS_KEEP", "1000"))
 
 class CloneRequest(BaseModel):
     repo_url: str
 
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
 def _owner_repo_from_url(repo_url: str) -> tuple[str, str]:
     path = urlparse(repo_url).path.strip("/")       # e.g. "zen-inada/test-chappy-repo.git"
     parts = path.split("/")
@@ -20,62 +47,348 @@ def _owner_repo_from_url(repo_url: str) -> tuple[str, str]:
 def _is_git_repo(path: str) -> bool:
     return os.path.isdir(os.path.join(path, ".git"))
 
-def _run_in_repo(dest_path: str, *args: str):
-    # 環境によって対話プロンプトが出ないように
+# ========== ジョブ ==========
+class CloneJob:
+    """
+    1回分のクローン／最新化。status は queued → running → done | failed。
+    progress は git の進捗表示（"Receiving objects: 45%" など）から拾った段階と %。
+    """
+
+    def __init__(self, repo_url: str, dest_path: str):
+        self.id = uuid.uuid4().hex
+        self.repo_url = repo_url
+        self.dest_path = dest_path
+        self.status = "queued"
+        self.stage = "queued"
+        self.percent: Optional[int] = None
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.result: dict = {}
+        self.createdAt = _now()
+        self.startedAt: Optional[str] = None
+        self.finishedAt: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def set_stage(self, stage: str, percent: Optional[int] = None):
+        self.stage = stage
+        self.percent = percent
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "repo_url": self.repo_url,
+            "path": self.dest_path,
+            "status": self.status,
+            "progress": {"stage": self.stage, "percent": self.percent},
+            "message": self.message,
+            "error": self.error,
+            "result": self.result,
+            "createdAt": self.createdAt,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+        }
+
+_jobs: "OrderedDict[str, CloneJob]" = OrderedDict()
+_active: dict = {}  # dest_path → 未完了のジョブ（同じフォルダへの git を重ねない）
+_jobs_lock = threading.Lock()
+_queue: "queue.Queue[CloneJob]" = queue.Queue(maxsize=CLONE_QUEUE_MAX)
+_workers: List[threading.Thread] = []
+
+# "Receiving objects:  45% (9/20)" → ("Receiving objects", 45)
+_PROGRESS = re.compile(r"([A-Za-z][A-Za-z ]+):\s+(\d+)%")
+
+def _run_git(job: Optional[CloneJob], args, cwd: Optional[str] = None):
+    """
+    git を1本実行。stderr の進捗をジョブに反映し、失敗は CalledProcessError。
+    制限時間を超えたら kill して TimeoutExpired。
+    """
     env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
-    subprocess.run(args, check=True, cwd=dest_path, env=env)
+    proc = subprocess.Popen(
+        list(args), cwd=cwd, env=env,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    expired = threading.Event()
 
-def _update_existing_repo(dest_path: str):
-    # 既存フォルダを Git で最新化（ブランチ自動推測つき）
-    _run_in_repo(dest_path, "git", "fetch", "--all", "-p")
+    def _expire():
+        expired.set()
+        proc.kill()
 
+    timer = threading.Timer(CLONE_TIMEOUT, _expire)
+    timer.start()
+    tail: List[str] = []
+    try:
+        buf = b""
+        while True:
+            chunk = proc.stderr.read1(4096)
+            if not chunk:
+                break
+            buf += chunk
+            # 進捗は \r で上書きされるので \r と \n の両方で区切る
+            *lines, buf = re.split(rb"[\r\n]", buf)
+            for raw in lines:
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                m = _PROGRESS.search(line)
+                if m and job is not None:
+                    job.set_stage(m.group(1).strip().lower(), int(m.group(2)))
+                else:
+                    tail = (tail + [line])[-20:]
+        rc = proc.wait()
+    finally:
+        timer.cancel()
+        proc.stderr.close()
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(list(args), CLONE_TIMEOUT, stderr="\n".join(tail))
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, list(args), stderr="\n".join(tail))
+
+def _run_in_repo(dest_path: str, *args: str, job: Optional[CloneJob] = None):
+    # 環境によって対話プロンプトが出ないように（_run_git で GIT_TERMINAL_PROMPT=0）
+    _run_git(job, args, cwd=dest_path)
+
+def _git_output(args, cwd: Optional[str] = None) -> str:
+    """stdout が要る短い git（ls-remote / rev-parse）。失敗は CalledProcessError"""
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
     p = subprocess.run(
-        ["git", "rev-parse", "--abbrev-ref", "origin/HEAD"],
-        cwd=dest_path, capture_output=True, text=True
+        list(args), cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+        capture_output=True, text=True, timeout=CLONE_TIMEOUT,
     )
-    if p.returncode == 0 and p.stdout.strip().startswith("origin/"):
-        default_branch = p.stdout.strip().split("/", 1)[1]  # "main" など
-    else:
-        default_branch = "main"
+    if p.returncode != 0:
+        raise subprocess.CalledProcessError(p.returncode, list(args), stderr=p.stderr)
+    return p.stdout
+
+def _remote_head(repo_url: str) -> tuple[str, str]:
+    """
+    `git ls-remote --symref <url> HEAD` で (既定ブランチ, 先頭コミット) を得る。
+    何も取ってこないので、変更の有無はこれだけで分かる。
+    """
+    branch, sha = "main", None
+    for line in _git_output(["git", "ls-remote", "--symref", repo_url, "HEAD"]).splitlines():
+        ref, _, name = line.partition("\t")
+        if ref.startswith("ref: refs/heads/") and name == "HEAD":
+            branch = ref[len("ref: refs/heads/"):]
+        elif name == "HEAD":
+            sha = ref.strip()
+    if not sha:
+        raise subprocess.CalledProcessError(1, ["git", "ls-remote", repo_url], stderr="リモートにコミットがありません")
+    return branch, sha
 
+def _local_head(dest_path: str) -> Optional[str]:
     try:
-        _run_in_repo(dest_path, "git", "checkout", "-f", default_branch)
+        return _git_output(["git", "rev-parse", "HEAD"], cwd=dest_path).strip()
     except subprocess.CalledProcessError:
-        _run_in_repo(dest_path, "git", "checkout", "-f", "master")
-        default_branch = "master"
+        return None
+
+# ========== 共有オブジェクトキャッシュ ==========
+# 提出の多くは同じテンプレートの fork なので、オブジェクトは1つの bare リポジトリに集め、
+# 各クローンは objects/info/alternates でそこを参照する（クローン側にはほぼ何も溜まらない）。
+# CLONE_CACHE="" で無効。未指定ならクローン置き場の .objects.git
+# キャッシュ側は履歴を切らない（浅いリポジトリを alternates にすると、クローン側が
+# 親コミットを辿れず fetch に失敗する）。fork なら共通の履歴は転送されない
+# fetch は提出ごとに別の ref へ入れるので並列でよい（オブジェクトの書き込みと ref の更新は git 側で原子的）。
+# 直列にするのはキャッシュ自体の作成だけ
+_cache_lock = threading.Lock()
+
+def _cache_dir(base_dir: str) -> Optional[str]:
+    path = os.environ.get("CLONE_CACHE", os.path.join(base_dir, ".objects.git"))
+    return path or None
+
+def _ensure_cache(cache: str):
+    with _cache_lock:
+        if not os.path.isdir(os.path.join(cache, "objects")):
+            _git_output(["git", "init", "-q", "--bare", cache])
+            # 各クローンが参照しているオブジェクトを gc で消さない
+            _git_output(["git", "config", "gc.auto", "0"], cwd=cache)
+
+def _fetch_into_cache(job: CloneJob, cache: str, branch: str):
+    """提出の既定ブランチを refs/subs/<フォルダ名> として取り込む（他の fork と共有される分は転送されない）"""
+    ref = f"refs/subs/{os.path.basename(job.dest_path)}"
+    _ensure_cache(cache)
+    _run_git(job, [
+        "git", "fetch", "--no-tags", "--progress", job.repo_url, f"+refs/heads/{branch}:{ref}",
+    ], cwd=cache)
+
+def _link_cache(dest_path: str, cache: str):
+    alt = os.path.join(dest_path, ".git", "objects", "info", "alternates")
+    os.makedirs(os.path.dirname(alt), exist_ok=True)
+    with open(alt, "w", encoding="utf-8") as f:
+        f.write(os.path.join(os.path.abspath(cache), "objects") + "\n")
+
+def _update_existing_repo(dest_path: str, branch: str, job: Optional[CloneJob] = None):
+    # 既定ブランチだけを深さ1で取り、作業ツリーをそれに合わせる
+    _run_in_repo(
+        dest_path, "git", "fetch", "--depth", "1", "--no-tags", "--progress", "origin",
+        f"+refs/heads/{branch}:refs/remotes/origin/{branch}", job=job,
+    )
+    _run_in_repo(dest_path, "git", "checkout", "-f", "-B", branch, f"origin/{branch}", job=job)
+    _run_in_repo(dest_path, "git", "clean", "-fdx", job=job)  # 生成物や不要ファイルを掃除
 
-    _run_in_repo(dest_path, "git", "reset", "--hard", f"origin/{default_branch}")
-    _run_in_repo(dest_path, "git", "clean", "-fdx")  # 生成物や不要ファイルを掃除
+def _init_repo(dest_path: str, repo_url: str, branch: str, cache: Optional[str]):
+    _git_output(["git", "init", "-q", dest_path])
+    if cache:
+        _link_cache(dest_path, cache)
+    _git_output(["git", "remote", "add", "-t", branch, "origin", repo_url], cwd=dest_path)
 
-@router.post("/clone")
-async def clone_repo(req: CloneRequest):
+def _clone_or_update(job: CloneJob):
+    """ジョブスレッドで実行。リモートの先頭が手元と同じなら何もしない"""
+    dest_path = job.dest_path
+    job.set_stage("checking")
+    branch, remote_sha = _remote_head(job.repo_url)
+    job.result["branch"] = branch
+    job.result["commit"] = remote_sha
+
+    is_repo = _is_git_repo(dest_path)
+    if is_repo and _local_head(dest_path) == remote_sha:
+        job.result["unchanged"] = True
+        job.message = "✅ 変更なし（最新です）"
+        return
+
+    cache = _cache_dir(os.path.dirname(dest_path))
+    if cache:
+        job.set_stage("caching")
+        _fetch_into_cache(job, cache, branch)
+
+    # 既存の場合は「中身を最新化」 or 「壊れてたら削除→クリーンクローン」
+    if is_repo:
+        try:
+            job.set_stage("fetching")
+            if cache:
+                _link_cache(dest_path, cache)
+            _update_existing_repo(dest_path, branch, job)
+            job.message = "♻️ 既存リポジトリを最新化しました"
+            return
+        except subprocess.CalledProcessError:
+            shutil.rmtree(dest_path, ignore_errors=True)
+    elif os.path.exists(dest_path):
+        shutil.rmtree(dest_path, ignore_errors=True)
+
+    # 新規クローン（浅い・既定ブランチのみ。オブジェクトはキャッシュから参照）
+    job.set_stage("cloning")
+    try:
+        _init_repo(dest_path, job.repo_url, branch, cache)
+        _update_existing_repo(dest_path, branch, job)
+    except subprocess.CalledProcessError:
+        shutil.rmtree(dest_path, ignore_errors=True)
+        raise
+    job.message = "✅ クローン完了"
+
+def _run_job(job: CloneJob):
+    job.status = "running"
+    job.startedAt = _now()
+    try:
+        _clone_or_update(job)
+        job.set_stage("validating")
+        for hook in on_cloned:
+            try:
+                extra = hook(job.dest_path)
+                if isinstance(extra, dict):
+                    job.result.update(extra)
+            except Exception:
+                logger.exception("on_cloned hook failed: %s", job.dest_path)
+        job.set_stage("done", 100)
+        job.status = "done"
+    except subprocess.TimeoutExpired as e:
+        job.status = "failed"
+        job.error = f"Git timed out after {int(CLONE_TIMEOUT)}s: {e.stderr or ''}".strip()
+    except subprocess.CalledProcessError as e:
+        job.status = "failed"
+        job.error = f"Git clone failed: {e}\n{e.stderr or ''}".strip()
+    except Exception as e:
+        logger.exception("clone job failed")
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finishedAt = _now()
+        with _jobs_lock:
+            if _active.get(job.dest_path) is job:
+                del _active[job.dest_path]
+
+def _worker_loop():
+    while True:
+        job = _queue.get()
+        try:
+            _run_job(job)
+        finally:
+            _queue.task_done()
+
+def _ensure_workers():
+    """git を走らせるスレッドは最初のジョブで CLONE_WORKERS 本だけ立てる（_jobs_lock 保持下）"""
+    while len(_workers) < max(1, CLONE_WORKERS):
+        t = threading.Thread(target=_worker_loop, name=f"clone-{len(_workers)}", daemon=True)
+        t.start()
+        _workers.append(t)
+
+def _forget_old_jobs():
+    """覚えておく件数を超えたら、終わったジョブから古い順に捨てる（_jobs_lock 保持下）"""
+    for jid in list(_jobs):
+        if len(_jobs) <= CLONE_JOBS_KEEP:
+            break
+        if _jobs[jid].finished:
+            del _jobs[jid]
+
+def submit_clone(repo_url: str, dest_path: str) -> CloneJob:
+    """
+    ジョブを積んで返す。同じフォルダのジョブが未完了ならそれを返す（重複させない）。
+    待ち行列が満杯なら HTTP 503。
+    """
+    with _jobs_lock:
+        running = _active.get(dest_path)
+        if running is not None:
+            return running
+        job = CloneJob(repo_url, dest_path)
+        try:
+            _queue.put_nowait(job)
+        except queue.Full:
+            raise HTTPException(status_code=503, detail="クローン待ちが満杯です。しばらくして再試行してください")
+        _active[dest_path] = job
+        _jobs[job.id] = job
+        _forget_old_jobs()
+        _ensure_workers()
+    return job
+
+@router.post("/clone", status_code=status.HTTP_202_ACCEPTED)
+def clone_repo(req: CloneRequest):
+    """クローン／最新化をジョブとして積み、すぐに job_id を返す（進捗は GET /clone/jobs/{id}）"""
     repo_url = req.repo_url.strip()
     if not repo_url.endswith(".git"):
         raise HTTPException(status_code=400, detail="URLが .git で終わっていません")
 
-    base_dir = "/home/ec2-user/project_3d_four_game/clone_algo/"
+    base_dir = _base_dir()
     os.makedirs(base_dir, exist_ok=True)
 
     owner, repo = _owner_repo_from_url(repo_url)
     folder_name = f"{owner}--{repo}"  # 例: zen-inada--test-chappy-repo
     dest_path = os.path.join(base_dir, folder_name)
 
-    # 既存の場合は「中身を最新化」 or 「壊れてたら削除→クリーンクローン」
-    if os.path.exists(dest_path):
-        if _is_git_repo(dest_path):
-            try:
-                _update_existing_repo(dest_path)
-                return {"message": "♻️ 既存リポジトリを最新化しました", "path": dest_path}
-            except subprocess.CalledProcessError:
-                shutil.rmtree(dest_path, ignore_errors=True)
-        else:
-            shutil.rmtree(dest_path, ignore_errors=True)
+    job = submit_clone(repo_url, dest_path)
+    return {
+        "message": "⏳ クローンを受け付けました",
+        "job_id": job.id,
+        "status": job.status,
+        "path": dest_path,
+    }
 
-    # 新規クローン（必要なら浅いクローンにしてもOK: "--depth", "1" を追加）
-    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
-    try:
-        subprocess.run(["git", "clone", repo_url, dest_path], check=True, env=env)
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Git clone failed: {e}")
+def _visible(job: CloneJob) -> bool:
+    """今の置き場所（テナント）のジョブだけ見せる"""
+    return os.path.dirname(job.dest_path) == os.path.normpath(_base_dir())
+
+@router.get("/clone/jobs")
+def list_clone_jobs():
+    with _jobs_lock:
+        jobs = [j for j in _jobs.values() if _visible(j)]
+    return {
+        "queued": _queue.qsize(),
+        "workers": max(1, CLONE_WORKERS),
+        "jobs": [j.to_dict() for j in reversed(jobs)],
+    }
 
-    return {"message": "✅ クローン完了", "path": dest_path}
\ No newline at end of file
+@router.get("/clone/jobs/{job_id}")
+def get_clone_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None or not _visible(job):
+        raise HTTPException(status_code=404, detail="not found")
+    return job.to_dict()
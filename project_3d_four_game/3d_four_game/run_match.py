@@ -1,54 +1,45 @@
 # run_match.py
 import requests # type: ignore
-import time
+import json
 
 BASE = "http://35.74.10.149:8000"
 # 例: 先手が ai2 の場合は入れ替える
 first = "ai1"  # ← コマンドライン引数や設定で指定できるようにする
 players = {1: "player1", 2: "player2"} if first == "ai1" else {1: "player2", 2: "player1"}
-
-def get_board():
-    r = requests.get(f"{BASE}/board")
-    r.raise_for_status()
-    return r.json()
-
-def make_move(x, y):
-    r = requests.post(f"{BASE}/move", params={"x": x, "y": y})
-    r.raise_for_status()
-    return r.json()
-
-def ask_algo(player_id, board):
-    r = requests.post(f"{BASE}/algo-move", json={"player_id": player_id, "board": board})
+# player_id → アルゴリズムのパス（/users の path と同じもの）
+algos = {
+    "player1": "/home/ec2-user/project_3d_four_game/clone_algo/player1",
+    "player2": "/home/ec2-user/project_3d_four_game/clone_algo/player2",
+}
+time_limit = 30.0
+
+def new_game():
+    r = requests.post(f"{BASE}/games")
     r.raise_for_status()
-    return r.json()["move"]
-
-def reset():
-    requests.post(f"{BASE}/reset")
+    return r.json()["game_id"]
 
 def run_match():
-    reset()
-    while True:
-        state = get_board()
-        if state["game_over"]:
-            print("✅ Game Over:", state)
-            break
-
-        board = state["board"]
-        current_player = state["current_player"]
-        player_id = players[current_player]
-
-        # アルゴで手を取得
-        move = ask_algo(player_id, board)
-        x, y = move["x"], move["y"]
-        print(f"🧠 Player {current_player}({player_id}) → x={x}, y={y}")
-
-        # 盤へ反映
-        result = make_move(x, y)
-        if result["status"] in ["win", "draw", "finished"]:
-            print("🎉 終了:", result)
-            break
-
-        time.sleep(0.05)  # ログ見やすく
+    # 1手ずつ HTTP で回さず、サーバー側で終局まで進めてもらう（NDJSON で逐次受信）
+    gid = new_game()
+    body = {
+        "player1": algos[players[1]],
+        "player2": algos[players[2]],
+        "timeLimit": time_limit,
+        "stream": True,
+    }
+    with requests.post(f"{BASE}/games/{gid}/run", json=body, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            ev = json.loads(line)
+            cp = ev["player"]
+            lm = ev.get("last_move") or {}
+            print(f"🧠 Player {cp}({players[cp]}) → x={lm.get('x')}, y={lm.get('y')}"
+                  + (f"  [{ev['reason']}]" if ev.get("reason") else ""))
+            if ev["status"] != "ok":
+                print("🎉 終了:", ev)
+    requests.delete(f"{BASE}/games/{gid}")
 
 if __name__ == "__main__":
     run_match()
@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+# `pytest` をどこから起動しても backend / main_server を import できるように
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 左上（y→x）から最初に置ける列を返す提出
+FIRST_EMPTY = """
+class MyAI:
+    def get_move(self, board):
+        for y in range(4):
+            for x in range(4):
+                if board[3][y][x] == 0:
+                    return (x, y)
+"""
+
+
+@pytest.fixture
+def submission(tmp_path):
+    """submission(名前, ソース) → main.py を書いた提出フォルダのパス"""
+
+    def make(name: str, source: str = FIRST_EMPTY) -> str:
+        d = tmp_path / name
+        d.mkdir(parents=True)
+        (d / "main.py").write_text(textwrap.dedent(source))
+        return str(d)
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """
+    テナント prod（既定）/ test を一時ディレクトリに置いた main と、その TestClient。
+    main はモジュールの読み込み時に設定を読むので、環境変数を先に決めてから import する。
+    """
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    root = tmp_path_factory.mktemp("tenants")
+    for name in ("prod", "test"):
+        (root / name / "clone_algo").mkdir(parents=True)
+    os.environ["TENANTS"] = json.dumps(
+        {name: {"root": str(root / name)} for name in ("prod", "test")}
+    )
+    for key in ("DEFAULT_TENANT", "USER_DB", "MATCH_DB", "SNAPSHOT_DIR"):
+        os.environ.pop(key, None)
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield main, client
@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+
+SLOW = """
+import time
+
+def get_move(board):
+    time.sleep(1.0)
+    return (0, 0)
+"""
+
+
+def _new_game(client, **body) -> str:
+    return client.post("/games", json=body or None).json()["game_id"]
+
+
+def test_ai_turn_does_not_block_other_requests(server, submission):
+    main, client = server
+    slow = submission("slow", SLOW)
+    gid = _new_game(client)
+    board = client.get(f"/games/{gid}").json()["board"]
+    out = {}
+
+    def think():
+        out["r"] = client.post(
+            f"/games/{gid}/algo-move",
+            json={"player_id": "x", "board": board, "algorithmPath": slow},
+        )
+
+    th = threading.Thread(target=think)
+    th.start()
+    time.sleep(0.3)
+    t = time.monotonic()
+    assert client.get(f"/games/{gid}").status_code == 200
+    assert client.get("/stats").status_code == 200
+    assert time.monotonic() - t < 0.5
+    th.join()
+    assert out["r"].json()["move"] == {"x": 0, "y": 0}
+
+
+def test_auto_steps_of_different_games_run_concurrently(server, submission):
+    main, client = server
+    slow = submission("slow", SLOW)
+    # 先にワーカーを温めて、起動時間を測定に混ぜない
+    main.WORKER_POOL.get_move(slow, main.create_board(), 10)
+    main.WORKER_POOL.get_move(slow, main.create_board(), 10)
+    gids = [_new_game(client) for _ in range(2)]
+    body = {"player1": slow, "player2": slow, "timeLimit": 5}
+    results = {}
+
+    def step(gid):
+        results[gid] = client.post(f"/games/{gid}/auto-step", json=body).json()
+
+    t = time.monotonic()
+    threads = [threading.Thread(target=step, args=(g,)) for g in gids]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert time.monotonic() - t < 1.9
+    assert all(
+        r["status"] == "ok" and r.get("reason") is None for r in results.values()
+    )
+
+
+def test_run_plays_to_the_end(server, submission):
+    main, client = server
+    algo = submission("first")
+    gid = _new_game(client)
+    r = client.post(f"/games/{gid}/run", json={"player1": algo, "player2": algo}).json()
+    assert r["status"] in ("win", "draw") and r["game_over"]
+    assert len(r["moves"]) == r["move_count"]
+    assert [m["player"] for m in r["moves"][:2]] == [1, 2]
+    # 終局後の auto-step は何もしない
+    again = client.post(
+        f"/games/{gid}/auto-step", json={"player1": algo, "player2": algo}
+    )
+    assert again.json()["status"] == "finished"
+
+
+def test_run_streams_one_line_per_move(server, submission):
+    main, client = server
+    algo = submission("first")
+    bad = submission("bad", "def get_move(board):\n    return (9, 9)\n")
+    gid = _new_game(client)
+    body = {"player1": algo, "player2": bad, "stream": True}
+    with client.stream("POST", f"/games/{gid}/run", json=body) as r:
+        events = [json.loads(line) for line in r.iter_lines() if line]
+    assert events[-1]["status"] in ("win", "draw")
+    assert all(e["status"] == "ok" for e in events[:-1])
+    assert all("無効座標" in e["reason"] for e in events if e["player"] == 2)
+    assert client.get(f"/games/{gid}").json()["move_count"] == len(events)
+
+
+def test_finished_games_are_recorded_under_the_player_id(server, submission):
+    main, client = server
+    algo = submission("registered")
+    other = submission("guest")
+    uid = client.post("/users", json={"name": "registered", "path": algo}).json()["id"]
+    gid = _new_game(client)
+    r = client.post(f"/games/{gid}/run", json={"player1": algo, "player2": other})
+    final = r.json()
+
+    listed = client.get("/matches", params={"player": uid}).json()
+    assert listed["total"] == 1
+    m = client.get(f"/matches/{listed['items'][0]['id']}").json()
+    assert (m["game_id"], m["player1"], m["player2"]) == (gid, uid, other)
+    assert m["status"] == final["status"] and len(m["moves"]) == final["move_count"]
+    # 順位表も同じ ID で集計される
+    players = {row["player"] for row in client.get("/matches/standings").json()}
+    assert uid in players and algo not in players
+    assert client.get("/matches/nope").status_code == 404
+
+
+def test_flagged_player_is_not_asked_for_a_move(server, submission):
+    main, client = server
+    slow = submission("slow", SLOW)
+    algo = submission("first")
+    gid = _new_game(client, clock={"initial": 0.5})
+    body = {"player1": slow, "player2": algo}
+    first = client.post(f"/games/{gid}/auto-step", json=body).json()
+    assert first["reason"].startswith("時間内に応答しなかった")
+    assert first["clock"]["remaining"]["1"] == 0
+    client.post(f"/games/{gid}/auto-step", json=body)
+    t = time.monotonic()
+    third = client.post(f"/games/{gid}/auto-step", json=body).json()
+    assert time.monotonic() - t < 0.5  # AI を呼ばずに強制配置
+    assert third["reason"].startswith("時間内に応答しなかった")
+    assert client.post("/games", json={"clock": {"initial": -1}}).status_code == 400
+
+
+def test_session_game_keeps_each_ai_alive_until_the_end(server, submission):
+    main, client = server
+    # 自分の手数で列を変える：毎手作り直されると同じ列に積み続けて満杯になる
+    counter = submission(
+        "counter",
+        """
+        class MyAI:
+            def __init__(self):
+                self.n = 0
+
+            def get_move(self, board):
+                self.n += 1
+                return ((self.n - 1) % 4, (self.n - 1) // 4 % 4)
+        """,
+    )
+    gid = _new_game(client, session=True)
+    body = {"player1": counter, "player2": counter}
+    r = client.post(f"/games/{gid}/run", json=body).json()
+    assert not any(m.get("reason") for m in r["moves"])
+    assert main.games.get(gid).sessions == {}
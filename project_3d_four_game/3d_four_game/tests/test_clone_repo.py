@@ -0,0 +1,200 @@
+import queue
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+from main_server import clone_repo
+
+GIT = ["git", "-c", "user.name=t", "-c", "user.email=t@example.com"]
+
+
+def _git(*args, cwd=None) -> str:
+    return subprocess.run(
+        GIT + list(args), cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """
+    remote(名前, {ファイル: 中身}, base=fork 元の URL) → ローカルの bare リポジトリの
+    file:// URL。同じ名前で呼び直すと、そのリポジトリにコミットを足して push する
+    """
+
+    def make(name, files=None, base=None):
+        work = tmp_path / "work" / name
+        if not work.exists():
+            if base:
+                _git("clone", "-q", base, str(work))
+            else:
+                work.mkdir(parents=True)
+                _git("init", "-q", "-b", "main", str(work))
+        for rel, text in (
+            files or {"main.py": "def get_move(b):\n    return (0, 0)\n"}
+        ).items():
+            (work / rel).write_text(text)
+        _git("add", "-A", cwd=work)
+        _git("commit", "-q", "-m", name, cwd=work)
+        bare = tmp_path / "remotes" / f"{name}.git"
+        if not bare.exists():
+            _git("clone", "-q", "--bare", str(work), str(bare))
+        else:
+            _git("push", "-q", str(bare), "HEAD:main", cwd=work)
+        return f"file://{bare}"
+
+    return make
+
+
+def _wait(job, timeout=30):
+    t = time.monotonic()
+    while not job.finished:
+        assert time.monotonic() - t < timeout, job.to_dict()
+        time.sleep(0.02)
+    return job
+
+
+def test_clone_runs_as_a_job(tmp_path, remote):
+    url = remote("algo")
+    dest = str(tmp_path / "clones" / "owner--algo")
+    job = clone_repo.submit_clone(url, dest)
+    assert clone_repo.submit_clone(url, dest) is job or job.finished
+    _wait(job)
+    assert job.status == "done", job.error
+    d = job.to_dict()
+    assert d["progress"] == {"stage": "done", "percent": 100}
+    assert d["result"]["branch"] == "main" and len(d["result"]["commit"]) == 40
+    assert (Path(dest) / "main.py").is_file()
+    # 終わったら同じフォルダへの次のジョブは別物
+    assert clone_repo.submit_clone(url, dest) is not job
+
+
+def test_failed_clone_reports_the_git_error(tmp_path):
+    job = _wait(
+        clone_repo.submit_clone(
+            f"file://{tmp_path}/missing.git", str(tmp_path / "clones" / "x")
+        )
+    )
+    assert job.status == "failed" and "Git clone failed" in job.error
+    assert not (tmp_path / "clones" / "x").exists()
+
+
+def test_on_cloned_hooks_add_to_the_result(tmp_path, remote, monkeypatch):
+    seen = []
+
+    def hook(path):
+        seen.append(path)
+        return {"validation": {"status": "ok"}}
+
+    monkeypatch.setattr(clone_repo, "on_cloned", [hook, lambda p: 1 / 0])
+    dest = str(tmp_path / "clones" / "owner--algo")
+    job = _wait(clone_repo.submit_clone(remote("algo"), dest))
+    assert job.status == "done"  # 失敗したフックはジョブを落とさない
+    assert seen == [dest] and job.result["validation"] == {"status": "ok"}
+
+
+def test_full_queue_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(clone_repo, "_queue", queue.Queue(maxsize=1))
+    # ワーカーを立てずに積むだけにする
+    monkeypatch.setattr(
+        clone_repo, "_workers", [None] * max(1, clone_repo.CLONE_WORKERS)
+    )
+    monkeypatch.setattr(clone_repo, "_active", {})
+    clone_repo.submit_clone("file:///a.git", str(tmp_path / "a"))
+    with pytest.raises(HTTPException) as e:
+        clone_repo.submit_clone("file:///b.git", str(tmp_path / "b"))
+    assert e.value.status_code == 503
+
+
+def test_clone_endpoint(server, remote, monkeypatch):
+    main, client = server
+    assert client.post("/clone", json={"repo_url": "https://x/y"}).status_code == 400
+    monkeypatch.setattr(
+        clone_repo, "_owner_repo_from_url", lambda url: ("owner", Path(url).stem)
+    )
+    r = client.post("/clone", json={"repo_url": remote("endpoint")})
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+    assert r.json()["path"].endswith("owner--endpoint")
+    t = time.monotonic()
+    while client.get(f"/clone/jobs/{job_id}").json()["status"] not in (
+        "done",
+        "failed",
+    ):
+        assert time.monotonic() - t < 30
+        time.sleep(0.05)
+    job = client.get(f"/clone/jobs/{job_id}").json()
+    assert job["status"] == "done", job["error"]
+    assert job_id in [j["id"] for j in client.get("/clone/jobs").json()["jobs"]]
+    assert client.get("/clone/jobs/nope").status_code == 404
+
+
+def _objects(dest) -> dict:
+    out = _git("count-objects", "-v", cwd=dest)
+    return dict(line.split(": ", 1) for line in out.splitlines())
+
+
+def test_clone_is_shallow_and_borrows_objects_from_the_cache(tmp_path, remote):
+    url = remote("algo")
+    remote("algo", {"main.py": "def get_move(b):\n    return (1, 1)\n"})
+    clones = tmp_path / "clones"
+    dest = str(clones / "owner--algo")
+    job = _wait(clone_repo.submit_clone(url, dest))
+    assert job.status == "done", job.error
+    # 作業用クローンは深さ1・オブジェクトはキャッシュ側
+    assert (Path(dest) / ".git" / "shallow").is_file()
+    assert _git("rev-list", "--count", "HEAD", cwd=dest) == "1"
+    alt = (Path(dest) / ".git" / "objects" / "info" / "alternates").read_text()
+    assert alt.strip() == str(clones / ".objects.git" / "objects")
+    objs = _objects(dest)
+    assert objs["count"] == "0" and objs["packs"] == "0"
+    # キャッシュは履歴を切らずに提出ごとの ref で持つ
+    cache = str(clones / ".objects.git")
+    assert _git("rev-parse", "refs/subs/owner--algo", cwd=cache) == job.result["commit"]
+    assert _git("rev-list", "--count", "refs/subs/owner--algo", cwd=cache) == "2"
+
+
+def test_unchanged_remote_is_not_fetched(tmp_path, remote, monkeypatch):
+    url = remote("algo")
+    dest = str(tmp_path / "clones" / "owner--algo")
+    _wait(clone_repo.submit_clone(url, dest))
+
+    def no_fetch(*a, **kw):
+        raise AssertionError("fetched")
+
+    monkeypatch.setattr(clone_repo, "_run_git", no_fetch)
+    job = _wait(clone_repo.submit_clone(url, dest))
+    assert job.status == "done" and job.result["unchanged"] is True
+
+
+def test_new_commit_updates_the_checkout(tmp_path, remote):
+    url = remote("algo")
+    dest = tmp_path / "clones" / "owner--algo"
+    _wait(clone_repo.submit_clone(url, str(dest)))
+    (dest / "junk.txt").write_text("left over")
+    remote("algo", {"main.py": "def get_move(b):\n    return (2, 2)\n"})
+    job = _wait(clone_repo.submit_clone(url, str(dest)))
+    assert job.status == "done", job.error
+    assert "unchanged" not in job.result
+    assert "(2, 2)" in (dest / "main.py").read_text()
+    assert not (dest / "junk.txt").exists()
+    assert _git("rev-parse", "HEAD", cwd=dest) == job.result["commit"]
+
+
+def test_forks_share_objects_in_the_cache(tmp_path, remote):
+    base = remote("template", {"main.py": "# " + "x" * 5000 + "\n"})
+    fork = remote("fork", {"extra.py": "y = 1\n"}, base=base)
+    clones = tmp_path / "clones"
+    for name, url in (("owner--template", base), ("owner--fork", fork)):
+        job = _wait(clone_repo.submit_clone(url, str(clones / name)))
+        assert job.status == "done", job.error
+    cache = str(clones / ".objects.git")
+    refs = _git("for-each-ref", "--format=%(refname)", "refs/subs", cwd=cache)
+    assert refs.splitlines() == ["refs/subs/owner--fork", "refs/subs/owner--template"]
+    # fork 側のクローンは何も持たず、共通の blob はキャッシュに1つだけ
+    assert _objects(str(clones / "owner--fork"))["count"] == "0"
+    blob = _git("rev-parse", "HEAD:main.py", cwd=str(clones / "owner--template"))
+    assert _git("cat-file", "-t", blob, cwd=cache) == "blob"
+    assert (clones / "owner--fork" / "main.py").read_text().startswith("# xxx")
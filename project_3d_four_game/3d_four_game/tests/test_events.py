@@ -0,0 +1,66 @@
+import asyncio
+import json
+import threading
+import time
+
+from backend.events import GameEventHub
+
+
+def test_publish_fans_out_and_close_ends_streams():
+    async def run():
+        hub = GameEventHub()
+        a, b = hub.subscribe("g"), hub.subscribe("g")
+        other = hub.subscribe("h")
+        hub.publish("g", "move", "{}")
+        assert a.get_nowait() == b.get_nowait() == ("move", "{}")
+        assert other.empty()
+        hub.unsubscribe("g", b)
+        hub.close("g")
+        assert a.get_nowait() is None
+        assert b.empty()
+        assert hub.subscriber_count() == 1
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_drops_oldest_event():
+    async def run():
+        hub = GameEventHub(max_queue=2)
+        q = hub.subscribe("g")
+        for i in range(3):
+            hub.publish("g", "move", str(i))
+        assert [q.get_nowait()[1] for _ in range(2)] == ["1", "2"]
+        hub.publish("g", "move", "3")
+        hub.publish("g", "move", "4")
+        hub.close("g")
+        assert q.get_nowait() == ("move", "4") and q.get_nowait() is None
+
+    asyncio.run(run())
+
+
+def test_stream_sends_state_then_moves_until_finish(server):
+    main, client = server
+    gid = client.post("/games").json()["game_id"]
+
+    def play():
+        # 購読が張られてから打つ
+        while not main.EVENTS.subscriber_count(gid):
+            time.sleep(0.01)
+        # 先手が y=0 の段を横に4つ並べて勝つ
+        for x, y in ((0, 0), (0, 1), (1, 0), (1, 1), (2, 0), (2, 1), (3, 0)):
+            client.post(f"/games/{gid}/move", json={"x": x, "y": y})
+
+    th = threading.Thread(target=play)
+    th.start()
+    events = []
+    with client.stream("GET", f"/games/{gid}/stream") as r:
+        name = None
+        for line in r.iter_lines():
+            if line.startswith("event: "):
+                name = line[len("event: ") :]
+            elif line.startswith("data: "):
+                events.append((name, json.loads(line[len("data: ") :])))
+    th.join()
+    assert [n for n, _ in events] == ["state"] + ["move"] * 6 + ["finish"]
+    assert events[-1][1]["status"] == "win"
+    assert main.EVENTS.subscriber_count(gid) == 0
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from backend.game import Clock, Game, move_budget
+
+
+def test_snapshot_is_cached_until_a_stone_is_placed():
+    g = Game()
+    snap = g.snapshot
+    assert g.snapshot is snap
+    assert g.board_json is g.board_json
+    g.make_move(0, 0)
+    assert g.snapshot is not snap
+    assert g.snapshot[0][0][0] == 1
+    assert json.loads(g.board_json) == g.board
+
+
+def test_snapshot_is_immutable_and_board_is_a_copy():
+    g = Game()
+    g.make_move(1, 2)
+    assert isinstance(g.snapshot, tuple)
+    b = g.board
+    b[0][2][1] = 0
+    assert g.board[0][2][1] == 1
+    assert "board" not in g.state_dict()
+
+
+def test_game_has_no_instance_dict():
+    g = Game()
+    assert not hasattr(g, "__dict__")
+    with pytest.raises(AttributeError):
+        g.extra = 1
+
+
+def test_history_round_trips_through_one_byte_per_move():
+    g = Game()
+    for x, y in ((3, 3), (3, 3), (0, 2), (3, 3)):
+        g.make_move(x, y)
+    assert len(g._moves) == 4
+    assert g.history == [
+        {"player": 1, "x": 3, "y": 3, "z": 0},
+        {"player": 2, "x": 3, "y": 3, "z": 1},
+        {"player": 1, "x": 0, "y": 2, "z": 0},
+        {"player": 2, "x": 3, "y": 3, "z": 2},
+    ]
+
+
+def test_make_move_rejects_full_and_out_of_range_columns():
+    g = Game()
+    for _ in range(4):
+        g.make_move(1, 1)
+    assert g.make_move(1, 1)["status"] == "invalid"
+    assert g.make_move(4, 0)["status"] == "invalid"
+    assert g.move_count == 4 and g.current_player == 1
+
+
+def test_clock_charges_and_adds_increment():
+    c = Clock(10, increment=2)
+    assert c.charge(1, 3) == 9
+    assert c.charge(2, -1) == 12  # 負の経過時間は 0 扱い
+    assert c.charge(1, 9) == 0 and c.flagged(1)
+    assert c.to_dict()["remaining"] == {"1": 0.0, "2": 12.0}
+    with pytest.raises(ValueError):
+        Clock(0)
+    with pytest.raises(ValueError):
+        Clock(5, increment=-1)
+
+
+def test_move_budget():
+    g = Game()
+    assert move_budget(g, 1, 30.0, 0.5) == (30.0, None)
+    g = Game(clock=Clock(10))
+    assert move_budget(g, 1, None, 0.5) == (10.5, 10)
+    assert move_budget(g, 1, 3.0, 0.5) == (3.5, 3.0)
+    g.clock.charge(1, 10)
+    assert move_budget(g, 1, 3.0, 0.5) == (None, 0.0)
+
+
+def test_charge_clock_prefers_think_time():
+    g = Game(clock=Clock(10))
+    g.charge_clock(1, None, 10, {"think_ms": 1500}, elapsed=4.0)
+    assert g.clock.remaining[1] == 8.5
+    g.charge_clock(2, "timeout", 3.0, None, elapsed=3.6)
+    assert g.clock.remaining[2] == 7.0
+    g.charge_clock(1, "abnormal", 8.5, None, elapsed=0.5)
+    assert g.clock.remaining[1] == 8.0
+    # 持ち時間なしなら何もしない
+    Game().charge_clock(1, None, None, {"think_ms": 1}, elapsed=1.0)
+
+
+def test_move_context():
+    g = Game(clock=Clock(10))
+    assert g.move_context(3.0) == {
+        "player": 1,
+        "move_number": 1,
+        "last_move": None,
+        "history": [],
+        "time_left": 3.0,
+        "clock_left": 10.0,
+    }
+    g.make_move(1, 2)
+    g.make_move(1, 2)
+    ctx = g.move_context(None)
+    assert ctx["history"] == [[1, 2, 0], [1, 2, 1]] and ctx["last_move"] == [1, 2, 1]
+    assert (ctx["player"], ctx["move_number"]) == (1, 3)
@@ -0,0 +1,104 @@
+import random
+
+from backend.game_logic import (
+    CELL_LINES,
+    LINES,
+    Bitboard,
+    check_win_at,
+    check_win_with_positions,
+    create_board,
+    place_disk,
+)
+
+
+def _random_game(seed, moves=64):
+    """リスト盤面とビットボードに同じ手を打ち、両方を返す"""
+    rng = random.Random(seed)
+    board = create_board()
+    bb = Bitboard()
+    player = 1
+    for _ in range(moves):
+        cols = [(x, y) for y in range(4) for x in range(4) if bb.can_drop(x, y)]
+        if not cols:
+            break
+        x, y = rng.choice(cols)
+        assert place_disk(board, x, y, player)
+        bb.drop(x, y, player)
+        player = 3 - player
+    return board, bb
+
+
+def test_lines_are_the_76_unique_lines():
+    assert len(LINES) == 76
+    assert len({tuple(sorted(line)) for line in LINES}) == 76
+
+
+def test_round_trip_with_list_board():
+    for seed in range(20):
+        board, bb = _random_game(seed, moves=seed * 3)
+        assert bb.to_list() == board
+        assert Bitboard.from_list(board).to_list() == board
+        assert bb.to_tuple() == tuple(tuple(tuple(r) for r in l) for l in board)
+
+
+def test_drop_stacks_and_reports_height():
+    bb = Bitboard()
+    assert [bb.drop(1, 2, 1) for _ in range(4)] == [0, 1, 2, 3]
+    assert bb.drop(1, 2, 1) is None
+    assert not bb.can_drop(1, 2)
+    assert bb.cell(1, 2, 3) == 1
+    assert bb.first_empty_xy() == (0, 0)
+
+
+def test_full_board():
+    bb = Bitboard()
+    for y in range(4):
+        for x in range(4):
+            for z in range(4):
+                bb.drop(x, y, 1 + (x + y + z) % 2)
+    assert bb.is_full()
+    assert bb.first_empty_xy() is None
+
+
+def test_winning_line_matches_list_scan():
+    for seed in range(200):
+        board, bb = _random_game(seed)
+        for player in (1, 2):
+            expected = check_win_with_positions(board, player)
+            got = bb.winning_line(player)
+            assert (got is None) == (expected is None)
+            if got is not None:
+                assert all(board[z][y][x] == player for x, y, z in got)
+
+
+def test_win_at_last_cell_matches_full_scan():
+    """最後に置いたセルを通るラインだけ見ても、全ライン走査と同じ結果になる"""
+    for seed in range(200):
+        rng = random.Random(seed)
+        board = create_board()
+        bb = Bitboard()
+        player = 1
+        while True:
+            cols = [(x, y) for y in range(4) for x in range(4) if bb.can_drop(x, y)]
+            if not cols:
+                break
+            x, y = rng.choice(cols)
+            z = bb.drop(x, y, player)
+            place_disk(board, x, y, player)
+            line = bb.winning_line_at(x, y, z, player)
+            assert line == check_win_at(board, x, y, z, player)
+            full = check_win_with_positions(board, player)
+            assert (line is None) == (full is None)
+            if line is not None:
+                assert (x, y, z) in line
+                break
+            player = 3 - player
+
+
+def test_cell_lines_cover_every_line_through_the_cell():
+    for (x, y, z), idx in CELL_LINES.items():
+        assert sorted(idx) == [i for i, line in enumerate(LINES) if (x, y, z) in line]
+    # 角と内側の 8 セルは 7 本（差分版で最も多く見るセル）
+    assert len(CELL_LINES[(0, 0, 0)]) == 7
+    assert len(CELL_LINES[(1, 1, 1)]) == 7
+    assert len(CELL_LINES[(1, 0, 0)]) == 4
@@ -0,0 +1,88 @@
+import sqlite3
+
+from backend.match_store import MatchStore
+
+MOVES = [
+    {"player": 1, "x": 0, "y": 0, "z": 0, "reason_kind": None},
+    {"player": 2, "x": 0, "y": 0, "z": 1, "reason_kind": "timeout"},
+    {"player": 1, "x": 1, "y": 0, "z": 0, "reason_kind": None},
+]
+
+
+def _record(store, p1, p2, status="win", winner=1, **kw):
+    return store.record(
+        source="test",
+        player1=p1,
+        player2=p2,
+        status=status,
+        winner=winner,
+        moves=MOVES,
+        **kw,
+    )
+
+
+def test_record_and_get(tmp_path):
+    store = MatchStore(str(tmp_path / "m.sqlite3"))
+    mid = _record(store, "a", "b", game_id="g1", duration_ms=12)
+    m = store.get(mid)
+    assert m["moves"] == MOVES and m["move_count"] == 3
+    assert m["reasons"] == {"2": {"timeout": 1}}
+    assert (m["game_id"], m["duration_ms"], m["winner"]) == ("g1", 12, 1)
+    assert store.get("missing") is None
+
+
+def test_query_filters_and_pages(tmp_path):
+    store = MatchStore(str(tmp_path / "m.sqlite3"))
+    _record(store, "a", "b")
+    _record(store, "b", "c", tournament_id="t1")
+    last = _record(store, "c", "a", tournament_id="t1")
+    total, rows = store.query(player="a")
+    assert total == 2 and rows[0]["id"] == last
+    assert "moves" not in rows[0]
+    assert store.query(tournament_id="t1")[0] == 2
+    total, page = store.query(limit=1, offset=1)
+    assert total == 3 and len(page) == 1
+    assert store.query(since="9999")[0] == 0
+
+
+def test_standings(tmp_path):
+    store = MatchStore(str(tmp_path / "m.sqlite3"))
+    _record(store, "a", "b", winner=1)
+    _record(store, "b", "a", winner=1)
+    _record(store, "a", "c", status="draw", winner=None)
+    _record(store, "c", None, status="draw", winner=None)
+    table = {r["player"]: r for r in store.standings()}
+    assert set(table) == {"a", "b", "c"}
+    assert (table["a"]["points"], table["a"]["wins"], table["a"]["losses"]) == (
+        1.5,
+        1,
+        1,
+    )
+    assert table["b"]["points"] == 1.0 and table["b"]["played"] == 2
+    assert table["c"]["draws"] == 2
+
+
+def test_old_database_gets_the_usage_column(tmp_path):
+    """usage 列が無かった頃の DB を開いても、既存の行を読めて新しい行も書ける"""
+    path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE matches (
+            id TEXT PRIMARY KEY, game_id TEXT, tournament_id TEXT,
+            source TEXT NOT NULL, player1 TEXT, player2 TEXT,
+            status TEXT NOT NULL, winner INTEGER, move_count INTEGER NOT NULL,
+            moves TEXT NOT NULL, reasons TEXT NOT NULL, duration_ms INTEGER,
+            started_at TEXT, finished_at TEXT NOT NULL
+        );
+        INSERT INTO matches VALUES ('old', NULL, NULL, 'auto', 'a', 'b', 'win', 1,
+            0, '[]', '{}', NULL, NULL, '2024-01-01T00:00:00+00:00');
+        """)
+    conn.close()
+    store = MatchStore(path)
+    assert store.get("old")["usage"] is None
+    moves = [dict(MOVES[0], usage={"wall_ms": 1.5, "cpu_ms": 1.0, "max_rss_kb": 7})]
+    mid = store.record(
+        source="test", player1="a", player2="b", status="win", winner=1, moves=moves
+    )
+    assert store.get(mid)["usage"]["1"]["max_rss_kb"] == 7
+    assert store.query()[0] == 2
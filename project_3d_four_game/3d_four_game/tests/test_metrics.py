@@ -0,0 +1,86 @@
+from pathlib import Path
+
+from backend.game import Game, apply_step
+from backend.game_logic import create_board
+from backend.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    MoveMetrics,
+)
+from backend.worker_pool import WorkerPool
+
+WORKER_PATH = Path(__file__).resolve().parent.parent / "worker_algo.py"
+
+
+def test_render_prometheus_text():
+    reg = MetricsRegistry()
+    c = reg.register(Counter("c_total", "A counter.", ("algo",)))
+    h = reg.register(Histogram("h_seconds", "A histogram.", (0.1, 1.0), ("algo",)))
+    reg.register(Gauge("g", "A gauge.", lambda: [((), 3)]))
+    c.inc(algo='a"b')
+    c.inc(2, algo='a"b')
+    for v in (0.05, 0.5, 2.0):
+        h.observe(v, algo="x")
+    lines = reg.render().splitlines()
+    assert "# TYPE c_total counter" in lines
+    assert 'c_total{algo="a\\"b"} 3' in lines
+    assert 'h_seconds_bucket{algo="x",le="0.1"} 1' in lines
+    assert 'h_seconds_bucket{algo="x",le="1"} 2' in lines
+    assert 'h_seconds_bucket{algo="x",le="+Inf"} 3' in lines
+    assert 'h_seconds_sum{algo="x"} 2.55' in lines
+    assert 'h_seconds_count{algo="x"} 3' in lines
+    assert "g 3" in lines
+
+
+def test_pool_reports_spawn_once_and_uses_the_label(submission):
+    m = MoveMetrics()
+    pool = WorkerPool(WORKER_PATH, use_zygote=False, metrics=m)
+    try:
+        algo = submission("a")
+        for _ in range(3):
+            pool.get_move(algo, create_board(), 10, label="entry")
+    finally:
+        pool.close()
+    text = m.registry.render()
+    assert 'ai_moves_total{algo="entry"} 3' in text
+    assert 'ai_worker_spawn_seconds_count{algo="entry"} 1' in text
+    assert 'ai_module_load_seconds_count{algo="entry"} 1' in text
+    assert 'ai_think_seconds_count{algo="entry"} 3' in text
+
+
+def test_apply_step_reports_the_final_failure_once():
+    g = Game()
+    for _ in range(4):
+        g.make_move(0, 0)
+    kinds = []
+    # 成功扱いで満杯の列を返した → invalid として1回だけ
+    state = apply_step(g, g.current_player, 0, 0, None, on_failure=kinds.append)
+    assert kinds == ["invalid"] and state["status"] == "ok"
+    apply_step(g, g.current_player, 9, 9, None, on_failure=kinds.append)
+    apply_step(g, g.current_player, None, None, "timeout", on_failure=kinds.append)
+    apply_step(g, g.current_player, 1, 1, None, on_failure=kinds.append)
+    assert kinds == ["invalid", "invalid", "timeout"]
+
+
+def test_replay_counts_tournament_moves():
+    m = MoveMetrics()
+    m.replay("a", {"total_ms": 20, "spawn_ms": 5, "load_ms": 3, "think_ms": 10})
+    m.replay("a", {"total_ms": 900}, "timeout")
+    m.replay("a", None, "abnormal")
+    text = m.registry.render()
+    assert 'ai_moves_total{algo="a"} 2' in text
+    assert 'ai_think_seconds_count{algo="a"} 1' in text
+    assert 'ai_move_failures_total{algo="a",kind="timeout"} 1' in text
+    assert 'ai_move_failures_total{algo="a",kind="abnormal"} 1' in text
+
+
+def test_metrics_endpoint_counts_missing_ai_as_abnormal(server, submission):
+    main, client = server
+    gid = client.post("/games").json()["game_id"]
+    body = {"player1": "", "player2": submission("a")}
+    client.post(f"/games/{gid}/auto-step", json=body)
+    r = client.get("/metrics")
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'ai_move_failures_total{algo="-",kind="abnormal"}' in r.text
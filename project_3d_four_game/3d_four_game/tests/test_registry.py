@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from backend import registry as registry_mod
+from backend.game import Game
+from backend.registry import GameRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """backend.registry が見る time.monotonic を手で進める"""
+    now = [1000.0]
+    monkeypatch.setattr(registry_mod.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _evictions():
+    seen = []
+    return seen, lambda gid, game, reason: seen.append((gid, reason))
+
+
+def test_lru_evicts_least_recently_used(clock):
+    seen, hook = _evictions()
+    games = GameRegistry(max_games=2, idle_ttl=0, on_evict=hook)
+    games["a"], games["b"] = Game(), Game()
+    games.get("a")  # a を新しくする
+    games["c"] = Game()
+    assert seen == [("b", "lru")]
+    assert "a" in games and "c" in games and games.get("b") is None
+    assert games.stats()["evictions"] == {"ttl": 0, "lru": 1}
+
+
+def test_idle_ttl_expires_on_get_and_sweep(clock):
+    seen, hook = _evictions()
+    games = GameRegistry(idle_ttl=10, on_evict=hook)
+    games["a"], games["b"], games["c"] = Game(), Game(), Game()
+    clock[0] += 5
+    games.touch("c")
+    clock[0] += 6
+    assert games.get("a") is None
+    assert games.sweep() == 1
+    assert seen == [("a", "ttl"), ("b", "ttl")]
+    assert games.get("c") is not None
+
+
+def test_busy_games_are_not_evicted(clock):
+    seen, hook = _evictions()
+    games = GameRegistry(max_games=1, idle_ttl=10, on_evict=hook)
+    busy = Game()
+    games["busy"] = busy
+
+    async def while_busy():
+        async with busy.lock:
+            assert busy.busy
+            # 上限を超えても手の途中のゲームは飛ばし、次に古いものを追い出す。
+            # 今作ったゲームは（他が全部手の途中でも）追い出さない
+            games["x"] = Game()
+            assert games.get("x") is not None and len(games) == 2
+            games["y"] = Game()
+            assert games.get("y") is not None and len(games) == 2
+            clock[0] += 60
+            assert games.sweep() == 1  # y だけ
+            assert games.get("busy") is busy
+
+    asyncio.run(while_busy())
+    assert seen == [("x", "lru"), ("y", "ttl")]
+    assert not busy.busy
+    clock[0] += 60
+    assert games.get("busy") is None
+
+
+def test_pop_and_delete_count_as_deleted():
+    games = GameRegistry()
+    games["a"], games["b"] = Game(), Game()
+    assert games.pop("a") is not None and games.pop("a") is None
+    del games["b"]
+    assert len(games) == 0
+    assert games.stats()["deleted"] == 2 and games.stats()["created"] == 2
@@ -0,0 +1,92 @@
+import os
+import subprocess
+from pathlib import Path
+
+from backend.snapshots import SnapshotStore, content_hash
+
+
+def _tree(root: Path, files: dict) -> str:
+    for rel, text in files.items():
+        p = root / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text)
+    return str(root)
+
+
+def test_freeze_copies_once_and_is_read_only(tmp_path):
+    src = _tree(
+        tmp_path / "src",
+        {"main.py": "A = 1\n", "lib/util.py": "", "__pycache__/main.pyc": "x"},
+    )
+    store = SnapshotStore(str(tmp_path / "snaps"))
+    key, dest = store.freeze(src)
+    assert key.startswith("sha256-") and store.exists(key)
+    assert Path(dest, "lib", "util.py").is_file()
+    assert not Path(dest, "__pycache__").exists()
+    assert not os.stat(Path(dest, "main.py")).st_mode & 0o222
+    mtime = os.stat(Path(dest, "main.py")).st_mtime_ns
+    assert store.freeze(src) == (key, dest)
+    assert os.stat(Path(dest, "main.py")).st_mtime_ns == mtime
+    assert [n for n in os.listdir(store.root) if n.startswith(".tmp-")] == []
+
+
+def test_changed_content_gets_a_new_snapshot(tmp_path):
+    src = tmp_path / "src"
+    _tree(src, {"main.py": "A = 1\n"})
+    store = SnapshotStore(str(tmp_path / "snaps"))
+    k1, d1 = store.freeze(str(src))
+    (src / "main.py").write_text("A = 2\n")
+    k2, d2 = store.freeze(str(src))
+    assert k1 != k2
+    assert Path(d1, "main.py").read_text() == "A = 1\n"
+    assert Path(d2, "main.py").read_text() == "A = 2\n"
+    assert not store.exists(None) and not store.exists("missing")
+
+
+def test_key_is_the_commit_when_the_tree_is_clean(tmp_path):
+    src = tmp_path / "src"
+    _tree(src, {"main.py": "A = 1\n"})
+    git = ["git", "-c", "user.name=t", "-c", "user.email=t@example.com"]
+    for args in (["init", "-q"], ["add", "-A"], ["commit", "-q", "-m", "a"]):
+        subprocess.run(git + args, cwd=src, check=True)
+    head = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=src, capture_output=True, text=True
+    ).stdout.strip()
+    store = SnapshotStore(str(tmp_path / "snaps"))
+    assert store.key_for(str(src)) == head
+    key, dest = store.freeze(str(src))
+    assert key == head and not Path(dest, ".git").exists()
+    # 作業ツリーが汚れていれば内容のハッシュ
+    (src / "main.py").write_text("A = 2\n")
+    assert store.key_for(str(src)) == content_hash(str(src))
+
+
+def test_running_games_keep_the_version_they_started_with(server, submission):
+    main, client = server
+    algo = submission("pinned", "def get_move(board):\n    return (0, 0)\n")
+    uid = client.post("/users", json={"name": "pinned", "path": algo}).json()["id"]
+    u = client.post(f"/users/{uid}/validate").json()
+    assert u["validation"]["status"] == "ok" and u["snapshot"]
+    first_snapshot = u["snapshot"]
+
+    body = {"player1": algo, "player2": algo}
+    old_game = client.post("/games").json()["game_id"]
+    assert client.post(f"/games/{old_game}/auto-step", json=body).json()[
+        "last_move"
+    ] == {"x": 0, "y": 0}
+
+    # 新しい版を検証 → 対局用のスナップショットが切り替わる
+    Path(algo, "main.py").write_text("def get_move(board):\n    return (3, 3)\n")
+    u = client.post(f"/users/{uid}/validate").json()
+    assert u["snapshot"] != first_snapshot
+
+    # 始まっていた対局は最初の版のまま、新しい対局は新しい版
+    r = client.post(f"/games/{old_game}/auto-step", json=body).json()
+    assert r["last_move"] == {"x": 0, "y": 0}
+    new_game = client.post("/games").json()["game_id"]
+    r = client.post(f"/games/{new_game}/auto-step", json=body).json()
+    assert r["last_move"] == {"x": 3, "y": 3}
+    # ライブのフォルダを壊しても、検証済みの版で指す
+    Path(algo, "main.py").write_text("syntax error(\n")
+    r = client.post(f"/games/{new_game}/auto-step", json=body).json()
+    assert r["last_move"] == {"x": 3, "y": 3} and r.get("reason") is None
@@ -0,0 +1,105 @@
+"""user-025: テナント（ステージ）ごとの置き場所と、1プロセス内でのデータの分離"""
+
+import os
+
+import pytest
+
+from backend.tenants import Tenant, TenantRegistry, parse_tenants
+
+
+def test_parse_tenants_json_and_pairs():
+    assert parse_tenants("") == {}
+    assert parse_tenants('{"a": "/x", "b": {"root": "/y", "user_db": "u.db"}}') == {
+        "a": {"root": "/x"},
+        "b": {"root": "/y", "user_db": "u.db"},
+    }
+    assert parse_tenants("prod=/srv/a, test=/srv/b") == {
+        "prod": {"root": "/srv/a"},
+        "test": {"root": "/srv/b"},
+    }
+    with pytest.raises(ValueError):
+        parse_tenants("prod=/srv/a,broken")
+
+
+def test_tenant_defaults(tmp_path):
+    t = Tenant("a", str(tmp_path))
+    assert t.clone_dir == str(tmp_path / "clone_algo")
+    assert t.userfile == str(tmp_path / "clone_algo" / "userlist.json")
+    assert t.snapshot_dir == str(tmp_path / "clone_algo" / ".snapshots")
+    assert t.match_db == str(tmp_path / "clone_algo" / "matches.sqlite3")
+    assert t.framework_dir == str(tmp_path / "3d_four_game")
+    assert t.to_dict()["user_db"] is None
+
+
+def test_resource_is_created_once(tmp_path):
+    t = Tenant("a", str(tmp_path))
+    calls = []
+    first = t.resource("x", lambda: calls.append(1) or object())
+    assert t.resource("x", object) is first
+    assert calls == [1]
+
+
+def test_for_path_picks_the_deepest_tenant(tmp_path):
+    outer = Tenant("outer", str(tmp_path))
+    inner = Tenant("inner", str(tmp_path / "clone_algo" / "stage"))
+    other = Tenant("other", str(tmp_path / "elsewhere"), clone_dir="/nonexistent")
+    reg = TenantRegistry({"outer": outer, "inner": inner, "other": other}, "outer")
+    assert reg.for_path(str(tmp_path / "clone_algo" / "x" / "main.py")) is outer
+    algo = tmp_path / "clone_algo" / "stage" / "clone_algo" / "y" / "main.py"
+    assert reg.for_path(str(algo)) is inner
+    # 前方一致でもディレクトリ境界をまたがないもの（clone_algo2）は含まない
+    assert reg.for_path(str(tmp_path) + "2/main.py") is None
+    assert outer.match_len(os.path.join(str(tmp_path), "..", "z")) == 0
+
+
+def test_unknown_default_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        TenantRegistry({"a": Tenant("a", str(tmp_path))}, "b")
+
+
+# ---- API（/t/<名前>/... と X-Tenant ヘッダー） ----
+def test_tenant_is_selected_by_prefix_or_header(server):
+    main, client = server
+    assert client.get("/tenants").json()["current"] == "prod"
+    assert client.get("/t/test/tenants").json()["current"] == "test"
+    assert (
+        client.get("/tenants", headers={"X-Tenant": "test"}).json()["current"] == "test"
+    )
+    r = client.get("/t/nope/tenants")
+    assert r.status_code == 404 and "nope" in r.json()["detail"]
+    assert client.get("/tenants", headers={"X-Tenant": "nope"}).status_code == 404
+
+
+def test_users_are_isolated(server, submission):
+    main, client = server
+    path = submission("iso_user")
+    r = client.post("/t/test/users", json={"name": "iso", "path": path})
+    assert r.status_code == 201, r.text
+    uid = r.json()["id"]
+    assert uid in [u["id"] for u in client.get("/t/test/users").json()]
+    assert uid not in [u["id"] for u in client.get("/users").json()]
+    assert client.delete(f"/users/{uid}").status_code == 404
+    assert client.delete(f"/t/test/users/{uid}").status_code == 204
+
+
+def test_games_are_isolated(server):
+    main, client = server
+    gid = client.post("/t/test/games").json()["game_id"]
+    assert client.get(f"/t/test/games/{gid}").status_code == 200
+    assert client.get(f"/games/{gid}").status_code == 404
+    assert client.get(f"/games/{gid}", headers={"X-Tenant": "test"}).status_code == 200
+
+
+def test_matches_are_isolated(server):
+    main, client = server
+    mid = main._matches(main.TENANTS.get("test")).record(
+        source="test",
+        player1="a",
+        player2="b",
+        status="draw",
+        winner=None,
+        moves=[],
+    )
+    assert client.get(f"/t/test/matches/{mid}").status_code == 200
+    assert client.get(f"/matches/{mid}").status_code == 404
+    assert mid not in [m["id"] for m in client.get("/matches").json()["items"]]
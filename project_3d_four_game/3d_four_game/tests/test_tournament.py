@@ -0,0 +1,100 @@
+from collections import Counter
+
+import pytest
+
+from backend.tournament import Tournament, round_robin_pairings, swiss_pairings
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 5, 8])
+def test_round_robin_plays_every_ordered_pair_once(n):
+    ids = [f"p{i}" for i in range(n)]
+    rounds = round_robin_pairings(ids)
+    assert len(rounds) == 2 * (n - 1 if n % 2 == 0 else n)
+    games = [pair for pairs in rounds for pair in pairs]
+    assert Counter(games) == Counter((a, b) for a in ids for b in ids if a != b)
+    for pairs in rounds:
+        seated = [p for pair in pairs for p in pair]
+        assert len(seated) == len(set(seated))
+
+
+def _swiss_round(ids, points, played, firsts, byes):
+    pairs, bye = swiss_pairings(ids, points, played, firsts, byes)
+    for a, b in pairs:
+        played[a].add(b)
+        played[b].add(a)
+        firsts[a] += 1
+    if bye:
+        byes.add(bye)
+    return pairs, bye
+
+
+def test_swiss_pairs_by_score_and_avoids_rematches():
+    ids = ["a", "b", "c", "d"]
+    played = {p: set() for p in ids}
+    firsts = {p: 0 for p in ids}
+    pairs, bye = _swiss_round(ids, {}, played, firsts, set())
+    assert pairs == [("a", "b"), ("c", "d")] and bye is None
+    # a と c が勝った → 上位同士（a-c）、下位同士（b-d）
+    pairs, _ = _swiss_round(ids, {"a": 1, "c": 1}, played, firsts, set())
+    assert {frozenset(p) for p in pairs} == {frozenset("ac"), frozenset("bd")}
+    pairs, _ = _swiss_round(ids, {"a": 2, "c": 1, "b": 1}, played, firsts, set())
+    assert {frozenset(p) for p in pairs} == {frozenset("ad"), frozenset("bc")}
+    # 先手回数の少ない方が先手（2回先手だった a に対し、まだ無い d）
+    assert ("d", "a") in pairs
+
+
+def test_swiss_bye_goes_to_the_lowest_without_one():
+    ids = ["a", "b", "c"]
+    played = {p: set() for p in ids}
+    firsts = {p: 0 for p in ids}
+    byes = set()
+    seen = []
+    for _ in range(3):
+        _, bye = _swiss_round(ids, {"a": 2, "b": 1}, played, firsts, byes)
+        seen.append(bye)
+    assert seen == ["c", "b", "a"]
+
+
+def test_standings_count_points_and_byes():
+    t = Tournament([{"id": i, "name": i, "path": ""} for i in "abc"])
+    t.matches = [
+        {"player1": "a", "player2": "b", "status": "win", "winner": 1},
+        {"player1": "b", "player2": "c", "status": "draw", "winner": None},
+        {"player1": "c", "player2": None, "status": "bye", "winner": None},
+        {"player1": "a", "player2": "c", "status": "error", "winner": None},
+    ]
+    table = {s["id"]: s for s in t.standings()}
+    assert (table["a"]["points"], table["a"]["wins"], table["a"]["played"]) == (1, 1, 1)
+    assert (table["b"]["points"], table["b"]["losses"], table["b"]["draws"]) == (
+        0.5,
+        1,
+        1,
+    )
+    assert table["c"]["points"] == 1.5 and table["c"]["played"] == 1
+
+
+def test_invalid_settings_are_rejected():
+    players = [{"id": i, "path": ""} for i in "ab"]
+    with pytest.raises(ValueError):
+        Tournament(players, format="knockout")
+    with pytest.raises(ValueError):
+        Tournament(players[:1])
+    with pytest.raises(ValueError):
+        Tournament(players, time_limit=None)
+
+
+def test_round_robin_runs_on_the_process_pool(submission):
+    bad = submission("bad", "def get_move(board):\n    return (9, 9)\n")
+    players = [
+        {"id": "first", "name": "first", "path": submission("first")},
+        {"id": "bad", "name": "bad", "path": bad},
+        {"id": "none", "name": "none", "path": ""},
+    ]
+    t = Tournament(players, time_limit=5, concurrency=2)
+    t.run()
+    assert t.status == "finished", t.error
+    assert len(t.matches) == 6
+    assert all(m["status"] in ("win", "draw") for m in t.matches)
+    table = t.standings()
+    assert sum(s["points"] for s in table) == 6
+    assert all(s["played"] == 4 for s in table)
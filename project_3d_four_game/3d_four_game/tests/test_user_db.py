@@ -0,0 +1,125 @@
+"""user-024: ユーザーレジストリの SQLite 版（userlist.json からの一回限りの移行）"""
+
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from backend.user_db import SqliteUserStore
+
+
+def _user(id, name, path, **extra):
+    return SimpleNamespace(id=id, name=name, path=path, **extra)
+
+
+def _store(path, migrate=None):
+    return SqliteUserStore(
+        str(path),
+        make=lambda d: SimpleNamespace(**d),
+        dump=lambda u: dict(vars(u)),
+        canon=lambda p: os.path.normpath(p) if p else "",
+        migrate=migrate,
+    )
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "data" / "users.db"
+
+
+def test_put_get_and_lookups(db):
+    store = _store(db)
+    store.put(_user("u1", "alice", "a/main.py"))
+    store.put(
+        _user("u2", "bob", "b/main.py", validation={"status": "ok"}, rating=1500.0)
+    )
+    assert store.get("u1").name == "alice"
+    assert store.by_path("./b/main.py").id == "u2"
+    assert store.by_name(" alice ").id == "u1"
+    assert store.get("u2").validation == {"status": "ok"}
+    assert store.get("u2").rating == 1500.0
+    assert [u.id for u in store.all()] == ["u1", "u2"]
+    assert store.stats()["validation"] == {"unchecked": 1, "ok": 1}
+
+
+def test_put_replaces_and_renames(db):
+    store = _store(db)
+    old = store.put(_user("u1", "alice", "a/main.py"))
+    store.put(_user("u1", "alice2", "a/main.py"))
+    assert [u.name for u in store.all()] == ["alice2"]
+    # id が変わる差し替えは旧行を消す
+    store.put(_user("u9", "alice3", "a/main.py"), replace=old)
+    assert [u.id for u in store.all()] == ["u9"]
+    assert store.delete("u9")
+    assert not store.delete("u9")
+    assert store.all() == []
+
+
+def test_migrates_once_from_json(db):
+    calls = []
+
+    def migrate():
+        calls.append(1)
+        return [
+            _user("u1", "alice", "a/main.py"),
+            _user("u1", "alice-dup", "a2/main.py"),
+            _user("u2", "bob", "b/main.py"),
+        ]
+
+    store = _store(db, migrate)
+    # JSON 版で許されていた id の重複は -2 を付けて残す
+    assert [u.id for u in store.all()] == ["u1", "u1-2", "u2"]
+    store.delete("u2")
+    store.close()
+
+    again = _store(db, migrate)
+    assert [u.id for u in again.all()] == ["u1", "u1-2"]
+    assert len(calls) == 1
+    row = sqlite3.connect(db).execute(
+        "SELECT value FROM meta WHERE key='migrated_count'"
+    )
+    assert row.fetchone()[0] == "3"
+
+
+def test_schema_is_created_in_wal_mode(db):
+    store = _store(db)
+    store.all()
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+    assert {"users", "meta", "idx_users_path", "idx_users_status"} <= tables
+
+
+def test_writes_from_other_threads_are_visible(db):
+    store = _store(db)
+    store.all()
+
+    def write(i):
+        store.put(_user(f"u{i}", f"n{i}", f"p{i}/main.py"))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store.all()) == 8
+    # 別の接続（別プロセス相当）からも見える
+    assert _store(db).get("u3").name == "n3"
+
+
+def test_users_api_uses_sqlite_backend(server, tmp_path, monkeypatch):
+    main, client = server
+    tenant = main.TENANTS.get("test")
+    monkeypatch.setattr(tenant, "user_db", str(tmp_path / "t-users.db"))
+    # 作り直させる（ほかのリソースも終了時に元へ戻る）
+    monkeypatch.setattr(tenant, "_resources", {})
+
+    r = client.post(
+        "/t/test/users", json={"name": "sq", "path": str(tmp_path / "x" / "main.py")}
+    )
+    assert r.status_code in (200, 201), r.text
+    assert main._users(tenant).stats()["backend"] == "sqlite"
+    ids = [u["id"] for u in client.get("/t/test/users").json()]
+    assert r.json()["id"] in ids
@@ -0,0 +1,116 @@
+"""user-023: ユーザー一覧のメモリ常駐ストア（索引・write-behind・外部変更の読み直し）"""
+
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.user_registry import UserRegistry
+
+
+def _user(id, name, path):
+    return SimpleNamespace(id=id, name=name, path=path)
+
+
+@pytest.fixture
+def userfile(tmp_path):
+    path = tmp_path / "userlist.json"
+    _dump(path, [_user("u1", "alice", "a/main.py"), _user("u2", "bob", "b/main.py")])
+    return path
+
+
+def _dump(path, users):
+    path.write_text(json.dumps([vars(u) for u in users]))
+
+
+def _registry(path, **kw):
+    kw.setdefault("flush_delay", 0.05)
+    kw.setdefault("check_interval", 0.0)
+    saves = []
+
+    def save(users):
+        saves.append([u.id for u in users])
+        _dump(path, users)
+
+    reg = UserRegistry(
+        str(path),
+        load=lambda: [_user(**d) for d in json.loads(path.read_text())],
+        save=save,
+        canon=lambda p: os.path.normpath(p) if p else "",
+        **kw,
+    )
+    return reg, saves
+
+
+def _wait(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_lookup_by_id_path_and_name(userfile):
+    reg, _ = _registry(userfile)
+    assert reg.get("u1").name == "alice"
+    assert reg.by_path("./a/main.py").id == "u1"
+    assert reg.by_name(" bob ").id == "u2"
+    assert reg.get("nope") is None
+    assert reg.loads == 1
+
+
+def test_changes_are_visible_immediately_and_written_later(userfile):
+    reg, saves = _registry(userfile, flush_delay=0.3)
+    reg.put(_user("u3", "carol", "c/main.py"))
+    reg.delete("u1")
+    assert reg.get("u3").name == "carol"
+    assert reg.get("u1") is None
+    assert reg.stats()["pending"]
+    assert saves == []  # まだファイルには書いていない
+
+    assert _wait(lambda: saves)
+    # 連続した変更は1回の書き込みにまとまる
+    assert saves == [["u2", "u3"]]
+    assert [d["id"] for d in json.loads(userfile.read_text())] == ["u2", "u3"]
+    assert not reg.stats()["pending"]
+    reg.close()
+
+
+def test_put_replaces_in_place(userfile):
+    reg, _ = _registry(userfile)
+    reg.put(_user("u1", "alice2", "a2/main.py"))
+    assert [u.id for u in reg.all()] == ["u1", "u2"]
+    assert reg.by_name("alice") is None
+    assert reg.by_path("a2/main.py").name == "alice2"
+    reg.close()
+
+
+def test_external_change_is_reloaded(userfile):
+    reg, _ = _registry(userfile)
+    assert reg.get("u9") is None
+    _dump(userfile, [_user("u9", "zed", "z/main.py")])
+    assert reg.get("u9").name == "zed"
+    assert reg.get("u1") is None
+    assert reg.loads == 2
+
+
+def test_own_writes_do_not_trigger_reload(userfile):
+    reg, _ = _registry(userfile)
+    reg.put(_user("u3", "carol", "c/main.py"))
+    reg.flush()
+    assert reg.get("u3") is not None
+    assert reg.loads == 1
+    reg.close()
+
+
+def test_pending_writes_win_over_external_change(userfile):
+    reg, saves = _registry(userfile, flush_delay=60)
+    reg.put(_user("u3", "carol", "c/main.py"))
+    _dump(userfile, [_user("u9", "zed", "z/main.py")])
+    assert reg.get("u9") is None
+    assert reg.get("u3") is not None
+    reg.close()
+    assert [d["id"] for d in json.loads(userfile.read_text())] == ["u1", "u2", "u3"]
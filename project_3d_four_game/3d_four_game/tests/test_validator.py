@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+from backend.validator import resolve_submission, validate_submission
+from backend.worker_pool import WorkerPool
+
+WORKER_PATH = Path(__file__).resolve().parent.parent / "worker_algo.py"
+
+
+@pytest.fixture
+def pool():
+    p = WorkerPool(WORKER_PATH, use_zygote=False)
+    yield p
+    p.close()
+
+
+def test_resolve_submission_rules(tmp_path, submission, monkeypatch):
+    algo = submission("team")
+    entry = str(Path(algo, "main.py").resolve())
+    assert resolve_submission(algo) == entry
+    assert resolve_submission(entry) == entry
+    # 相対パスは base_dir から（カレントより優先）
+    assert resolve_submission("team", base_dir=tmp_path) == entry
+    monkeypatch.chdir(tmp_path)
+    assert resolve_submission("team") == entry
+    assert resolve_submission("team/main.py") == entry
+    # 別名
+    aliases = {"strong": algo}
+    assert resolve_submission("strong", aliases=aliases.__getitem__) == entry
+    with pytest.raises(FileNotFoundError, match="候補"):
+        resolve_submission("nope", base_dir=tmp_path, aliases=aliases.__getitem__)
+    with pytest.raises(FileNotFoundError):
+        resolve_submission("  ")
+
+
+def test_main_resolves_games_and_validation_alike(server, submission, monkeypatch):
+    """対局用のロード（load_algo_module_flexible）と検証のキーが同じ main.py を指す"""
+    main, _ = server
+    algo = submission("shared")
+    monkeypatch.setattr(main, "BASE_DIR", Path(algo).parent)
+    entry = str(Path(algo, "main.py").resolve())
+    assert main._entry_key("shared") == entry
+    assert main._submission_path("shared") == entry
+    module = main.load_algo_module_flexible("shared")
+    assert Path(module.__file__).resolve() == Path(entry)
+
+
+def test_valid_submission_warms_a_worker(pool, submission):
+    v = validate_submission(pool, submission("ok"))
+    assert v["status"] == "ok" and v["kind"] is None
+    assert v["move"] == [0, 0] and v["load_ms"] is not None
+    assert v["entry"].endswith("main.py")
+    assert pool.stats()["idle_workers"] == 1
+
+
+@pytest.mark.parametrize(
+    "source, kind",
+    [
+        ("import os\ndef get_move(board):\n    return (0, 0)\n", "abnormal"),
+        ("def get_move(board):\n    return (7, 0)\n", "invalid"),
+        ("def get_move(board):\n    while True:\n        pass\n", "timeout"),
+        ("x = 1\n", "abnormal"),
+    ],
+)
+def test_broken_submissions_are_classified(pool, submission, source, kind):
+    v = validate_submission(pool, submission("bad", source), timeout=1.0)
+    assert (v["status"], v["kind"]) == ("invalid", kind)
+    assert v["error"]
+    assert pool.stats()["idle_workers"] == 0
+
+
+def test_missing_entry(pool, tmp_path):
+    v = validate_submission(pool, str(tmp_path / "empty"))
+    assert (v["status"], v["kind"], v["entry"]) == ("invalid", "missing", None)
@@ -0,0 +1,343 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from backend.game import Game
+from backend.game_logic import create_board
+from backend.worker_pool import (
+    AISubprocessCrashed,
+    AISubprocessTimeout,
+    CodeCache,
+    InvalidMoveError,
+    Worker,
+    WorkerPool,
+)
+
+WORKER_PATH = Path(__file__).resolve().parent.parent / "worker_algo.py"
+
+
+def _dies(w, timeout=2.0) -> bool:
+    """kill は回収を待たないので、プロセスが消えるまで少し待つ"""
+    t = time.monotonic()
+    while w.alive:
+        if time.monotonic() - t > timeout:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def pool():
+    p = WorkerPool(WORKER_PATH, use_zygote=False)
+    yield p
+    p.close()
+
+
+def test_worker_is_reused_between_moves(pool, submission):
+    algo = submission("a")
+    usage = {}
+    assert pool.get_move(algo, create_board(), 10, usage=usage) == (0, 0)
+    assert "spawn_ms" in usage and "load_ms" in usage
+    pid = pool._idle[next(iter(pool._idle))][0].pid
+    assert pool.get_move(algo, create_board(), 10, usage=usage) == (0, 0)
+    assert "spawn_ms" not in usage
+    assert pool.stats()["idle_workers"] == 1
+    assert pool._idle[next(iter(pool._idle))][0].pid == pid
+
+
+def test_edited_submission_gets_a_new_worker(pool, submission):
+    algo = submission("a")
+    pool.get_move(algo, create_board(), 10)
+    main = Path(algo) / "main.py"
+    main.write_text("def get_move(board):\n    return (3, 3)\n")
+    st = main.stat()
+    os.utime(main, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert pool.get_move(algo, create_board(), 10) == (3, 3)
+    assert pool.stats()["submissions"] == 1
+
+
+def test_failures_are_classified_and_workers_dropped(pool, submission):
+    banned = submission(
+        "banned", "import os\ndef get_move(board):\n    return (0, 0)\n"
+    )
+    with pytest.raises(AISubprocessCrashed):
+        pool.get_move(banned, create_board(), 10)
+
+    bad = submission("bad", "def get_move(board):\n    return (9, 9)\n")
+    with pytest.raises(InvalidMoveError):
+        pool.get_move(bad, create_board(), 10)
+
+    slow = submission("slow", "def get_move(board):\n    while True:\n        pass\n")
+    with pytest.raises(AISubprocessTimeout):
+        pool.get_move(slow, create_board(), 1.0)
+    assert pool.stats()["idle_workers"] == 0
+
+
+def test_worker_is_replaced_after_max_moves(submission):
+    p = WorkerPool(WORKER_PATH, use_zygote=False, max_moves=2)
+    try:
+        algo = submission("a")
+        p.get_move(algo, create_board(), 10)
+        assert p.stats()["idle_workers"] == 1
+        p.get_move(algo, create_board(), 10)
+        assert p.stats()["idle_workers"] == 0
+    finally:
+        p.close()
+
+
+def test_cancelled_async_move_does_not_leak_the_worker(pool, submission, monkeypatch):
+    """借り出し（スレッド）中にキャンセルされても、借りたワーカーはプールに戻る"""
+    algo = submission("a")
+    pool.get_move(algo, create_board(), 10)
+    checkout = pool._checkout
+
+    def slow_checkout(*args):
+        time.sleep(0.2)
+        return checkout(*args)
+
+    monkeypatch.setattr(pool, "_checkout", slow_checkout)
+
+    async def cancel_during_checkout():
+        t = asyncio.ensure_future(pool.get_move_async(algo, create_board(), 10))
+        await asyncio.sleep(0.05)
+        t.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await t
+        await asyncio.sleep(0.4)
+
+    asyncio.run(cancel_during_checkout())
+    assert pool.stats()["idle_workers"] == 1
+
+
+@pytest.fixture
+def zpool():
+    p = WorkerPool(WORKER_PATH, use_zygote=True)
+    yield p
+    p.close()
+
+
+def test_zygote_forks_workers_over_passed_fds(zpool, submission):
+    algo = submission("a")
+    assert zpool.get_move(algo, create_board(), 10) == (0, 0)
+    w = zpool._idle[next(iter(zpool._idle))][0]
+    # 親は zygote なので Popen は持たない。fd はこちらで作ったパイプ
+    assert w.proc is None and w.alive
+    assert zpool.zygote._proc.pid != w.pid
+    pid, wfd, rfd = zpool.zygote.spawn(str(Path(algo) / "main.py"))
+    try:
+        assert pid not in (w.pid, zpool.zygote._proc.pid)
+        assert os.fstat(wfd) and os.fstat(rfd)
+    finally:
+        os.kill(pid, 9)
+        os.close(wfd)
+        os.close(rfd)
+
+
+def test_zygote_is_restarted_after_it_dies(zpool, submission):
+    algo = submission("a")
+    zpool.get_move(algo, create_board(), 10)
+    old = zpool.zygote._proc
+    old.kill()
+    old.wait()
+    zpool.close()
+    assert zpool.get_move(algo, create_board(), 10) == (0, 0)
+    assert zpool.zygote._proc is not old
+    assert zpool._idle[next(iter(zpool._idle))][0].proc is None
+
+
+def test_zygote_child_keeps_the_sandbox(zpool, submission):
+    banned = submission(
+        "banned", "import os\ndef get_move(board):\n    return (0, 0)\n"
+    )
+    with pytest.raises(AISubprocessCrashed):
+        zpool.get_move(banned, create_board(), 10)
+    # AST では見えない import も、fork した子の serve が張るランタイムの検査で止まる
+    sneaky = submission(
+        "sneaky",
+        "import builtins\n"
+        "def get_move(board):\n"
+        '    getattr(builtins, "__imp" + "ort__")("o" + "s")\n'
+        "    return (0, 0)\n",
+    )
+    with pytest.raises(AISubprocessCrashed):
+        zpool.get_move(sneaky, create_board(), 10)
+
+
+def test_usage_reports_worker_measurements(pool, submission):
+    busy = submission(
+        "busy",
+        """
+        def get_move(board):
+            n = 0
+            for i in range(300000):
+                n += i
+            return (0, 0)
+        """,
+    )
+    usage = {}
+    pool.get_move(busy, create_board(), 10, usage=usage)
+    for k in ("wall_ms", "cpu_ms", "max_rss_kb", "think_ms", "total_ms", "load_ms"):
+        assert usage[k] > 0, k
+    assert usage["cpu_ms"] <= usage["wall_ms"] + 5
+    assert usage["think_ms"] <= usage["total_ms"]
+
+
+def test_usage_on_timeout_has_only_server_side_times(pool, submission):
+    slow = submission("slow", "def get_move(board):\n    while True:\n        pass\n")
+    usage = {}
+    with pytest.raises(AISubprocessTimeout):
+        pool.get_move(slow, create_board(), 1.0, usage=usage)
+    assert usage["total_ms"] >= 1000
+    assert "cpu_ms" not in usage and "think_ms" not in usage
+
+
+def test_get_move_ex_receives_the_move_context(pool, submission):
+    algo = submission(
+        "ex",
+        """
+        from framework import Alg3D, MoveContext
+
+        class MyAI(Alg3D):
+            def get_move(self, board):
+                return (3, 3)
+
+            def get_move_ex(self, board, context):
+                assert isinstance(context, MoveContext)
+                assert context.time_left <= 5
+                assert context.last_move == (2, 1, 0)
+                return (len(context.history), context.player)
+        """,
+    )
+    g = Game()
+    g.make_move(2, 1)
+    assert pool.get_move(algo, g.snapshot, 10, context=g.move_context(5.0)) == (1, 2)
+    # context が無ければ get_move
+    assert pool.get_move(algo, create_board(), 10) == (3, 3)
+
+
+def test_plain_get_move_ignores_the_context(pool, submission):
+    algo = submission("plain")
+    g = Game()
+    assert pool.get_move(algo, g.snapshot, 10, context=g.move_context(5.0)) == (0, 0)
+
+
+COUNTER = """
+class MyAI:
+    def __init__(self):
+        self.n = 0
+
+    def get_move(self, board):
+        self.n += 1
+        return (self.n % 4, 0)
+"""
+
+
+def test_session_keeps_myai_between_moves(pool, submission):
+    algo = submission("counter", COUNTER)
+    s = pool.session(algo)
+    assert [s.get_move(create_board(), 10) for _ in range(3)] == [
+        (1, 0),
+        (2, 0),
+        (3, 0),
+    ]
+    # プールのワーカーは毎手 MyAI を作り直す
+    assert pool.get_move(algo, create_board(), 10) == (1, 0)
+    assert pool.get_move(algo, create_board(), 10) == (1, 0)
+    w = s.worker
+    s.close()
+    assert s.worker is None
+    assert _dies(w)
+    with pytest.raises(AISubprocessCrashed):
+        s.get_move(create_board(), 10)
+
+
+def test_session_restarts_after_a_failure(pool, submission):
+    algo = submission(
+        "flaky",
+        COUNTER.replace(
+            "return (self.n % 4, 0)",
+            "return (9, 9) if self.n == 2 else (self.n % 4, 0)",
+        ),
+    )
+    s = pool.session(algo)
+    assert s.get_move(create_board(), 10) == (1, 0)
+    with pytest.raises(InvalidMoveError):
+        s.get_move(create_board(), 10)
+    assert s.restarts == 1
+    assert s.get_move(create_board(), 10) == (1, 0)  # MyAI も作り直し
+    s.close()
+
+
+def test_sessions_over_the_cap_lose_their_worker(submission):
+    p = WorkerPool(WORKER_PATH, use_zygote=False, max_sessions=2)
+    try:
+        algo = submission("counter", COUNTER)
+        s1, s2, s3 = (p.session(algo) for _ in range(3))
+        for s in (s1, s2, s3):
+            s.get_move(create_board(), 10)
+        assert s1.worker is None and p.session_evictions == 1
+        assert p.stats()["session_workers"] == 2
+        # 取り上げられたセッションは次の手で作り直す
+        assert s1.get_move(create_board(), 10) == (1, 0)
+        assert s2.worker is None
+        for s in (s1, s2, s3):
+            s.close()
+        assert p.stats()["session_workers"] == 0
+    finally:
+        p.close()
+
+
+def test_code_cache_is_an_lru_by_size():
+    c = CodeCache(max_bytes=10)
+    c.put("a", "xxxx")
+    c.put("b", "yyyy")
+    assert c.get("a") == "xxxx"  # a を新しくする
+    c.put("c", "zzzz")
+    assert c.get("b") is None and c.get("c") == "zzzz"
+    c.put("huge", "w" * 11)
+    assert c.get("huge") is None
+    assert c.stats() == {"entries": 2, "bytes": 8, "hits": 2, "misses": 2}
+
+
+def test_new_workers_reuse_the_gate_verdict_and_bytecode(submission):
+    p = WorkerPool(WORKER_PATH, use_zygote=False, max_moves=1)
+    try:
+        algo = submission("a")
+        for _ in range(3):
+            assert p.get_move(algo, create_board(), 10) == (0, 0)
+        stats = p.code_cache.stats()
+        assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+
+        banned = submission(
+            "banned", "import os\ndef get_move(board):\n    return (0, 0)\n"
+        )
+        errors = []
+        for _ in range(2):
+            with pytest.raises(AISubprocessCrashed) as e:
+                p.get_move(banned, create_board(), 10)
+            errors.append(str(e.value))
+        assert errors[0] == errors[1] and "banned import" in errors[0]
+        assert p.code_cache.stats()["hits"] == 3
+    finally:
+        p.close()
+
+
+def test_worker_cannot_write_the_cache_out_of_turn():
+    """get の前の put、2回目の get は異常終了扱い（提出コードからの偽造を受け付けない）"""
+    rfd, wfd = os.pipe()
+    try:
+        w = Worker(("x", 0), os.getpid(), wfd, rfd, code_cache=CodeCache(1024))
+        with pytest.raises(AISubprocessCrashed):
+            w._on_cache({"cache_put": "k", "entry": "forged"})
+        w._cache_expect = "get"
+        w._on_cache({"cache_get": "k"})
+        w._on_cache({"cache_put": "k", "entry": "ok"})
+        with pytest.raises(AISubprocessCrashed):
+            w._on_cache({"cache_get": "k"})
+        assert w.code_cache.get("k") == "ok"
+    finally:
+        os.close(rfd)
+        os.close(wfd)
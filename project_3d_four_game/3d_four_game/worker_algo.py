@@ -1,11 +1,14 @@
 import importlib.util, json, sys, os, resource, traceback, pathlib
-import io, contextlib, ast, sysconfig, builtins
+import io, contextlib, ast, sysconfig, builtins, struct, math
+import signal, socket, time, types, hashlib, marshal, base64
 
 
 def set_limits(max_mem_mb="1024", cpu_time_sec="3"):
+    """cpu_time_sec=None なら CPU には触らない（常駐ワーカーは _arm_cpu_limit で張る）"""
     try:
         resource.setrlimit(resource.RLIMIT_AS, (int(max_mem_mb) * 1024 * 1024,) * 2)
-        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_time_sec),) * 2)
+        if cpu_time_sec is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_time_sec),) * 2)
     except Exception:
         pass  # 環境によって未対応でもOK
 
@@ -32,6 +35,8 @@ _BANNED_IMPORTS = {
     "threading",
     "concurrent",
     "asyncio",
+    "resource",  # 自分の RLIMIT_CPU を上げられないように
+    "signal",  # SIGXCPU を無視できないように
 }
 _BANNED_CALLS = {"open", "eval", "exec", "compile", "__import__", "system", "popen"}
 
@@ -88,45 +93,437 @@ def _install_runtime_guards():
     # compile は触らない
 
 
-def load_module(path: str):
-    # 事前 AST チェック
-    src = pathlib.Path(path).read_text(encoding="utf-8", errors="ignore")
-    _ast_gate(src, str(path))
+# === AST 判定とバイトコードのキャッシュ ===
+# キー = Python の magic + ゲート規則 + パス + ソース本体の sha256。
+# キャッシュ本体はサーバー（WorkerPool）のメモリにあり、ワーカーはフレームで問い合わせる。
+# ワーカーは同じプロセスで提出コードを実行するので、ディスク上の共有キャッシュを
+# 持たせると書き換えられうる（ゲートを素通りする (None, code) を仕込める）。
+# 問い合わせ・登録は提出コードを実行する前の1回ずつだけ、サーバー側もそれ以外は受け付けない。
+_GATE_VERSION = hashlib.sha256(
+    repr((sorted(_BANNED_IMPORTS), sorted(_BANNED_CALLS))).encode("utf-8")
+).hexdigest()
+
+
+def _code_cache_key(path: str, data: bytes) -> str:
+    h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    h.update(_GATE_VERSION.encode("utf-8"))
+    h.update(str(path).encode("utf-8") + b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+class _ServerCodeCache:
+    """サーバー側のキャッシュ（常駐モードのプロトコル fd 越し）"""
+
+    def __init__(self, rfd: int, wfd: int):
+        self.rfd = rfd
+        self.wfd = wfd
+
+    def get(self, key: str):
+        """(エラー文 or None, code or None) を返す。無い・壊れていれば None"""
+        write_frame(self.wfd, {"cache_get": key})
+        entry = (read_frame(self.rfd) or {}).get("entry")
+        if not entry:
+            return None
+        try:
+            err, code = marshal.loads(base64.b64decode(entry))
+        except Exception:
+            return None
+        if err is None and not isinstance(code, types.CodeType):
+            return None
+        return err, code
+
+    def put(self, key: str, err, code) -> None:
+        entry = base64.b64encode(marshal.dumps((err, code))).decode("ascii")
+        write_frame(self.wfd, {"cache_put": key, "entry": entry})
+
+
+def load_module(path: str, cache: _ServerCodeCache = None):
+    data = pathlib.Path(path).read_bytes()
+    key = _code_cache_key(path, data)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        # 同じ内容は AST 判定も compile もやり直さない（拒否の判定もキャッシュする）
+        err, code = cached
+        if err is not None:
+            raise RuntimeError(err)
+    else:
+        # 事前 AST チェック
+        src = data.decode("utf-8", errors="ignore")
+        try:
+            _ast_gate(src, str(path))
+        except (RuntimeError, SyntaxError) as e:
+            if cache is not None:
+                cache.put(key, str(e), None)
+            raise
+        code = compile(data, str(path), "exec", dont_inherit=True)
+        if cache is not None:
+            cache.put(key, None, code)
 
     spec = importlib.util.spec_from_file_location("algo_worker_mod", path)
     if not spec or not spec.loader:
         raise ImportError(f"Cannot load module from {path}")
     m = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(m)
+    exec(code, m.__dict__)
     return m
 
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "no algo_path"}))
-        return 2
+_BASE_PATHS = None
+
+
+def _default_framework_dir():
+    """framework.py の既定の置き場所（WORKER_FRAMEWORK_DIR、無ければこのファイルの隣）"""
+    return os.environ.get("WORKER_FRAMEWORK_DIR") or os.path.dirname(
+        os.path.abspath(__file__)
+    )
+
+
+def _base_sys_path():
+    """標準ライブラリ(+lib-dynload) の許可リスト（一度だけ計算）"""
+    global _BASE_PATHS
+    if _BASE_PATHS is None:
+        paths = sysconfig.get_paths()
+        allow = []
+        for p in (paths.get("stdlib"), paths.get("platstdlib")):
+            if p and p not in allow:
+                allow.append(p)
+            if p:
+                dyn = os.path.join(p, "lib-dynload")
+                if os.path.isdir(dyn) and dyn not in allow:
+                    allow.append(dyn)
+        _BASE_PATHS = allow
+    return _BASE_PATHS
+
+
+def _restrict_sys_path(algo_dir: str, framework_dir: str = None):
+    """sys.path をホワイトリスト化：提出フォルダ＋標準ライブラリ(+lib-dynload)+framework"""
+    # ★ framework.py を置いたディレクトリ（テナントごとに違ってよい）
+    fw = framework_dir or _default_framework_dir()
+    sys.path[:] = [algo_dir] + [p for p in _base_sys_path() + [fw] if p != algo_dir]
+
+
+def _use_framework(algo_dir: str, framework_dir: str = None):
+    """
+    zygote が先読みした framework が、この提出が import するはずのものと違えば捨てる。
+    sys.path の順どおり、提出フォルダに framework.py があればそちらが優先
+    （exec で起動したワーカーと同じ結果にする）。
+    """
+    m = sys.modules.get("framework")
+    if m is None:
+        return
+    if os.path.isfile(os.path.join(algo_dir, "framework.py")):
+        want = algo_dir
+    else:
+        want = framework_dir or _default_framework_dir()
+    loaded = os.path.dirname(os.path.abspath(getattr(m, "__file__", None) or ""))
+    if loaded == os.path.abspath(want):
+        return
+    # framework と、同じディレクトリから一緒に読まれたモジュールをまとめて捨てる
+    for name, mod in list(sys.modules.items()):
+        f = getattr(mod, "__file__", None)
+        if name != "__main__" and f and os.path.dirname(os.path.abspath(f)) == loaded:
+            del sys.modules[name]
+
+
+def _find_move_funcs(m, algo_path: str):
+    """
+    (get_move, get_move_ex or None) を探す。モジュール関数を優先し、
+    なければ MyAI() のメソッド。get_move_ex は任意（Alg3D の既定実装は get_move を呼ぶ）
+    """
+    if hasattr(m, "get_move") and callable(m.get_move):
+        ex = getattr(m, "get_move_ex", None)
+        return m.get_move, ex if callable(ex) else None
+    if hasattr(m, "MyAI"):
+        _ai = m.MyAI()
+        if hasattr(_ai, "get_move") and callable(_ai.get_move):
+            ex = getattr(_ai, "get_move_ex", None)
+            return _ai.get_move, ex if callable(ex) else None
+    raise AttributeError(f"{algo_path} に get_move または MyAI が見つかりません")
+
+
+def _find_move_func(m, algo_path: str):
+    """get_move または MyAI().get_move を探す"""
+    return _find_move_funcs(m, algo_path)[0]
+
+
+def _make_context(ctx: dict):
+    """サーバーから来た context を framework.MoveContext（無ければ同じ属性の名前空間）に"""
+    last = ctx.get("last_move")
+    fields = {
+        "player": ctx.get("player"),
+        "move_number": ctx.get("move_number"),
+        "last_move": tuple(last) if last else None,
+        "history": [tuple(h) for h in ctx.get("history") or []],
+        "time_left": ctx.get("time_left"),
+        "clock_left": ctx.get("clock_left"),
+    }
+    try:
+        from framework import MoveContext
+
+        return MoveContext(**fields)
+    except Exception:
+        # 提出フォルダに古い framework.py がある場合など
+        return types.SimpleNamespace(**fields)
+
+
+def _call_quiet(func, board, *args):
+    """アルゴの print は stderr に流す（stdout は結果専用）"""
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        x, y = func(board, *args)
+    logs = buf.getvalue()
+    if logs:
+        print(logs, file=sys.stderr, end="")
+    return int(x), int(y)
+
+
+# === 常駐モード（ワーカープール用） ===
+# フレーム = 4byte ビッグエンディアン長 + UTF-8 JSON
+_HEADER = struct.Struct(">I")
+
+
+def write_frame(fd: int, obj) -> None:
+    data = json.dumps(obj).encode("utf-8")
+    buf = _HEADER.pack(len(data)) + data
+    while buf:
+        n = os.write(fd, buf)
+        buf = buf[n:]
+
+
+def _read_exact(fd: int, n: int):
+    chunks = []
+    while n > 0:
+        b = os.read(fd, n)
+        if not b:
+            return None
+        chunks.append(b)
+        n -= len(b)
+    return b"".join(chunks)
+
+
+def read_frame(fd: int):
+    """1フレーム読む。EOF なら None"""
+    head = _read_exact(fd, _HEADER.size)
+    if head is None:
+        return None
+    body = _read_exact(fd, _HEADER.unpack(head)[0])
+    if body is None:
+        return None
+    return json.loads(body.decode("utf-8"))
+
+
+def _arm_cpu_limit(cpu_time_sec, hard=None):
+    """
+    RLIMIT_CPU はプロセス累積なので、1手ごとにソフト上限だけを「使用済み＋持ち時間」へ張り直す。
+    ハード上限は起動時に1回だけ hard（秒）を張り、以後は動かさない（特権なしでは上げられない）。
+    ソフト上限を越えれば SIGXCPU、ハード上限を越えればカーネルが SIGKILL する
+    """
+    try:
+        cur = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        if hard is not None and (cur == resource.RLIM_INFINITY or hard < cur):
+            cur = int(hard)
+        soft = int(math.ceil(_cpu_seconds() + float(cpu_time_sec)))
+        if cur != resource.RLIM_INFINITY:
+            soft = min(soft, cur)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, cur))
+    except Exception:
+        pass
+
+
+def _cpu_hard_limit(cpu_time_sec) -> int:
+    """
+    常駐ワーカーの累積 CPU のハード上限（秒）。WORKER_CPU_HARD で指定、
+    無ければ読み込み＋プールが入れ替えるまでの全手（WORKER_POOL_MAX_MOVES）ぶん
+    """
+    hard = os.environ.get("WORKER_CPU_HARD")
+    if hard:
+        return int(math.ceil(float(hard)))
+    moves = int(os.environ.get("WORKER_POOL_MAX_MOVES", "200"))
+    return int(math.ceil(float(cpu_time_sec) * (moves + 1)))
+
+
+def _cpu_seconds() -> float:
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _usage(t0: float, cpu0: float) -> dict:
+    """1手分の実測値：wall/CPU はミリ秒、peak RSS は KB（Linux の ru_maxrss）"""
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "wall_ms": round((time.perf_counter() - t0) * 1000, 3),
+        "cpu_ms": round((ru.ru_utime + ru.ru_stime - cpu0) * 1000, 3),
+        "max_rss_kb": ru.ru_maxrss,
+    }
+
+
+def serve(algo_path: str, framework_dir: str = None) -> int:
+    """
+    1つの提出を一度だけロードし、get_move 要求をフレーム単位で何度も処理する。
+    起動直後に {"ok": true, "load_ms": ...} か {"error": ...} を1フレーム返す
+    （その前にバイトコードキャッシュの cache_get / cache_put を1回ずつやり取りすることがある）。
+    各手の応答には "usage"（wall_ms / cpu_ms / max_rss_kb）を付ける。
+    要求に "context" があり、提出が get_move_ex を持っていればそちらを呼ぶ。
+    "session": true の要求では MyAI を最初の1回だけ作り、以降の手でも使い続ける。
+    framework_dir を渡すと framework.py をそこから読む（テナントごとの framework）。
+    """
+    # プロトコル用の fd を退避し、fd 0/1 は提出コードから切り離す
+    proto_in = os.dup(0)
+    proto_out = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
 
-    algo_path = sys.argv[1]
     algo_dir = str(pathlib.Path(algo_path).resolve().parent)
+    _restrict_sys_path(algo_dir, framework_dir)
+    _use_framework(algo_dir, framework_dir)
+
+    mem = os.environ.get("WORKER_MAX_MEM_MB", "1024")
+    cpu = os.environ.get("WORKER_CPU_TIME", "3")
+    set_limits(mem, None)
+    # CPU：ハード上限は常駐中の累積、ソフト上限は読み込み分（以降は1手ごとに張り直す）
+    hard = _cpu_hard_limit(cpu)
+    _arm_cpu_limit(cpu, hard)
+
+    t0 = time.perf_counter()
+    try:
+        m = load_module(algo_path, _ServerCodeCache(proto_in, proto_out))
+        _find_move_func(m, algo_path)  # 入口の有無だけ先に確認
+    except Exception as e:
+        traceback.print_exc()
+        write_frame(proto_out, {"error": str(e)})
+        return 1
+    load_ms = round((time.perf_counter() - t0) * 1000, 3)
+
+    _install_runtime_guards()
+    write_frame(proto_out, {"ok": True, "load_ms": load_ms})
+    session_funcs = None
+
+    while True:
+        req = read_frame(proto_in)
+        if req is None:
+            return 0
+        # 持ち時間制（clock_left あり）なら、この手の持ち時間を CPU 上限にする
+        ctx = req.get("context")
+        time_left = (ctx or {}).get("time_left")
+        clocked = (ctx or {}).get("clock_left") is not None
+        budget = time_left + 1 if clocked and time_left is not None else float(cpu)
+        _arm_cpu_limit(budget)
+        if not clocked and time_left is not None:
+            # 持ち時間なしでは壁時計のタイムアウトより CPU 上限が先に効くので、
+            # 提出に見せる time_left も実際に張った上限に揃える
+            ctx["time_left"] = min(float(time_left), float(cpu))
+        t0, cpu0 = time.perf_counter(), _cpu_seconds()
+        try:
+            if req.get("session"):
+                # セッション：MyAI を生かしたまま次の手でも使う
+                if session_funcs is None:
+                    session_funcs = _find_move_funcs(m, algo_path)
+                func, func_ex = session_funcs
+            else:
+                # 1手ごとに MyAI を作り直す（単発実行と同じ状態から始める）
+                func, func_ex = _find_move_funcs(m, algo_path)
+            if func_ex is not None and ctx is not None:
+                x, y = _call_quiet(func_ex, req["board"], _make_context(ctx))
+            else:
+                x, y = _call_quiet(func, req["board"])
+            reply = {"x": x, "y": y, "usage": _usage(t0, cpu0)}
+        except Exception as e:
+            traceback.print_exc()
+            reply = {"error": str(e), "usage": _usage(t0, cpu0)}
+        if hard - _cpu_seconds() < budget:
+            # 同じだけの手をもう1手まかなえない：プールに入れ替えてもらう
+            reply["retire"] = True
+        write_frame(proto_out, reply)
+
+
+# === zygote モード（fork サーバー） ===
+# 提出コードが使いがちな標準ライブラリは fork 前に読み込んでおく
+_PRELOAD = (
+    "framework",
+    "random",
+    "math",
+    "time",
+    "itertools",
+    "collections",
+    "functools",
+    "heapq",
+    "copy",
+    "typing",
+    "abc",
+    "dataclasses",
+)
+
+
+def zygote(sock_fd: int) -> int:
+    """
+    起動コストを払い済みの親プロセス。
+    {"algo_path": ..., "framework_dir": ...} と子の stdin/stdout 用 fd 2本を受け取るたびに fork し、
+    子は serve() に入る。親は子の pid を返す。
+    """
+    for name in _PRELOAD:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+    _base_sys_path()
+    # 子は自動回収（ゾンビにしない）
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    sock = socket.socket(fileno=sock_fd)
+    while True:
+        try:
+            data, fds, _, _ = socket.recv_fds(sock, 65536, 2)
+        except OSError:
+            return 1
+        if not data:
+            return 0
+        try:
+            req = json.loads(data.decode("utf-8"))
+            if len(fds) != 2:
+                raise ValueError("expected 2 fds")
+        except Exception as e:
+            for fd in fds:
+                os.close(fd)
+            sock.send(json.dumps({"error": str(e)}).encode("utf-8"))
+            continue
+
+        pid = os.fork()
+        if pid == 0:
+            # ---- 子 ----
+            code = 1
+            try:
+                sock.close()
+                os.setsid()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                os.dup2(fds[0], 0)
+                os.dup2(fds[1], 1)
+                for fd in fds:
+                    os.close(fd)
+                code = serve(req["algo_path"], req.get("framework_dir"))
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+
+        for fd in fds:
+            os.close(fd)
+        sock.send(json.dumps({"pid": pid}).encode("utf-8"))
 
-    # === sys.path をホワイトリスト化：提出フォルダ＋標準ライブラリ(+lib-dynload)+framework ===
-    paths = sysconfig.get_paths()
-    stdlib = paths.get("stdlib")
-    platstdlib = paths.get("platstdlib")
-    allow = [algo_dir]
 
-    for p in (stdlib, platstdlib):
-        if p and p not in allow:
-            allow.append(p)
-        if p:
-            dyn = os.path.join(p, "lib-dynload")
-            if os.path.isdir(dyn) and dyn not in allow:
-                allow.append(dyn)
+def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "--serve":
+        return serve(sys.argv[2], sys.argv[3] if len(sys.argv) >= 4 else None)
+    if len(sys.argv) >= 3 and sys.argv[1] == "--zygote":
+        return zygote(int(sys.argv[2]))
 
-    # ★ framework.py を置いたディレクトリを追加
-    allow.append("/home/ec2-user/project_3d_four_game/3d_four_game")
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "no algo_path"}))
+        return 2
 
-    sys.path[:] = allow
+    algo_path = sys.argv[1]
+    _restrict_sys_path(str(pathlib.Path(algo_path).resolve().parent))
 
     set_limits(
         os.environ.get("WORKER_MAX_MEM_MB", "1024"),
@@ -141,30 +538,14 @@ def main():
         m = load_module(algo_path)
 
         # --- get_move または MyAI を探す ---
-        func = None
-        if hasattr(m, "get_move") and callable(m.get_move):
-            func = m.get_move
-        elif hasattr(m, "MyAI"):
-            _ai = m.MyAI()
-            if hasattr(_ai, "get_move") and callable(_ai.get_move):
-                func = _ai.get_move
-
-        if func is None:
-            raise AttributeError(f"{algo_path} に get_move または MyAI が見つかりません")
+        func = _find_move_func(m, algo_path)
 
         # ランタイムガードを有効化
         _install_runtime_guards()
 
-        # ★ アルゴの print は stderr に流す（stdoutは最終JSONのみ）
-        buf = io.StringIO()
-        with contextlib.redirect_stdout(buf):
-            x, y = func(board)
-
-        logs = buf.getvalue()
-        if logs:
-            print(logs, file=sys.stderr, end="")
+        x, y = _call_quiet(func, board)
 
-        print(json.dumps({"x": int(x), "y": int(y)}))
+        print(json.dumps({"x": x, "y": y}))
         return 0
 
     except Exception as e: